@@ -1,4 +1,5 @@
 import os
+import asyncio
 import string
 import random
 import hmac
@@ -8,13 +9,19 @@ from datetime import datetime, timedelta, timezone
 import json
 import jwt
 import base64
-import requests
+import aiohttp
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException, status, Depends, Request
+from fastapi import FastAPI, HTTPException, status, Depends, Request, Response
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 
-from lib.database import get_dict_connection
+from lib.database import async_db_connection, open_async_pool, close_pools, pool_stats
+from lib import market_queries as queries
+from lib.riot_api import resolve_puuid
+from lib.response_cache import response_cache
+from lib.candles import candle_layout
+from lib.price_anchors import refresh_all_price_anchors
 from services.stock_tracker import PlayerStockTracker
 
 # --- Initial Setup ---
@@ -53,8 +60,13 @@ app.add_middleware(
 tracker = PlayerStockTracker(RIOT_API_KEY)
 @app.on_event("startup")
 async def startup_event():
+    await open_async_pool()
     await tracker.load_models_async()
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    await close_pools()
+
 # --- Helper Functions & Security ---
 def _generate_invite_code(length=8):
     return ''.join(random.choices(string.ascii_uppercase + string.digits, k=length))
@@ -149,11 +161,42 @@ async def verify_qstash_signature(request: Request):
     raise HTTPException(status_code=401, detail="Invalid signature")
 
 
+async def _cached_response(request: Request, market_id: int, build):
+    """
+    Serves a market read endpoint from response_cache. build() runs only on a miss;
+    clients that send back the ETag they hold get an empty 304 while it is current.
+    """
+    key = f"{request.url.path}?{request.url.query}"
+    if_none_match = request.headers.get("if-none-match")
+    cached = response_cache.get(market_id, key, if_none_match)
+    if cached:
+        etag, body = cached
+    else:
+        version = response_cache.version(market_id)
+        etag, body = response_cache.put(market_id, key, version, jsonable_encoder(await build()))
+        if if_none_match and etag in (tag.strip() for tag in if_none_match.split(",")):
+            body = None
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if body is None:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
 # --- NEW: Health Check Endpoint for Render ---
 @app.get("/")
 async def health_check():
     return {"status": "ok"}
 
+@app.get("/api/health/db", include_in_schema=False)
+async def db_pool_health():
+    """Connection pool counters (size, waits, timeouts, evictions) for both pools."""
+    return pool_stats()
+
+@app.get("/api/health/cache", include_in_schema=False)
+async def response_cache_health():
+    """Hit ratio, 304s, invalidations and size of the market read-endpoint cache."""
+    return response_cache.get_stats()
+
 # --- QStash Task Endpoint (Internal) ---
 @app.post("/api/tasks/update-market", status_code=status.HTTP_202_ACCEPTED, include_in_schema=False)
 async def task_update_market(request: Request, _=Depends(verify_qstash_signature)):
@@ -181,25 +224,32 @@ async def task_update_market(request: Request, _=Depends(verify_qstash_signature
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/tasks/refresh-price-anchors", include_in_schema=False)
+async def task_refresh_price_anchors(_=Depends(verify_qstash_signature)):
+    """
+    Optional catch-up (python -m lib.price_anchors refresh does the same): stores every
+    market's 24h/7d anchors that went stale as time passed. The stocks endpoint looks up a
+    due anchor itself, so this only saves it that lookup for markets without new games.
+    """
+    markets = await asyncio.to_thread(refresh_all_price_anchors)
+    # Cached stocks responses of those markets in this process are now stale
+    for market_id in markets:
+        response_cache.bump(market_id)
+    return {"status": "success", "markets": len(markets)}
+
 # --- User-Facing API Endpoints ---
 @app.post("/api/markets/{market_id}/refresh")
 async def refresh_market(market_id: int):
     # --- Cooldown logic ---
-    conn = get_dict_connection()
-    try:
-        with conn.cursor() as c:
-            c.execute("SELECT last_refreshed_at, tier FROM markets WHERE id = %s", (market_id,))
-            market = c.fetchone()
-            if not market: raise HTTPException(status_code=404, detail="Market not found")
-            
-            cooldown_minutes = 5 if market['tier'] in ['premium', 'pro'] else 10
-            if market['last_refreshed_at'] and (datetime.now(timezone.utc) - market['last_refreshed_at'] < timedelta(minutes=cooldown_minutes)):
-                raise HTTPException(status_code=429, detail="This market was refreshed recently.")
-
-            c.execute("UPDATE markets SET last_refreshed_at = %s WHERE id = %s", (datetime.now(timezone.utc), market_id))
-            conn.commit()
-    finally:
-        if conn: conn.close()
+    async with async_db_connection() as conn:
+        market = await queries.get_market_refresh_state(conn, market_id)
+        if not market: raise HTTPException(status_code=404, detail="Market not found")
+
+        cooldown_minutes = 5 if market['tier'] in ['premium', 'pro'] else 10
+        if market['last_refreshed_at'] and (datetime.now(timezone.utc) - market['last_refreshed_at'] < timedelta(minutes=cooldown_minutes)):
+            raise HTTPException(status_code=429, detail="This market was refreshed recently.")
+
+        await queries.touch_market_refreshed(conn, market_id, datetime.now(timezone.utc))
     
     # --- Dispatch job to QStash ---
     destination_url = f"{APP_BASE_URL}/api/tasks/update-market"
@@ -217,12 +267,13 @@ async def refresh_market(market_id: int):
 
     try:
         print(f"Dispatching task to QStash publish URL: {publish_url}")
-        response = requests.post(publish_url, headers=headers, json=payload)
-        response.raise_for_status()
-    except requests.exceptions.RequestException as e:
+        async with aiohttp.ClientSession() as session:
+            async with session.post(publish_url, headers=headers, json=payload) as response:
+                if response.status >= 400:
+                    print(f"!!! QStash Response Body: {await response.text()}")
+                response.raise_for_status()
+    except aiohttp.ClientError as e:
         print(f"!!! ERROR dispatching task to QStash: {e}")
-        if e.response is not None:
-            print(f"!!! QStash Response Body: {e.response.text}")
         raise HTTPException(status_code=500, detail="Failed to schedule background task.")
 
     print(f"Successfully dispatched update task for market {market_id} to QStash.")
@@ -263,17 +314,10 @@ class MarketMember(BaseModel):
 
 @app.post("/api/markets/create", status_code=status.HTTP_201_CREATED)
 async def create_market(market_data: MarketCreate):
-    conn = get_dict_connection()
     try:
-        with conn.cursor() as c:
-         # --- NEW TIER VALIDATION LOGIC (SAME AS JOIN) ---
-            c.execute("""
-                SELECT 
-                    p.subscription_tier, 
-                    (SELECT COUNT(*) FROM market_members WHERE user_id = p.id) as market_count
-                FROM profiles p WHERE id = %s
-            """, (market_data.creator_id,))
-            user_profile = c.fetchone()
+        async with async_db_connection() as conn:
+            # --- NEW TIER VALIDATION LOGIC (SAME AS JOIN) ---
+            user_profile = await queries.get_user_tier_and_market_count(conn, market_data.creator_id)
             user_tier = user_profile['subscription_tier'] if user_profile else 'free'
             market_count = user_profile['market_count'] if user_profile else 0
 
@@ -285,49 +329,31 @@ async def create_market(market_data: MarketCreate):
 
             invite_code = _generate_invite_code()
             # Ensure code is unique
-            c.execute("SELECT 1 FROM markets WHERE invite_code = %s", (invite_code,))
-            while c.fetchone():
+            while await queries.invite_code_exists(conn, invite_code):
                 invite_code = _generate_invite_code()
-                c.execute("SELECT 1 FROM markets WHERE invite_code = %s", (invite_code,))
 
-            # Create the market
-            c.execute("INSERT INTO markets (name, creator_id, invite_code) VALUES (%s, %s, %s) RETURNING id",
-                      (market_data.name, market_data.creator_id, invite_code))
-            market_id = c.fetchone()['id']
-            
-            # Add the creator as a member
-            c.execute("INSERT INTO market_members (market_id, user_id) VALUES (%s, %s)",
-                      (market_id, market_data.creator_id))
-            
-            conn.commit()
-            return {"status": "success", "market_id": market_id, "invite_code": invite_code}
+            # Create the market and add the creator as a member
+            market_id = await queries.insert_market(conn, market_data.name, market_data.creator_id, invite_code)
+            await queries.add_market_member(conn, market_id, market_data.creator_id)
+
+        return {"status": "success", "market_id": market_id, "invite_code": invite_code}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        conn.close()
 
 
 @app.post("/api/markets/join", status_code=status.HTTP_200_OK)
 async def join_market(join_data: MarketJoin):
-    conn = get_dict_connection()
     try:
-        with conn.cursor() as c:
+        async with async_db_connection() as conn:
             # Find the market by invite code
-            c.execute("SELECT id, player_limit FROM markets WHERE invite_code = %s", (join_data.invite_code,))
-            market = c.fetchone()
+            market = await queries.get_market_by_invite_code(conn, join_data.invite_code)
             if not market:
                 raise HTTPException(status_code=404, detail="Invalid invite code.")
             market_id = market['id']
 
             # --- NEW TIER VALIDATION LOGIC ---
             # 1. Get the user's current tier and market count
-            c.execute("""
-                SELECT 
-                    p.subscription_tier, 
-                    (SELECT COUNT(*) FROM market_members WHERE user_id = p.id) as market_count
-                FROM profiles p WHERE id = %s
-            """, (join_data.user_id,))
-            user_profile = c.fetchone()
+            user_profile = await queries.get_user_tier_and_market_count(conn, join_data.user_id)
             user_tier = user_profile['subscription_tier'] if user_profile else 'free'
             market_count = user_profile['market_count'] if user_profile else 0
 
@@ -340,44 +366,46 @@ async def join_market(join_data: MarketJoin):
                 raise HTTPException(status_code=403, detail=f"Your '{user_tier}' plan only allows you to join {limit} market(s). Upgrade to Pro to join more.")
             
             # Check if user is already a member
-            c.execute("SELECT 1 FROM market_members WHERE market_id = %s AND user_id = %s", (market_id, join_data.user_id))
-            if c.fetchone():
+            if await queries.is_market_member(conn, market_id, join_data.user_id):
                 return {"status": "success", "message": "Already a member.", "market_id": market_id}
 
             # Check if market is full
-            c.execute("SELECT COUNT(*) as member_count FROM market_members WHERE market_id = %s", (market_id,))
-            member_count = c.fetchone()['member_count']
+            member_count = await queries.count_market_members(conn, market_id)
             if member_count >= market['player_limit']:
                 raise HTTPException(status_code=403, detail="This market is full.")
 
-
             # Add user to the market
-            c.execute("INSERT INTO market_members (market_id, user_id) VALUES (%s, %s)", (market_id, join_data.user_id))
-            conn.commit()
-            return {"status": "success", "message": "Successfully joined market.", "market_id": market_id}
+            await queries.add_market_member(conn, market_id, join_data.user_id)
+
+        return {"status": "success", "message": "Successfully joined market.", "market_id": market_id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        conn.close()
 
 
+async def _resolve_puuid_for_listing(player_tag):
+    """Best-effort PUUID lookup; on failure the tracker resolves it on the next refresh."""
+    try:
+        async with aiohttp.ClientSession() as session:
+            return await resolve_puuid(session, player_tag, {"X-Riot-Token": RIOT_API_KEY})
+    except Exception as e:
+        print(f"Could not resolve PUUID for {player_tag} at listing time: {e}")
+        return None
+
 @app.post("/api/markets/{market_id}/players", status_code=status.HTTP_201_CREATED)
 async def add_player_to_market(market_id: int, player_data: PlayerAdd):
-    conn = get_dict_connection()
+    # Resolved before borrowing a connection so no pooled connection waits on Riot
+    puuid = await _resolve_puuid_for_listing(player_data.player_tag)
     try:
-        with conn.cursor() as c:
+        async with async_db_connection() as conn:
             # 1. Get the tier of the USER making the request.
-            c.execute("SELECT subscription_tier FROM profiles WHERE id = %s", (player_data.user_id,))
-            user_profile = c.fetchone()
-            user_tier = user_profile['subscription_tier'] if user_profile else 'free'
+            user_tier = await queries.get_user_tier(conn, player_data.user_id)
             
             # 2. Define tier limits
             tier_limits = {'free': 1, 'premium': 1, 'pro': 3} # Pro tier can add a player to 3 markets
             limit = tier_limits.get(user_tier, 1)
 
             # 3. Check how many times this player has been listed across ALL markets
-            c.execute("SELECT COUNT(*) FROM market_players WHERE player_tag = %s", (player_data.player_tag,))
-            current_count = c.fetchone()['count']
+            current_count = await queries.count_player_listings(conn, player_data.player_tag)
             
             if current_count >= limit:
                 raise HTTPException(
@@ -385,58 +413,29 @@ async def add_player_to_market(market_id: int, player_data: PlayerAdd):
                     detail=f"This player is in the max number of markets ({limit}) allowed by your subscription tier."
                 )
 
-            # 4. Add the player and record WHO added them
-            c.execute(
-                "INSERT INTO market_players (market_id, player_tag, listed_by_user_id) VALUES (%s, %s, %s) RETURNING id",
-                (market_id, player_data.player_tag, player_data.user_id)
-            )
-            market_player_id = c.fetchone()['id']  # <-- THE FIX: Use correct variable name
-
-            c.execute(
-                "INSERT INTO player_champions (market_player_id, champion_name) VALUES (%s, %s)",
-                (market_player_id, player_data.initial_champion)
-            )
+            # 4. Add the player and record WHO added them, plus their PUUID so refreshes skip account-v1
+            market_player_id = await queries.insert_market_player(conn, market_id, player_data.player_tag, player_data.user_id, puuid)
+            await queries.add_player_champion(conn, market_player_id, player_data.initial_champion)
 
             # Step 3: Create the initial "IPO" price entry in the stock_values table
-            c.execute("""
-                INSERT INTO stock_values 
-                    (market_id, market_player_id, player_tag, stock_value, model_score, champion_played) 
-                VALUES (%s, %s, %s, %s, %s, %s)
-            """, 
-            (market_id, market_player_id, player_data.player_tag, 10.0, 5.0, player_data.initial_champion))
-            
-            conn.commit()
-            return {"status": "success", "player_id": market_player_id}
+            await queries.insert_ipo_price(conn, market_id, market_player_id, player_data.player_tag, player_data.initial_champion)
+
+        # Bumped after the commit, so no reader can cache the pre-insert state again
+        response_cache.bump(market_id)
+        return {"status": "success", "player_id": market_player_id}
 
-            
     except Exception as e:
-        if conn: conn.rollback()
         if 'duplicate key value violates unique constraint' in str(e).lower():
              raise HTTPException(status_code=409, detail="This player is already in the market.")
         print(f"!!! ERROR in add_player_to_market: {e}") # Added logging
         raise HTTPException(status_code=500, detail="An internal server error occurred.")
-    finally:
-        if conn:
-            conn.close()
 
 
 @app.get("/api/markets/{market_id}/members", response_model=list[MarketMember])
 async def get_market_members(market_id: int):
     """Gets a list of all members (users) in a specific market."""
-    conn = get_dict_connection()
-    try:
-        with conn.cursor() as c:
-            # We join market_members with profiles to get the username
-            c.execute("""
-                SELECT p.id, p.username
-                FROM profiles p
-                JOIN market_members mm ON p.id = mm.user_id
-                WHERE mm.market_id = %s
-            """, (market_id,))
-            members = c.fetchall()
-            return members
-    finally:
-        if conn: conn.close()
+    async with async_db_connection() as conn:
+        return await queries.fetch_market_members(conn, market_id)
 
 
 
@@ -445,17 +444,15 @@ async def kick_user_from_market(market_id: int, kick_data: KickUser):
     """
     Removes a member from a market. This action can only be performed by the market's creator.
     """
-    conn = get_dict_connection()
     try:
-        with conn.cursor() as c:
+        async with async_db_connection() as conn:
             # --- SECURITY CHECK: Verify the requester is the creator ---
-            c.execute("SELECT creator_id FROM markets WHERE id = %s", (market_id,))
-            market = c.fetchone()
+            creator_id = await queries.get_market_creator(conn, market_id)
 
-            if not market:
+            if creator_id is None:
                 raise HTTPException(status_code=404, detail="Market not found.")
 
-            if market['creator_id'] != kick_data.creator_id:
+            if creator_id != kick_data.creator_id:
                 raise HTTPException(status_code=403, detail="Only the market creator can remove members.")
 
             # Prevent the creator from kicking themselves
@@ -463,38 +460,24 @@ async def kick_user_from_market(market_id: int, kick_data: KickUser):
                 raise HTTPException(status_code=400, detail="The creator cannot be kicked from their own market.")
 
             # If checks pass, proceed with deletion
-            c.execute("DELETE FROM market_members WHERE market_id = %s AND user_id = %s", (market_id, kick_data.user_to_kick_id))
-            conn.commit()
+            await queries.remove_market_member(conn, market_id, kick_data.user_to_kick_id)
 
-            print(f"Creator {kick_data.creator_id} successfully kicked user {kick_data.user_to_kick_id} from market {market_id}.")
-            return
+        print(f"Creator {kick_data.creator_id} successfully kicked user {kick_data.user_to_kick_id} from market {market_id}.")
+        return
 
     except Exception as e:
-        if conn: conn.rollback()
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        if conn: conn.close()
 
 
 
 @app.post("/api/markets/players/{player_id}/champions", status_code=status.HTTP_201_CREATED)
 async def add_champion_to_player(player_id: int, champion_data: ChampionAdd):
     """Adds a new champion to a player's allowed pool, respecting tier limits."""
-    conn = get_dict_connection()
     try:
-        with conn.cursor() as c:
+        async with async_db_connection() as conn:
             # --- TIER VALIDATION LOGIC ---
             # 1. Get the market's tier and champion limit from the player_id
-            c.execute("""
-                SELECT 
-                    m.champions_per_player_limit,
-                    (SELECT COUNT(*) FROM player_champions WHERE market_player_id = %s) as current_champion_count
-                FROM market_players mp
-                JOIN markets m ON mp.market_id = m.id
-                WHERE mp.id = %s
-            """, (player_id, player_id))
-            
-            market_rules = c.fetchone()
+            market_rules = await queries.get_champion_limit(conn, player_id)
             if not market_rules:
                 raise HTTPException(status_code=404, detail="Player or market not found.")
 
@@ -505,324 +488,204 @@ async def add_champion_to_player(player_id: int, champion_data: ChampionAdd):
             # --- END VALIDATION ---
             
             # If validation passes, insert the new champion
-            c.execute("INSERT INTO player_champions (market_player_id, champion_name) VALUES (%s, %s)",
-                      (player_id, champion_data.champion_name))
-            conn.commit()
-            return {"status": "success", "message": f"{champion_data.champion_name} added to pool."}
+            await queries.add_player_champion(conn, player_id, champion_data.champion_name)
+            market_id = await queries.get_player_market_id(conn, player_id)
+
+        response_cache.bump(market_id)
+        return {"status": "success", "message": f"{champion_data.champion_name} added to pool."}
     except Exception as e:
-        if conn: conn.rollback()
         # Handle cases where the champion is already in the pool
         if 'duplicate key value violates unique constraint' in str(e).lower():
             raise HTTPException(status_code=409, detail="This champion is already in the player's pool.")
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        if conn: conn.close()
 
 @app.delete("/api/markets/players/{player_id}/champions/{champion_name}", status_code=status.HTTP_204_NO_CONTENT)
 async def remove_champion_from_player(player_id: int, champion_name: str):
     """Removes a champion from a player's allowed pool."""
     # TODO: Add security check to ensure the user making the request is the market creator
-    conn = get_dict_connection()
-    try:
-        with conn.cursor() as c:
-            # A player must always have at least one champion
-            c.execute("SELECT COUNT(*) FROM player_champions WHERE market_player_id = %s", (player_id,))
-            count = c.fetchone()['count']
-            if count <= 1:
-                raise HTTPException(status_code=400, detail="Cannot remove the last champion from a player's pool.")
-
-            c.execute("DELETE FROM player_champions WHERE market_player_id = %s AND champion_name = %s",
-                      (player_id, champion_name))
-            conn.commit()
-            return
-    finally:
-        if conn: conn.close()
+    async with async_db_connection() as conn:
+        # A player must always have at least one champion
+        count = await queries.count_player_champions(conn, player_id)
+        if count <= 1:
+            raise HTTPException(status_code=400, detail="Cannot remove the last champion from a player's pool.")
+
+        await queries.delete_player_champion(conn, player_id, champion_name)
+        market_id = await queries.get_player_market_id(conn, player_id)
+    response_cache.bump(market_id)
+    return
 
 @app.delete("/api/markets/{market_id}/members/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def leave_market(market_id: int, user_id: str):
     """Allows a user to leave a market they are a member of."""
-    conn = get_dict_connection()
     try:
-        with conn.cursor() as c:
+        async with async_db_connection() as conn:
             # Check if the user is the creator. For now, we might prevent creators from leaving.
             # A better long-term solution would be to force them to transfer ownership.
-            c.execute("SELECT creator_id FROM markets WHERE id = %s", (market_id,))
-            market = c.fetchone()
-            if market and market['creator_id'] == user_id:
+            creator_id = await queries.get_market_creator(conn, market_id)
+            if creator_id == user_id:
                 raise HTTPException(status_code=403, detail="Market creators cannot leave their own market. Please delete it instead.")
 
-            # Delete the user's membership record.
-            # The 'RETURNING *' part is a good way to check if a row was actually deleted.
-            c.execute("DELETE FROM market_members WHERE market_id = %s AND user_id = %s RETURNING *", (market_id, user_id))
-            if c.fetchone() is None:
-                # This means the user wasn't a member in the first place, which is fine.
-                pass
-            
-            conn.commit()
-            return
+            # Delete the user's membership record. If the user wasn't a member
+            # in the first place that's fine, the end result is the same.
+            await queries.remove_market_member(conn, market_id, user_id)
+        return
     except Exception as e:
-        if conn: conn.rollback()
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        if conn: conn.close()
 
 @app.delete("/api/markets/{market_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_market(market_id: int, delete_data: MarketDelete):
     """
     Deletes an entire market. This action can only be performed by the market's creator.
     """
-    conn = get_dict_connection()
     try:
-        with conn.cursor() as c:
+        async with async_db_connection() as conn:
             # --- SECURITY CHECK: Verify the user is the creator ---
-            c.execute("SELECT creator_id FROM markets WHERE id = %s", (market_id,))
-            market = c.fetchone()
+            creator_id = await queries.get_market_creator(conn, market_id)
 
-            if not market:
+            if creator_id is None:
                 # Market doesn't exist, which is fine. The end result is the same.
                 return 
 
-            if market['creator_id'] != delete_data.user_id:
+            if creator_id != delete_data.user_id:
                 # If the user is not the creator, forbid the action.
                 raise HTTPException(status_code=403, detail="Only the market creator can delete this market.")
             
             # If the check passes, proceed with deletion.
             # The database's ON DELETE CASCADE rules will handle the rest.
-            c.execute("DELETE FROM markets WHERE id = %s", (market_id,))
-            conn.commit()
-            
-            print(f"User {delete_data.user_id} successfully deleted market {market_id}.")
-            return
+            await queries.delete_market(conn, market_id)
+
+        response_cache.bump(market_id)
+        print(f"User {delete_data.user_id} successfully deleted market {market_id}.")
+        return
 
     except Exception as e:
-        if conn: conn.rollback()
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        if conn: conn.close()
 
 # --- NEW: Market-aware read-only endpoints ---
 @app.get("/api/markets/{market_id}/stocks")
-async def get_market_stocks(market_id: int):
+async def get_market_stocks(market_id: int, request: Request):
     """
     Gets all PLAYERS for a market, including their champion pool, 
     current price, and historical changes.
     """
-    conn = get_dict_connection()
-    try:
-        with conn.cursor() as c:
-            now = datetime.now(timezone.utc)
-            day_ago = now - timedelta(days=1)
-            week_ago = now - timedelta(days=7)
-            
-            # This complex query gets all the data we need in one go.
-            c.execute("""
-                WITH player_champion_list AS (
-                    -- First, get every player in the market and their full champion pool
-                    SELECT mp.id, mp.player_tag, array_agg(pc.champion_name) as champions
-                    FROM market_players mp
-                    JOIN player_champions pc ON mp.id = pc.market_player_id
-                    WHERE mp.market_id = %(market_id)s
-                    GROUP BY mp.id, mp.player_tag
-                ),
-                latest_prices AS (
-                    -- Then, find the single most recent price for each player
-                    SELECT DISTINCT ON (market_player_id)
-                        market_player_id, stock_value, timestamp
-                    FROM stock_values
-                    WHERE market_id = %(market_id)s
-                    ORDER BY market_player_id, timestamp DESC
-                ),
-                prices_24h_ago AS (
-                    -- Find the latest price from before 24 hours ago
-                    SELECT DISTINCT ON (market_player_id)
-                        market_player_id, stock_value
-                    FROM stock_values
-                    WHERE market_id = %(market_id)s AND timestamp <= %(day_ago)s
-                    ORDER BY market_player_id, timestamp DESC
-                ),
-                prices_7d_ago AS (
-                    -- Find the latest price from before 7 days ago
-                    SELECT DISTINCT ON (market_player_id)
-                        market_player_id, stock_value
-                    FROM stock_values
-                    WHERE market_id = %(market_id)s AND timestamp <= %(week_ago)s
-                    ORDER BY market_player_id, timestamp DESC
-                )
-                SELECT
-                    pcl.player_tag,
-                    pcl.champions,
-                    lp.stock_value AS current_price,
-                    lp.timestamp AS last_update,
-                    -- Safely calculate price changes, defaulting to 0 if no historical data exists
-                    lp.stock_value - COALESCE(p24h.stock_value, lp.stock_value) AS price_change_24h,
-                    (lp.stock_value - COALESCE(p24h.stock_value, lp.stock_value)) / NULLIF(COALESCE(p24h.stock_value, lp.stock_value), 0) * 100 AS price_change_percent_24h,
-                    lp.stock_value - COALESCE(p7d.stock_value, lp.stock_value) AS price_change_7d,
-                    (lp.stock_value - COALESCE(p7d.stock_value, lp.stock_value)) / NULLIF(COALESCE(p7d.stock_value, lp.stock_value), 0) * 100 AS price_change_percent_7d
-                FROM player_champion_list pcl
-                -- Use LEFT JOINs to ensure players appear even if they only have an IPO price
-                LEFT JOIN latest_prices lp ON pcl.id = lp.market_player_id
-                LEFT JOIN prices_24h_ago p24h ON pcl.id = p24h.market_player_id
-                LEFT JOIN prices_7d_ago p7d ON pcl.id = p7d.market_player_id;
-            """, {'market_id': market_id, 'day_ago': day_ago, 'week_ago': week_ago})
-            
-            stocks = c.fetchall()
-            # Handle nulls from the LEFT JOIN for brand new stocks
-            for stock in stocks:
-                if stock['current_price'] is None: stock['current_price'] = 10.0
-                if stock['price_change_24h'] is None: stock['price_change_24h'] = 0
-                if stock['price_change_percent_24h'] is None: stock['price_change_percent_24h'] = 0
-                if stock['price_change_7d'] is None: stock['price_change_7d'] = 0
-                if stock['price_change_percent_7d'] is None: stock['price_change_percent_7d'] = 0
+    return await _cached_response(request, market_id, lambda: _load_market_stocks(market_id))
+
+async def _load_market_stocks(market_id):
+    # Read-only: prices and 24h/7d anchors come from the market_player_latest summary, which
+    # the writers keep current; an anchor that came due since is looked up (lib.price_anchors)
+    async with async_db_connection() as conn:
+        stocks = await queries.fetch_market_stocks(conn, market_id)
+
+    # Handle nulls from the LEFT JOIN for brand new stocks
+    for stock in stocks:
+        if stock['current_price'] is None: stock['current_price'] = 10.0
+        if stock['price_change_24h'] is None: stock['price_change_24h'] = 0
+        if stock['price_change_percent_24h'] is None: stock['price_change_percent_24h'] = 0
+        if stock['price_change_7d'] is None: stock['price_change_7d'] = 0
+        if stock['price_change_percent_7d'] is None: stock['price_change_percent_7d'] = 0
 
-            return stocks
-    finally:
-        if conn: conn.close()
+    return stocks
 
 
 @app.get("/api/markets/{market_id}/stocks/{player_tag}/history")
-async def get_stock_history(market_id: int, player_tag: str, period: str = "1w"):
+async def get_stock_history(market_id: int, player_tag: str, request: Request, period: str = "1w"):
     """Gets stock price history for a specific player within a market."""
-    conn = get_dict_connection()
-    try:
-        now = datetime.now()
-        if period == "1d": start_date = now - timedelta(days=1)
-        elif period == "1w": start_date = now - timedelta(days=7)
-        elif period == "1m": start_date = now - timedelta(days=30)
-        elif period == "ytd": start_date = datetime(now.year, 1, 1)
-        else: start_date = datetime(2000, 1, 1)
-        
-        with conn.cursor() as c:
-            c.execute("""
-                SELECT stock_value, timestamp, champion_played
-                FROM stock_values
-                WHERE market_id = %s AND player_tag = %s AND timestamp >= %s
-                ORDER BY timestamp ASC
-            """, (market_id, player_tag, start_date))
-            return c.fetchall()
-    finally:
-        conn.close()
+    now = datetime.now()
+    if period == "1d": start_date = now - timedelta(days=1)
+    elif period == "1w": start_date = now - timedelta(days=7)
+    elif period == "1m": start_date = now - timedelta(days=30)
+    elif period == "ytd": start_date = datetime(now.year, 1, 1)
+    else: start_date = datetime(2000, 1, 1)
+
+    async def load():
+        async with async_db_connection() as conn:
+            return await queries.fetch_stock_history(conn, market_id, player_tag, start_date)
+    return await _cached_response(request, market_id, load)
+
+@app.get("/api/markets/{market_id}/stocks/{player_tag}/candles")
+async def get_stock_candles(market_id: int, player_tag: str, request: Request, period: str = "1w"):
+    """
+    OHLC candles of a player's price for a chart. The bucket width follows the period
+    (15m for a day, 1h for a week, days beyond that), so at most MAX_CANDLES come back
+    however long the player's history is.
+    """
+    now = datetime.now(timezone.utc)
+    if period == "1d": start_date = now - timedelta(days=1)
+    elif period == "1w": start_date = now - timedelta(days=7)
+    elif period == "1m": start_date = now - timedelta(days=30)
+    elif period == "ytd": start_date = datetime(now.year, 1, 1, tzinfo=timezone.utc)
+    else: start_date = None
+
+    async def load():
+        async with async_db_connection() as conn:
+            start = start_date or await queries.fetch_first_candle_at(conn, market_id, player_tag) or now
+            resolution, width = candle_layout(start, now)
+            candles = await queries.fetch_candles(conn, market_id, player_tag, resolution, width, start)
+        return {"resolution": resolution, "bucket_seconds": int(width.total_seconds()), "candles": candles}
+    return await _cached_response(request, market_id, load)
 
 @app.get("/api/markets/{market_id}/performers")
-async def get_top_performers(market_id: int, period: str = "1m"):
+async def get_top_performers(market_id: int, request: Request, period: str = "1m"):
     """Gets top and bottom performers for a specific market over a variable period."""
-    conn = get_dict_connection()
-    try:
-        now = datetime.now(timezone.utc)
-        if period == "1d": start_date = now - timedelta(days=1)
-        elif period == "1w": start_date = now - timedelta(days=7)
-        elif period == "ytd": start_date = datetime(now.year, 1, 1, tzinfo=timezone.utc)
-        else: start_date = now - timedelta(days=30) # Default to 1 month
-
-        with conn.cursor() as c:
-            # Updated query for player-based stocks
-            c.execute("""
-                WITH player_list AS (
-                    SELECT DISTINCT player_tag FROM stock_values WHERE market_id = %(market_id)s
-                ),
-                latest_prices AS (
-                    SELECT DISTINCT ON (player_tag)
-                        player_tag, stock_value
-                    FROM stock_values
-                    WHERE market_id = %(market_id)s
-                    ORDER BY player_tag, timestamp DESC
-                ),
-                historical_prices AS (
-                    SELECT DISTINCT ON (player_tag)
-                        player_tag, stock_value
-                    FROM stock_values
-                    WHERE market_id = %(market_id)s AND timestamp >= %(start_date)s
-                    ORDER BY player_tag, timestamp ASC
-                )
-                SELECT
-                    pl.player_tag,
-                    lp.stock_value as current_price,
-                    (lp.stock_value - hp.stock_value) / hp.stock_value * 100 AS price_change_percent
-                FROM player_list pl
-                JOIN latest_prices lp ON pl.player_tag = lp.player_tag
-                JOIN historical_prices hp ON pl.player_tag = hp.player_tag
-                WHERE hp.stock_value > 0;
-            """, {'market_id': market_id, 'start_date': start_date})
-
-            performers = c.fetchall()
-
-        if not performers:
-            return {"top_performers": [], "bottom_performers": []}
-
-        performers.sort(key=lambda x: x['price_change_percent'], reverse=True)
-        
-        # Handle cases with few performers
-        if len(performers) < 5:
-             return {"top_performers": performers, "bottom_performers": []}
+    return await _cached_response(request, market_id, lambda: _load_top_performers(market_id, period))
+
+async def _load_top_performers(market_id, period):
+    now = datetime.now(timezone.utc)
+    if period == "1d": start_date = now - timedelta(days=1)
+    elif period == "1w": start_date = now - timedelta(days=7)
+    elif period == "ytd": start_date = datetime(now.year, 1, 1, tzinfo=timezone.utc)
+    else: start_date = now - timedelta(days=30) # Default to 1 month
 
-        return {
-            "top_performers": performers[:5],
-            "bottom_performers": performers[-5:]
-        }
-    finally:
-        conn.close()
+    async with async_db_connection() as conn:
+        performers = await queries.fetch_price_changes(conn, market_id, start_date)
+
+    if not performers:
+        return {"top_performers": [], "bottom_performers": []}
+
+    performers.sort(key=lambda x: x['price_change_percent'], reverse=True)
+    
+    # Handle cases with few performers
+    if len(performers) < 5:
+         return {"top_performers": performers, "bottom_performers": []}
+
+    return {
+        "top_performers": performers[:5],
+        "bottom_performers": performers[-5:]
+    }
 
 @app.get("/api/markets/{market_id}/stocks/{player_tag}/scores")
-async def get_player_scores(market_id: int, player_tag: str, limit: int = 5):
+async def get_player_scores(market_id: int, player_tag: str, request: Request, limit: int = 5):
     """Gets the most recent game scores for a specific player within a market."""
-    conn = get_dict_connection()
-    try:
-        with conn.cursor() as c:
-            c.execute("""
-                SELECT sv1.model_score, sv1.timestamp, sv1.game_id, sv1.stock_value, sv1.champion_played,
-                       (SELECT sv2.stock_value FROM stock_values sv2 
-                        WHERE sv2.market_id = sv1.market_id AND sv2.player_tag = sv1.player_tag 
-                        AND sv2.timestamp < sv1.timestamp 
-                        ORDER BY sv2.timestamp DESC LIMIT 1) as previous_stock_value
-                FROM stock_values sv1
-                WHERE sv1.market_id = %s AND sv1.player_tag = %s AND sv1.model_score IS NOT NULL
-                ORDER BY sv1.timestamp DESC
-                LIMIT %s
-            """, (market_id, player_tag, limit))
-            return c.fetchall()
-    finally:
-        conn.close()
+    async def load():
+        async with async_db_connection() as conn:
+            return await queries.fetch_player_scores(conn, market_id, player_tag, limit)
+    return await _cached_response(request, market_id, load)
+
+@app.get("/api/markets/{market_id}/scores")
+async def get_market_scores(market_id: int, request: Request, limit: int = 5):
+    """Gets the most recent game scores of every player in a market, keyed by player tag."""
+    async def load():
+        async with async_db_connection() as conn:
+            return await queries.fetch_market_scores(conn, market_id, limit)
+    return await _cached_response(request, market_id, load)
 
 @app.get("/api/users/{user_id}/markets")
 async def get_user_markets(user_id: str):
     """Gets a list of all markets a specific user is a member of."""
     print(f"--- Backend received request for markets for user: {user_id} ---")
     
-    conn = None  # Ensure conn is defined in the outer scope
     try:
-        conn = get_dict_connection()
-        if conn is None:
-            print("!!! FATAL: Could not get database connection. !!!")
-            raise HTTPException(status_code=500, detail="Database connection could not be established.")
-
-        with conn.cursor() as c:
+        async with async_db_connection() as conn:
             print("[DB] Executing query to find markets...")
-            c.execute("""
-                SELECT 
-                    m.id, 
-                    m.name, 
-                    m.creator_id,
-                    CASE WHEN m.creator_id = %s THEN m.invite_code ELSE NULL END as invite_code,
-                    (SELECT COUNT(*) FROM market_members WHERE market_id = m.id) as member_count
-                FROM markets m
-                JOIN market_members mm ON m.id = mm.market_id
-                WHERE mm.user_id = %s
-            """, (user_id, user_id))
-            markets = c.fetchall()
-            # This is correct. If the user is in no markets, fetchall() will return an empty list: []
+            markets = await queries.fetch_user_markets(conn, user_id)
+            # This is correct. If the user is in no markets, this will be an empty list: []
             print(f"[DB] Query finished. Found {len(markets)} markets.")
             return markets
 
     except Exception as e:
         print(f"!!! ERROR in get_user_markets: {e}")
-        # This will catch any errors, including connection errors, and report them.
+        # This will catch any errors, including connection errors (pool timeouts too), and report them.
         raise HTTPException(status_code=500, detail="An internal server error occurred while fetching markets.")
-    
-    finally:
-        # This block GUARANTEES that the connection is closed,
-        # which is the most critical part for preventing deadlocks.
-        if conn:
-            conn.close()
-            print("--- Backend request finished, connection closed. ---")
 
 
 class PlayerInMarket(BaseModel):
@@ -841,58 +704,35 @@ class MarketDetails(BaseModel):
     players: list[PlayerInMarket]
 
 @app.get("/api/markets/{market_id}/manage", response_model=MarketDetails)
-async def get_market_management_details(market_id: int):
+async def get_market_management_details(market_id: int, request: Request):
     """Gets all the details needed to manage a market."""
-    conn = get_dict_connection()
-    try:
-        with conn.cursor() as c:
+    async def load():
+        async with async_db_connection() as conn:
             # Get market details
-            c.execute("SELECT * FROM markets WHERE id = %s", (market_id,))
-            market = c.fetchone()
+            market = await queries.fetch_market(conn, market_id)
             if not market:
                 raise HTTPException(status_code=404, detail="Market not found")
             
             # Get players and their champions in that market
-            c.execute("""
-                SELECT 
-                    mp.id, 
-                    mp.player_tag, 
-                    COALESCE(array_agg(pc.champion_name) FILTER (WHERE pc.champion_name IS NOT NULL), '{}') as champions
-                FROM market_players mp
-                LEFT JOIN player_champions pc ON mp.id = pc.market_player_id
-                WHERE mp.market_id = %s
-                GROUP BY mp.id, mp.player_tag
-            """, (market_id,))
-            players = c.fetchall()
-
-            market['players'] = players
-            return market
-    finally:
-        conn.close()
+            market['players'] = await queries.fetch_market_players_with_champions(conn, market_id)
+        # Cached responses bypass response_model, so filter through it here
+        return MarketDetails.model_validate(market)
+    return await _cached_response(request, market_id, load)
 
 # You will also need an endpoint to remove a player
 @app.delete("/api/markets/players/{player_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def remove_player_from_market(player_id: int):
-    conn = get_dict_connection()
-    try:
-        with conn.cursor() as c:
-            # ON DELETE CASCADE will handle deleting their champions
-            c.execute("DELETE FROM market_players WHERE id = %s", (player_id,))
-            conn.commit()
-            return
-    finally:
-        conn.close()
+    async with async_db_connection() as conn:
+        market_id = await queries.delete_market_player(conn, player_id)
+    if market_id is not None:
+        response_cache.bump(market_id)
+    return
 
 @app.get("/api/users/{user_id}/profile")
 async def get_user_profile(user_id: str):
     """Gets user profile information including subscription tier."""
-    conn = get_dict_connection()
-    try:
-        with conn.cursor() as c:
-            c.execute("SELECT id, username, subscription_tier FROM profiles WHERE id = %s", (user_id,))
-            profile = c.fetchone()
-            if not profile:
-                raise HTTPException(status_code=404, detail="User profile not found")
-            return profile
-    finally:
-        conn.close()
+    async with async_db_connection() as conn:
+        profile = await queries.fetch_user_profile(conn, user_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="User profile not found")
+    return profile
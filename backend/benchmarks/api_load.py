@@ -0,0 +1,180 @@
+"""
+Load benchmark for the API: many concurrent clients against a uvicorn server on a
+local Postgres, reporting p50/p99 latency per endpoint.
+
+The server runs from this checkout, or from a git worktree of --rev, so the same
+workload can be replayed against the code before and after a change. All
+revisions share one seeded database migrated to this checkout's schema.
+
+Recorded with the defaults (1 uvicorn worker, 200 clients, 20,000 requests round-robin
+over four endpoints, 50 players x 2,000 prices; client, server and pgserver Postgres 16
+sharing one vCPU), all revisions in one run against a freshly seeded database:
+
+    revision                           endpoint             p50 ms   p99 ms   req/s
+    21abe52 (before user-002:          /stocks              1538.2   4610.6     106
+             sync pool on the loop)    /users/.../markets   1538.1   4610.5
+                                       /history             1538.1   4610.6
+                                       /                    1538.3   4610.6
+    c71a9b5 (after user-002:           /stocks              2184.0   2246.3     123
+             async data-access layer)  /users/.../markets   2130.5   2192.3
+                                       /history             2153.1   2212.9
+                                       /                      26.7     92.2
+    c71a9b5 without the per-checkout   /stocks              2154.6   2709.5     124
+             health check              /users/.../markets   2102.6   2580.1
+                                       /history             2124.4   2648.5
+                                       /                      32.0     79.8
+    20a587a (latest-price summary,     /stocks                 9.2     61.4    1354
+             response cache)           /users/.../markets    557.4    616.2
+                                       /history                9.1     62.7
+                                       /                       9.2     62.9
+
+Before user-002 every request, GET / included, queued behind whichever blocking
+query held the event loop. With the async pool the loop keeps serving while queries
+run, so requests that need no database answer in milliseconds; the database-bound
+ones are then limited by the pool and the single core rather than the loop, which
+the later summary table and response cache address.
+
+The async pool used to run a health check (SELECT 1) on every checkout. Against a
+local socket its round trip is lost in the noise (123 vs 124 req/s here; 101 vs 125
+in an earlier paired run), but it is one more round trip per request against a remote
+database, so the pool now relies on max_idle/max_lifetime and discard-on-error instead.
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+# --- Server ---
+def checkout(rev):
+    """A git worktree of `rev` in a temp dir; returns its backend directory."""
+    path = tempfile.mkdtemp(prefix=f"bench-{rev}-")
+    subprocess.run(['git', 'worktree', 'add', '--detach', path, rev], cwd=BACKEND_DIR, check=True,
+                   stdout=subprocess.DEVNULL)
+    return path, os.path.join(path, 'backend')
+
+
+def start_server(app_dir, database_url, port, log):
+    env = dict(os.environ, DATABASE_URL=database_url, PYTHONPATH=app_dir)
+    return subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'api.main:app', '--port', str(port), '--log-level', 'warning',
+         '--no-access-log'],
+        cwd=app_dir, env=env, stdout=subprocess.DEVNULL, stderr=log,
+    )
+
+
+async def wait_until_up(session, base_url, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            async with session.get(base_url + '/') as response:
+                if response.status == 200:
+                    return
+        except Exception:
+            pass
+        await asyncio.sleep(0.25)
+    raise RuntimeError(f"Server at {base_url} did not come up within {timeout}s")
+
+
+# --- Load ---
+async def run_load(base_url, paths, clients, total_requests):
+    """`clients` workers share `total_requests` requests round-robin over paths; returns latencies per path."""
+    import aiohttp
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    counter = iter(range(total_requests))
+
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=clients)) as session:
+        await wait_until_up(session, base_url)
+        # Warm the pools and caches before measuring
+        for path in paths.values():
+            async with session.get(base_url + path) as response:
+                await response.read()
+
+        async def client():
+            for i in counter:
+                name = list(paths)[i % len(paths)]
+                started = time.perf_counter()
+                async with session.get(base_url + paths[name]) as response:
+                    await response.read()
+                    if response.status != 200:
+                        errors[name] += 1
+                latencies[name].append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(clients)))
+        elapsed = time.perf_counter() - started
+    return latencies, errors, elapsed
+
+
+def percentile(values, p):
+    return statistics.quantiles(values, n=100, method='inclusive')[p - 1]
+
+
+def report(label, latencies, errors, elapsed):
+    total = sum(len(v) for v in latencies.values())
+    print(f"\n{label}: {total} requests in {elapsed:.1f}s ({total / elapsed:.0f} req/s)")
+    print(f"{'endpoint':<22}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for name, values in latencies.items():
+        print(f"{name:<22}{percentile(values, 50):>10.1f}{percentile(values, 99):>10.1f}{errors[name]:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rev', action='append', default=[],
+                        help="git revision to serve (repeatable); default: this checkout")
+    parser.add_argument('--clients', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=20_000)
+    parser.add_argument('--players', type=int, default=50)
+    parser.add_argument('--prices', type=int, default=2_000, help="price rows per player")
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    from benchmarks.local_db import use_local_database, seed_market, BENCH_USER_ID
+    database_url = use_local_database()
+    from lib.database import get_connection
+    conn = get_connection()
+    try:
+        market_id = seed_market(conn, players=args.players, prices_per_player=args.prices)
+    finally:
+        conn.close()
+    print(f"Seeded market {market_id}: {args.players} players x {args.prices} prices")
+
+    paths = {
+        '/stocks': f"/api/markets/{market_id}/stocks",
+        '/users/.../markets': f"/api/users/{BENCH_USER_ID}/markets",
+        '/history': f"/api/markets/{market_id}/stocks/Player0%23BENCH/history?period=1w",
+        '/': "/",
+    }
+    for rev in args.rev or [None]:
+        worktree, app_dir = checkout(rev) if rev else (None, BACKEND_DIR)
+        log = tempfile.TemporaryFile()
+        server = start_server(app_dir, database_url, args.port, log)
+        try:
+            latencies, errors, elapsed = asyncio.run(
+                run_load(f"http://127.0.0.1:{args.port}", paths, args.clients, args.requests))
+            report(rev or 'working tree', latencies, errors, elapsed)
+            if any(errors.values()):
+                log.seek(0)
+                print("Server errors (last lines):\n" + log.read().decode(errors='replace')[-2000:])
+        finally:
+            server.terminate()
+            server.wait()
+            if worktree:
+                subprocess.run(['git', 'worktree', 'remove', '--force', worktree], cwd=BACKEND_DIR, check=False)
+                shutil.rmtree(worktree, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    # Usage (from backend/):
+    #   python -m benchmarks.api_load                          (this checkout)
+    #   python -m benchmarks.api_load --rev 21abe52 --rev c71a9b5   (before / after user-002)
+    main()
@@ -0,0 +1,85 @@
+"""
+Per-game scoring cost of a market refresh at 1, 50 and 5,000 players: the old
+per-game path (a one-row DataFrame and a predict call per game) against
+PlayerStockTracker.score_games, which calls each role's model once on a matrix,
+with both the sklearn pickles and their compiled artifacts.
+
+Feature rows come from parity_sample, i.e. values at and around the models' own
+split thresholds, and the roles are spread evenly over the games.
+
+Recorded on one vCPU with the production pickles (best of 5; the per-game loop
+runs once at 5,000 players):
+
+    players   per-game predict   score_games (sklearn)   score_games (compiled)
+          1          748.7 us              572.7 us                 42.5 us
+         50          657.1 us               67.0 us                 15.3 us
+      5,000          673.5 us                7.7 us                 11.8 us
+
+Batching removes the fixed cost of building a DataFrame and entering predict for
+every game, so the per-game cost falls with the market size. The compiled models
+win for small batches; on thousands of rows sklearn's Cython tree walk is faster.
+"""
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from lib.features import FEATURE_ORDER
+from lib.model_compiler import CompiledGradientBoosting, ROLES, parity_sample
+from lib.model_registry import PICKLE_VERSION, model_registry
+from services.stock_tracker import PlayerStockTracker
+
+
+def make_games(compiled, players, seed=0):
+    rng = np.random.default_rng(seed)
+    games = []
+    for i in range(players):
+        role = ROLES[i % len(ROLES)]
+        features = parity_sample(compiled[role], n_rows=1, seed=int(rng.integers(1 << 31)))[0]
+        games.append({'role': role, 'features': features.tolist(), 'market_player_id': i})
+    return games
+
+
+def per_game_predict(games, models):
+    """The pre-user-010 loop: one DataFrame and one predict call per game."""
+    for game in games:
+        metrics = dict(zip(FEATURE_ORDER, game['features']))
+        models[game['role']].predict(pd.DataFrame([metrics], columns=FEATURE_ORDER))
+
+
+def best_of(fn, repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-game scoring cost at several market sizes.")
+    parser.add_argument('--players', type=int, nargs='+', default=[1, 50, 5000])
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    pickles = model_registry.get(PICKLE_VERSION)
+    compiled = {role: CompiledGradientBoosting.from_sklearn(model) for role, model in pickles.items()}
+    tracker = PlayerStockTracker(None)
+
+    print(f"{'players':>8}{'per-game predict':>19}{'score_games (sklearn)':>24}{'score_games (compiled)':>25}")
+    for players in args.players:
+        games = make_games(compiled, players)
+        # The old loop costs seconds at 5,000 players, so it is timed once there
+        repeats = args.repeats if players <= 50 else 1
+        refresh = {'watermarks': {}}
+        old = best_of(lambda: per_game_predict(games, pickles), repeats)
+        batched = best_of(lambda: tracker.score_games([dict(g) for g in games], refresh, pickles), args.repeats)
+        flat = best_of(lambda: tracker.score_games([dict(g) for g in games], refresh, compiled), args.repeats)
+        print(f"{players:>8,}{old / players * 1e6:>16.1f} us{batched / players * 1e6:>21.1f} us"
+              f"{flat / players * 1e6:>22.1f} us")
+
+
+if __name__ == "__main__":
+    # Usage (from backend/):
+    #   python -m benchmarks.batch_scoring
+    #   python -m benchmarks.batch_scoring --players 1 10 100 1000
+    main()
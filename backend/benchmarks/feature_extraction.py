@@ -0,0 +1,75 @@
+"""
+Feature extraction throughput on the parity test's match and timeline
+(tests/fixtures): the old tracker's calculate_metrics, called once per
+participant; the old data farmer's per-participant helpers; and
+lib.features.extract_match_features, which computes all ten rows at once. The
+old implementations are the reference copies in tests/test_features.py.
+
+Recorded on one vCPU (best of 5, 2,000 matches each):
+
+    path                                      us/match    matches/s
+    old tracker (10 x calculate_metrics)          64.0       15,629
+    old tracker (1 x calculate_metrics)            6.1      163,969
+    old farmer (per-player helpers)               97.8       10,230
+    extract_match_features                        56.4       17,732
+
+For a whole match, as the farmer needs it, the shared extractor is 1.1x faster than the old
+tracker loop and 1.7x faster than the old farmer. The tracker usually scores one tracked
+player per match and now pays for all ten rows, about 50us more per game; next
+to the two Riot requests behind every game that is noise, and it keeps the live
+and training features on one code path.
+"""
+import argparse
+import time
+from lib.features import extract_match_features
+from tests.test_features import load_fixture, old_farmer_rows, old_tracker_metrics
+
+
+def best_of(fn, repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Feature extraction throughput, old paths against lib.features.")
+    parser.add_argument('--matches', type=int, default=2_000)
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    match_data = load_fixture('match_NA1_4900000001.json')
+    timeline_data = load_fixture('timeline_NA1_4900000001.json')
+    puuids = [p['puuid'] for p in match_data['info']['participants']]
+
+    def old_tracker():
+        for _ in range(args.matches):
+            for puuid in puuids:
+                old_tracker_metrics(match_data, timeline_data, puuid)
+
+    def old_tracker_one():
+        for _ in range(args.matches):
+            old_tracker_metrics(match_data, timeline_data, puuids[0])
+
+    def old_farmer():
+        for _ in range(args.matches):
+            old_farmer_rows(match_data, timeline_data)
+
+    def vectorized():
+        for _ in range(args.matches):
+            extract_match_features(match_data, timeline_data)
+
+    print(f"{'path':<40}{'us/match':>10}{'matches/s':>13}")
+    for name, fn in [('old tracker (10 x calculate_metrics)', old_tracker),
+                     ('old tracker (1 x calculate_metrics)', old_tracker_one),
+                     ('old farmer (per-player helpers)', old_farmer),
+                     ('extract_match_features', vectorized)]:
+        seconds = best_of(fn, args.repeats) / args.matches
+        print(f"{name:<40}{seconds * 1e6:>10.1f}{1 / seconds:>13,.0f}")
+
+
+if __name__ == "__main__":
+    # Usage (from backend/): python -m benchmarks.feature_extraction [--matches N] [--repeats N]
+    main()
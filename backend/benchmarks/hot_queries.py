@@ -0,0 +1,102 @@
+"""
+Latency of the plan check's hot queries (lib.migrations.HOT_QUERIES) with the
+migrations' indexes, and with them dropped inside a transaction that is rolled
+back, on a seeded market in a local Postgres.
+
+Recorded on one vCPU (pgserver Postgres 16), 200 players x 2,000 prices
+(400,000 stock_values and processed_games rows), best of 20. The queries are the
+SQL constants the API and the tracker run, so the numbers are for the real statements:
+
+    query                                              with indexes    without
+    recent scores (fetch_player_scores)                     0.06 ms     24.63 ms
+    market scores (fetch_market_scores)                     3.12 ms   4253.23 ms
+    price history (fetch_stock_history)                     0.49 ms     26.79 ms
+    market stocks (fetch_market_stocks)                     1.00 ms      1.46 ms
+    candles (fetch_candles)                                 0.61 ms      0.61 ms
+    first candle (fetch_first_candle_at)                    0.09 ms      0.09 ms
+    latest prices (prefetch_market_state)                   0.10 ms      0.10 ms
+    processed games (prefetch_market_state)                 0.03 ms     19.55 ms
+    market players (get_market_config_and_players)          0.25 ms      0.25 ms
+    anchor refresh (refresh_price_anchors)                  0.14 ms      0.13 ms
+    all due anchors (refresh_all_price_anchors)             0.13 ms      0.13 ms
+
+The per-player queries go from a scan of the whole table to a few index pages; the
+batched market scores run one such scan per player without their index. The summary
+tables are small enough here that their indexes make no difference yet, and the seeded
+anchors are fresh, so the anchor lookups behind "market stocks" and the two anchor
+refreshes find nothing due. The anchor refreshes are UPDATEs and really run here,
+inside the transaction that is rolled back at the end.
+"""
+import argparse
+import time
+from datetime import datetime, timedelta, timezone
+from benchmarks.local_db import seed_market, use_local_database
+
+# Every secondary index the migrations add for a hot query; primary keys and unique
+# constraints stay, as they do without the migrations
+MIGRATION_INDEXES = [
+    'stock_values_market_tag_timestamp_idx', 'stock_values_player_timestamp_idx', 'processed_games_player_game_idx',
+    'market_player_latest_market_idx', 'market_player_latest_anchor_due_idx', 'stock_candles_market_idx',
+    'market_players_player_tag_idx',
+]
+
+
+def time_queries(c, queries, params, repeats):
+    """{name: best seconds} for each query, fetching every row."""
+    timings = {}
+    for name, sql in queries.items():
+        best = float('inf')
+        for _ in range(repeats):
+            started = time.perf_counter()
+            c.execute(sql, params)
+            c.fetchall()
+            best = min(best, time.perf_counter() - started)
+        timings[name] = best
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hot query latency with and without the migrations' indexes.")
+    parser.add_argument('--players', type=int, default=200)
+    parser.add_argument('--prices', type=int, default=2_000, help="prices per player")
+    parser.add_argument('--repeats', type=int, default=20)
+    args = parser.parse_args()
+
+    use_local_database()
+    from lib.database import db_connection
+    from lib.migrations import HOT_QUERIES
+
+    with db_connection() as conn:
+        market_id = seed_market(conn, players=args.players, prices_per_player=args.prices)
+        with conn.cursor() as c:
+            c.execute("""
+                INSERT INTO processed_games (market_player_id, game_id, player_tag, champion)
+                SELECT market_player_id, game_id, player_tag, 'Ahri' FROM stock_values
+                WHERE market_id = %s AND game_id IS NOT NULL
+            """, (market_id,))
+            c.execute("ANALYZE")
+            c.execute("SELECT id, player_tag FROM market_players WHERE market_id = %s ORDER BY id LIMIT 1", (market_id,))
+            market_player_id, player_tag = c.fetchone()
+        conn.commit()
+
+        params = {
+            'market_player_id': market_player_id, 'market_id': market_id, 'player_tag': player_tag,
+            'market_player_ids': [market_player_id], 'game_ids': [f"BENCH_{market_player_id}_1"], 'limit': 5,
+            'start_date': datetime.now(timezone.utc) - timedelta(days=7),
+            'resolution': '1h', 'width': timedelta(hours=1),
+        }
+        with conn.cursor() as c:
+            indexed = time_queries(c, HOT_QUERIES, params, args.repeats)
+            for index in MIGRATION_INDEXES:
+                c.execute(f"DROP INDEX IF EXISTS {index}")
+            unindexed = time_queries(c, HOT_QUERIES, params, args.repeats)
+        conn.rollback()
+
+    print(f"{'query':<53}{'with indexes':>14}{'without':>12}")
+    for name in HOT_QUERIES:
+        print(f"{name:<53}{indexed[name] * 1000:>11.2f} ms{unindexed[name] * 1000:>9.2f} ms")
+
+
+if __name__ == "__main__":
+    # Usage (from backend/): python -m benchmarks.hot_queries [--players N] [--prices N] [--repeats N]
+    main()
@@ -0,0 +1,78 @@
+"""
+A throwaway local Postgres for the benchmarks.
+
+Uses BENCH_DATABASE_URL when it is set; otherwise starts a private server with
+pgserver (pip install -r requirements-dev.txt) in BENCH_PGDATA. DATABASE_URL from
+.env is never used, so a benchmark cannot write into a real database. Call
+use_local_database() before importing anything from lib, which reads DATABASE_URL
+at import time.
+"""
+import os
+import random
+from datetime import datetime, timedelta, timezone
+
+BENCH_PGDATA = os.environ.get('BENCH_PGDATA', os.path.join(os.path.dirname(__file__), '..', '.bench_pgdata'))
+BENCH_USER_ID = '00000000-0000-0000-0000-000000000001'
+
+
+def use_local_database(data_dir=BENCH_PGDATA):
+    """Points DATABASE_URL at a migrated local database and returns the URL."""
+    if not os.environ.get('BENCH_DATABASE_URL'):
+        import pgserver
+        server = pgserver.get_server(os.path.abspath(data_dir), cleanup_mode=None)
+        os.environ['BENCH_DATABASE_URL'] = server.get_uri()
+    os.environ['DATABASE_URL'] = os.environ['BENCH_DATABASE_URL']
+
+    from lib.migrations import apply
+    apply()
+    return os.environ['DATABASE_URL']
+
+
+def seed_market(conn, players=50, prices_per_player=200, history_days=30, seed=42):
+    """
+    Creates one market with `players` players and a random-walk price history each,
+    plus the summaries a tracker refresh maintains. Returns the market id.
+    """
+    from psycopg2.extras import execute_values
+    from lib.candles import CANDLE_REBUILD_SQL
+    from lib.price_anchors import refresh_price_anchors
+
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    with conn.cursor() as c:
+        c.execute("INSERT INTO profiles (id, username) VALUES (%s, 'bench') ON CONFLICT DO NOTHING", (BENCH_USER_ID,))
+        c.execute("INSERT INTO markets (name, creator_id, invite_code) VALUES ('bench', %s, %s) RETURNING id",
+                  (BENCH_USER_ID, os.urandom(6).hex().upper()))
+        market_id = c.fetchone()[0]
+        c.execute("INSERT INTO market_members (market_id, user_id) VALUES (%s, %s)", (market_id, BENCH_USER_ID))
+
+        rows = []
+        for p in range(players):
+            tag = f"Player{p}#BENCH"
+            c.execute("INSERT INTO market_players (market_id, player_tag) VALUES (%s, %s) RETURNING id", (market_id, tag))
+            market_player_id = c.fetchone()[0]
+            c.execute("INSERT INTO player_champions VALUES (%s, 'Ahri')", (market_player_id,))
+            price = 10.0
+            for i in range(prices_per_player):
+                at = now - timedelta(days=history_days) * (1 - i / prices_per_player)
+                score = rng.uniform(0, 10)
+                price = max(0.1, price + 0.2 * (score - 5))
+                game_id = f"BENCH_{market_player_id}_{i}" if i else None
+                rows.append((market_id, market_player_id, tag, price, score, game_id, 'Ahri', at))
+        execute_values(c, """
+            INSERT INTO stock_values
+                (market_id, market_player_id, player_tag, stock_value, model_score, game_id, champion_played, timestamp)
+            VALUES %s
+        """, rows, page_size=5000)
+
+        # Anchors are due now, so the refresh below computes them, as the tracker's flush would
+        c.execute("""
+            INSERT INTO market_player_latest (market_player_id, market_id, current_price, last_update, next_24h_at, next_7d_at)
+            SELECT DISTINCT ON (market_player_id) market_player_id, market_id, stock_value, timestamp, NOW(), NOW()
+            FROM stock_values WHERE market_id = %s
+            ORDER BY market_player_id, timestamp DESC
+        """, (market_id,))
+        refresh_price_anchors(c, market_id)
+        c.execute(CANDLE_REBUILD_SQL, {'market_id': market_id})
+    conn.commit()
+    return market_id
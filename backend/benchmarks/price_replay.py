@@ -0,0 +1,114 @@
+"""
+Throughput of the price replay engine (services/price_replay.py) on a market with
+1,000,000 scored games in a local Postgres: the history load, vectorized re-scoring,
+the NumPy pricing fold and the atomic write, timed stage by stage. The request's
+target is 1M games in under a minute on one core.
+
+Recorded on one vCPU (client and pgserver Postgres 16 on the same core), 1,000
+players x 1,000 games, production pickles (no compiled version):
+
+    stage                               seconds      games/s
+    load (server-side cursor)              8.73      114,564
+    re-score (one predict per role)        2.72      368,149
+    price (cumulative ufuncs)              0.02   57,375,418
+    write (COPY, UPDATE, rebuild)         25.49       39,224
+    dry run (load + score + price)        11.46       87,241
+    applied replay                        36.96       27,058
+
+An applied replay of 1M games, under the market's price lock, takes 37s; a dry run
+11s. The write dominates: rewriting a million stock_values rows and rebuilding the
+candles from them.
+"""
+import argparse
+import time
+from benchmarks.local_db import BENCH_USER_ID, use_local_database
+
+
+def seed_replay_market(conn, players, games_per_player):
+    """A market of `players` players with `games_per_player` stored games and features each."""
+    from lib.features import FEATURE_ORDER
+    from lib.model_compiler import ROLES
+
+    roles = "ARRAY[" + ', '.join(f"'{role}'" for role in ROLES) + "]"
+    with conn.cursor() as c:
+        c.execute("INSERT INTO profiles (id, username) VALUES (%s, 'bench') ON CONFLICT DO NOTHING", (BENCH_USER_ID,))
+        c.execute("INSERT INTO markets (name, creator_id, invite_code) VALUES ('replay bench', %s, md5(random()::text)) "
+                  "RETURNING id", (BENCH_USER_ID,))
+        market_id = c.fetchone()[0]
+        c.execute("""
+            INSERT INTO market_players (market_id, player_tag)
+            SELECT %s, 'Player' || p || '#BENCH' FROM generate_series(1, %s) p
+        """, (market_id, players))
+        c.execute("""
+            INSERT INTO stock_values (market_id, market_player_id, player_tag, stock_value, model_score, timestamp)
+            SELECT market_id, id, player_tag, 10.0, 5.0, NOW() - INTERVAL '400 days' FROM market_players WHERE market_id = %s
+        """, (market_id,))
+        c.execute("""
+            INSERT INTO stock_values
+                (market_id, market_player_id, player_tag, stock_value, model_score, game_id, champion_played, timestamp)
+            SELECT mp.market_id, mp.id, mp.player_tag, 10.0, 5.0, 'BENCH_' || mp.id || '_' || g, 'Ahri',
+                   NOW() - INTERVAL '400 days' + g * INTERVAL '1 hour'
+            FROM market_players mp CROSS JOIN generate_series(1, %s) g
+            WHERE mp.market_id = %s
+        """, (games_per_player, market_id))
+        c.execute(f"""
+            INSERT INTO game_features (market_player_id, game_id, role, champion, {', '.join(FEATURE_ORDER)})
+            SELECT mp.id, 'BENCH_' || mp.id || '_' || g, ({roles})[1 + mp.id %% {len(ROLES)}], 'Ahri',
+                   {', '.join(['(random() * 100 - 20)::real'] * len(FEATURE_ORDER))}
+            FROM market_players mp CROSS JOIN generate_series(1, %s) g
+            WHERE mp.market_id = %s
+        """, (games_per_player, market_id))
+        c.execute("""
+            INSERT INTO market_player_latest (market_player_id, market_id, current_price, last_update)
+            SELECT id, market_id, 10.0, NOW() FROM market_players WHERE market_id = %s
+        """, (market_id,))
+        c.execute("ANALYZE stock_values; ANALYZE game_features")
+    conn.commit()
+    return market_id
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Price replay throughput on a large seeded market.")
+    parser.add_argument('--players', type=int, default=1_000)
+    parser.add_argument('--games', type=int, default=1_000, help="games per player")
+    parser.add_argument('--version', help="model version to re-score with (default: the active one)")
+    args = parser.parse_args()
+
+    use_local_database()
+    from lib.database import db_connection, lock_market_prices
+    from lib.model_registry import model_registry
+    from services.price_replay import load_market_history, replay_prices, rescore, write_series
+
+    with db_connection() as conn:
+        started = time.perf_counter()
+        market_id = seed_replay_market(conn, args.players, args.games)
+        print(f"Seeded market {market_id} with {args.players * args.games:,} games in {time.perf_counter() - started:.0f}s")
+
+    models = model_registry.get(args.version)
+    timings = []
+    with db_connection() as conn:
+        t0 = time.perf_counter()
+        with conn.cursor() as c:
+            lock_market_prices(c, market_id)
+        history, ipo_prices, _ = load_market_history(conn, market_id)
+        t1 = time.perf_counter()
+        scores, _ = rescore(history, models)
+        t2 = time.perf_counter()
+        prices = replay_prices(history['market_player_id'], scores, ipo_prices)
+        t3 = time.perf_counter()
+        write_series(conn, market_id, history, scores, prices)
+        conn.commit()
+        t4 = time.perf_counter()
+    timings = [('load (server-side cursor)', t1 - t0), ('re-score (one predict per role)', t2 - t1),
+               ('price (cumulative ufuncs)', t3 - t2), ('write (COPY, UPDATE, rebuild)', t4 - t3),
+               ('dry run (load + score + price)', t3 - t0), ('applied replay', t4 - t0)]
+
+    games = len(prices)
+    print(f"\n{'stage':<34}{'seconds':>9}{'games/s':>13}")
+    for stage, seconds in timings:
+        print(f"{stage:<34}{seconds:>9.2f}{games / seconds:>13,.0f}")
+
+
+if __name__ == "__main__":
+    # Usage (from backend/): python -m benchmarks.price_replay [--players N] [--games N] [--version V]
+    main()
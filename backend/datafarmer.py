@@ -1,15 +1,213 @@
 import os
-import requests
+import sys
+import asyncio
+from collections import deque
+import aiohttp
 from dotenv import load_dotenv
-import json
 import csv
-import time
-from datetime import datetime
+from lib.riot_api import fetch_json, fetch_match, resolve_puuid
+from lib.features import FEATURE_ORDER, extract_match_features
 
 # Load environment variables
 load_dotenv()
 API_KEY = os.getenv("RIOT_API_KEY")
 
+# Matches processed at once; the shared Riot rate limiter decides how fast requests actually go
+MAX_CONCURRENT_MATCHES = int(os.getenv("DATAFARMER_CONCURRENCY", 8))
+# Crawl state lives in this directory next to the output CSV, so it follows the data rather than
+# the working directory: one checkpoint per output file, and the PUUID frontier
+STATE_DIR_NAME = '.datafarmer'
+
+FIELDNAMES = [
+    'match_id', 'summoner_name', 'role', 'champion', 'game_length_mins',
+    'kda', 'dmg_to_champions_per_min', 'team_damage_share', 'team_gold_share',
+    'gold_diff_15', 'exp_diff_15', 'kill_participation',
+    'objective_damage_per_min', 'team_objective_damage_share',
+    'vision_score_per_min', 'team_vision_score_share',
+    'gold_diff_per_min', 'exp_diff_per_min',
+    'damage_taken_per_min', 'damage_taken_share',
+    'healing_shielding_allies_per_min', 'win_loss'
+]
+
+
+def _read_lines(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def state_dir_for(output_path):
+    """The crawl state directory of an output CSV."""
+    return os.path.join(os.path.dirname(os.path.abspath(output_path)), STATE_DIR_NAME)
+
+
+def _read_checkpoint(path):
+    """(finished match ids, CSV size after the last of them, bytes of complete lines) from a checkpoint."""
+    done, offset, complete = [], None, 0
+    with open(path, 'rb') as f:
+        for line in f:
+            # A crash mid-write can leave half a line at the end; that match was never checkpointed
+            if not line.endswith(b'\n'):
+                break
+            size, match_id = line.decode('utf-8').rstrip('\n').split('\t')
+            offset = int(size)
+            complete += len(line)
+            if match_id:
+                done.append(match_id)
+    return done, offset, complete
+
+
+class CheckpointedCSV:
+    """
+    Append-only CSV plus its checkpoint (<state dir>/<csv name>.checkpoint), which lists every
+    finished match id with the CSV's size in bytes once its rows were written, including matches
+    that were skipped and produced no rows. A match's rows are appended and fsynced before its
+    checkpoint line, so after a crash the run resumes where it stopped and no match is ever
+    emitted twice: the CSV is truncated back to the last checkpointed size when it is reopened.
+    The seen-match index is every checkpoint in the state directory, so CSVs that share a
+    directory never collect the same match.
+
+    A CSV that exists without a checkpoint (collected before checkpoints, or with the state
+    directory removed) is adopted: its match ids are checkpointed as they are. A checkpoint
+    that is ahead of its CSV means the CSV was replaced or cut short, and the run refuses to start.
+    """
+
+    def __init__(self, path, state_dir=None):
+        self.path = path
+        state_dir = state_dir or state_dir_for(path)
+        os.makedirs(state_dir, exist_ok=True)
+        self.checkpoint_path = os.path.join(state_dir, f"{os.path.basename(path)}.checkpoint")
+
+        self.done = set()
+        for name in os.listdir(state_dir):
+            if name.endswith('.checkpoint') and name != os.path.basename(self.checkpoint_path):
+                self.done.update(_read_checkpoint(os.path.join(state_dir, name))[0])
+
+        offset = None
+        if os.path.exists(self.checkpoint_path):
+            done, offset, complete = _read_checkpoint(self.checkpoint_path)
+            os.truncate(self.checkpoint_path, complete)
+            self.done.update(done)
+        if offset is not None:
+            self._truncate_to_checkpoint(offset)
+            adopted = None
+        else:
+            adopted = self._adopt_existing_rows()
+
+        self._csv_file = open(self.path, 'a', newline='', encoding='utf-8')
+        self._writer = csv.DictWriter(self._csv_file, fieldnames=FIELDNAMES)
+        self._checkpoint_file = open(self.checkpoint_path, 'a', encoding='utf-8')
+        if adopted is not None:
+            if self._csv_file.tell() == 0:
+                self._writer.writeheader()
+                self._csv_file.flush()
+            # The first line only records where the header ends
+            self._checkpoint_file.write(''.join(f"{self._csv_file.tell()}\t{m}\n" for m in ['', *adopted]))
+            self._checkpoint_file.flush()
+        self.rows_written = 0
+
+    def _truncate_to_checkpoint(self, offset):
+        """Cuts rows written after the last checkpoint (only after a crash)."""
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else None
+        if size is None or size < offset:
+            raise RuntimeError(f"{self.checkpoint_path} is ahead of {self.path} ({size} bytes, checkpoint at "
+                               f"{offset}); restore the CSV or delete the checkpoint to start it again")
+        if size > offset:
+            print(f"Dropping {size - offset} byte(s) from unfinished matches at the end of {self.path}")
+            os.truncate(self.path, offset)
+
+    def _adopt_existing_rows(self):
+        """Match ids already in a CSV that has no checkpoint, in file order; a torn last line is cut."""
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return []
+        with open(self.path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            torn = f.read(1) != b'\n'
+        if torn:
+            with open(self.path, 'rb+') as f:
+                # Back to the end of the last complete line
+                position = f.seek(0, os.SEEK_END)
+                while position > 0:
+                    step = min(65536, position)
+                    f.seek(position - step)
+                    cut = f.read(step).rfind(b'\n')
+                    if cut != -1:
+                        f.truncate(position - step + cut + 1)
+                        break
+                    position -= step
+                else:
+                    f.truncate(0)
+            print(f"Dropped a half-written last line from {self.path}")
+        with open(self.path, newline='', encoding='utf-8') as f:
+            adopted = list(dict.fromkeys(row['match_id'] for row in csv.DictReader(f)))
+        print(f"Adopting {len(adopted)} match(es) already in {self.path}, which has no checkpoint")
+        self.done.update(adopted)
+        return adopted
+
+    def record(self, match_id, rows):
+        """Appends one match's rows, then checkpoints the match."""
+        if rows:
+            self._writer.writerows(rows)
+            self._csv_file.flush()
+            os.fsync(self._csv_file.fileno())
+            self.rows_written += len(rows)
+        self._checkpoint_file.write(f"{self._csv_file.tell()}\t{match_id}\n")
+        self._checkpoint_file.flush()
+        self.done.add(match_id)
+
+    def close(self):
+        self._csv_file.close()
+        self._checkpoint_file.close()
+
+
+class CrawlFrontier:
+    """
+    PUUIDs of players seen in collected matches, waiting to have their match history crawled,
+    so collection keeps growing from the games themselves instead of a fixed seed list.
+    discovered.txt and crawled.txt are append-only; on startup the frontier is every
+    discovered PUUID not yet crawled, in discovery order.
+    """
+
+    def __init__(self, state_dir):
+        os.makedirs(state_dir, exist_ok=True)
+        discovered_path = os.path.join(state_dir, 'discovered_puuids.txt')
+        crawled_path = os.path.join(state_dir, 'crawled_puuids.txt')
+        discovered = _read_lines(discovered_path)
+        self.crawled = set(_read_lines(crawled_path))
+        self.known = set(discovered) | self.crawled
+        self.queue = deque(p for p in dict.fromkeys(discovered) if p not in self.crawled)
+        self._discovered_file = open(discovered_path, 'a', encoding='utf-8')
+        self._crawled_file = open(crawled_path, 'a', encoding='utf-8')
+
+    def add(self, puuids):
+        new = [p for p in puuids if p not in self.known]
+        if not new:
+            return
+        self.known.update(new)
+        self.queue.extend(new)
+        self._discovered_file.write(''.join(f"{p}\n" for p in new))
+        self._discovered_file.flush()
+
+    def prioritize(self, puuid):
+        """Seeds go to the front and are re-crawled every run, since they keep playing new games."""
+        self.known.add(puuid)
+        self.queue.appendleft(puuid)
+
+    def pop(self):
+        return self.queue.popleft() if self.queue else None
+
+    def mark_crawled(self, puuid):
+        if puuid not in self.crawled:
+            self.crawled.add(puuid)
+            self._crawled_file.write(f"{puuid}\n")
+            self._crawled_file.flush()
+
+    def close(self):
+        self._discovered_file.close()
+        self._crawled_file.close()
+
+
 class AIDataCollector:
     def __init__(self):
         self.headers = {
@@ -28,14 +226,12 @@ class AIDataCollector:
         # Valid ranked queue types
         self.valid_queues = [420]  # Ranked Solo/Duo
         
-    def get_account_by_riot_id(self, game_name, tag_line):
+    async def get_account_by_riot_id(self, session, game_name, tag_line):
         """Get account info using Riot ID (game name + tag)"""
         url = f"https://americas.api.riotgames.com/riot/account/v1/accounts/by-riot-id/{game_name}/{tag_line}"
-        response = requests.get(url, headers=self.headers)
-        response.raise_for_status()
-        return response.json()
+        return await fetch_json(session, url, self.headers)
 
-    def get_match_history(self, puuid, count=100):
+    async def get_match_history(self, session, puuid, count=100):
         """Get match history for a player"""
         url = f"https://americas.api.riotgames.com/lol/match/v5/matches/by-puuid/{puuid}/ids"
         params = {
@@ -44,398 +240,187 @@ class AIDataCollector:
             'start': 0,
             'count': count
         }
-        response = requests.get(url, headers=self.headers, params=params)
-        response.raise_for_status()
-        return response.json()
+        return await fetch_json(session, url, self.headers, params)
 
-    def get_match_data(self, match_id):
+    async def get_match_data(self, session, match_id):
         """Get basic match data"""
-        url = f"https://americas.api.riotgames.com/lol/match/v5/matches/{match_id}"
-        response = requests.get(url, headers=self.headers)
-        response.raise_for_status()
-        return response.json()
+        return await fetch_match(session, match_id, self.headers)
 
-    def get_match_timeline(self, match_id):
+    async def get_match_timeline(self, session, match_id):
         """Get detailed timeline data for a match"""
-        url = f"https://americas.api.riotgames.com/lol/match/v5/matches/{match_id}/timeline"
-        response = requests.get(url, headers=self.headers)
-        response.raise_for_status()
-        return response.json()
-
-    def get_15min_differences(self, timeline_data, match_data, participant_id):
-        """Calculate gold and exp differences at 15 minutes"""
-        try:
-            # Find player's position and opponent
-            player_position = None
-            opponent_participant_id = None
-            
-            for participant in match_data['info']['participants']:
-                if participant['participantId'] == participant_id:
-                    player_position = participant['teamPosition']
-                    break
-            
-            # Find lane opponent
-            for participant in match_data['info']['participants']:
-                if (participant['teamPosition'] == player_position and 
-                    participant['participantId'] != participant_id):
-                    opponent_participant_id = participant['participantId']
-                    break
-            
-            if not opponent_participant_id:
-                return 0, 0  # No opponent found
-            
-            # Find 15-minute frame
-            frame_15min = None
-            for frame in timeline_data['info']['frames']:
-                if frame['timestamp'] >= 900000:  # 15 minutes
-                    frame_15min = frame
-                    break
-            
-            if not frame_15min:
-                return 0, 0  # Game too short
-            
-            # Get stats at 15 minutes
-            player_frame = frame_15min['participantFrames'][str(participant_id)]
-            opponent_frame = frame_15min['participantFrames'][str(opponent_participant_id)]
-            
-            gold_diff = player_frame['totalGold'] - opponent_frame['totalGold']
-            exp_diff = player_frame['xp'] - opponent_frame['xp']
-            
-            return gold_diff, exp_diff
-            
-        except Exception as e:
-            print(f"Error calculating 15min differences: {e}")
-            return 0, 0
-
-    def get_end_differences(self, match_data, participant_id):
-        """Calculate gold and exp differences at game end"""
-        try:
-            # Find player's position and opponent
-            player_position = None
-            player_gold = 0
-            player_exp = 0
-            opponent_gold = 0
-            opponent_exp = 0
-            
-            for participant in match_data['info']['participants']:
-                if participant['participantId'] == participant_id:
-                    player_position = participant['teamPosition']
-                    player_gold = participant['goldEarned']
-                    player_exp = participant['champExperience']
-                    break
-            
-            # Find lane opponent
-            for participant in match_data['info']['participants']:
-                if (participant['teamPosition'] == player_position and 
-                    participant['participantId'] != participant_id):
-                    opponent_gold = participant['goldEarned']
-                    opponent_exp = participant['champExperience']
-                    break
-            
-            gold_diff = player_gold - opponent_gold
-            exp_diff = player_exp - opponent_exp
-            
-            return gold_diff, exp_diff
-            
-        except Exception as e:
-            print(f"Error calculating end differences: {e}")
-            return 0, 0
-
-    def calculate_kill_participation(self, participant_data, team_data):
-        """Calculate kill participation percentage"""
-        try:
-            team_kills = team_data['objectives']['champion']['kills']
-            player_kp = participant_data['kills'] + participant_data['assists']
-            
-            if team_kills == 0:
-                return 0
-            
-            return (player_kp / team_kills) * 100
-            
-        except Exception as e:
-            print(f"Error calculating kill participation: {e}")
-            return 0
+        return await fetch_match(session, match_id, self.headers, kind='timeline')
 
-    def calculate_team_shares(self, match_data, participant_id):
-        """Calculate various team share percentages"""
-        try:
-            # Find team participants
-            team_id = None
-            for participant in match_data['info']['participants']:
-                if participant['participantId'] == participant_id:
-                    team_id = participant['teamId']
-                    break
-            
-            # Get team totals
-            team_damage = 0
-            team_gold = 0
-            team_objective_damage = 0
-            team_vision_score = 0
-            team_damage_taken = 0
-            
-            player_damage = 0
-            player_gold = 0
-            player_objective_damage = 0
-            player_vision_score = 0
-            player_damage_taken = 0
-            
-            for participant in match_data['info']['participants']:
-                if participant['teamId'] == team_id:
-                    team_damage += participant['totalDamageDealtToChampions']
-                    team_gold += participant['goldEarned']
-                    team_objective_damage += participant['damageDealtToObjectives']
-                    team_vision_score += participant['visionScore']
-                    team_damage_taken += participant['totalDamageTaken']
-                    
-                    if participant['participantId'] == participant_id:
-                        player_damage = participant['totalDamageDealtToChampions']
-                        player_gold = participant['goldEarned']
-                        player_objective_damage = participant['damageDealtToObjectives']
-                        player_vision_score = participant['visionScore']
-                        player_damage_taken = participant['totalDamageTaken']
-            
-            # Calculate shares as percentages
-            damage_share = round((player_damage / team_damage) * 100, 1) if team_damage > 0 else 0
-            gold_share = round((player_gold / team_gold) * 100, 1) if team_gold > 0 else 0
-            objective_damage_share = round((player_objective_damage / team_objective_damage) * 100, 1) if team_objective_damage > 0 else 0
-            vision_score_share = round((player_vision_score / team_vision_score) * 100, 1) if team_vision_score > 0 else 0
-            damage_taken_share = round((player_damage_taken / team_damage_taken) * 100, 1) if team_damage_taken > 0 else 0
-            
-            return {
-                'team_damage_share': damage_share,
-                'team_gold_share': gold_share,
-                'team_objective_damage_share': objective_damage_share,
-                'team_vision_score_share': vision_score_share,
-                'damage_taken_share': damage_taken_share
-            }
-            
-        except Exception as e:
-            print(f"Error calculating team shares: {e}")
-            return {
-                'team_damage_share': 0,
-                'team_gold_share': 0,
-                'team_objective_damage_share': 0,
-                'team_vision_score_share': 0,
-                'damage_taken_share': 0
-            }
-
-    def process_match(self, match_id):
-        """Process a single match and return data for all participants"""
+    async def process_match(self, session, match_id):
+        """
+        Process a single match and return (rows for all participants, participant PUUIDs to crawl),
+        or None if it failed
+        """
         try:
             print(f"Processing match: {match_id}")
             
             # Get match data
-            match_data = self.get_match_data(match_id)
-            time.sleep(1)  # Rate limiting
+            match_data = await self.get_match_data(session, match_id)
             
             # Skip if not ranked solo/duo
             if match_data['info']['queueId'] not in self.valid_queues:
                 print(f"Skipping match {match_id} - not ranked solo/duo")
-                return []
+                return [], []
             
             # Skip if game is shorter than 10 minutes
             game_duration_seconds = match_data['info']['gameDuration']
             if game_duration_seconds < 600:  # 10 minutes
                 print(f"Skipping match {match_id} - game too short ({game_duration_seconds}s)")
-                return []
+                return [], []
             
             game_duration_minutes = game_duration_seconds / 60
             
             # Get timeline data
-            timeline_data = self.get_match_timeline(match_id)
-            time.sleep(1)  # Rate limiting
+            timeline_data = await self.get_match_timeline(session, match_id)
+            
+            # Every participant's features in one pass, columns in FEATURE_ORDER
+            features = extract_match_features(match_data, timeline_data)
             
             match_rows = []
             
             # Process each participant
-            for participant in match_data['info']['participants']:
-                participant_id = participant['participantId']
-                
+            for participant, values in zip(match_data['info']['participants'], features):
                 # Skip if no valid position
-                if not participant['teamPosition'] or participant['teamPosition'] == "":
+                if not participant['teamPosition']:
                     continue
                 
-                # Calculate KDA
-                kills = participant['kills']
-                deaths = max(1, participant['deaths'])  # Avoid division by zero
-                assists = participant['assists']
-                kda = (kills + assists) / deaths
-                
-                # Get 15-minute differences
-                gold_diff_15, exp_diff_15 = self.get_15min_differences(
-                    timeline_data, match_data, participant_id
-                )
-                
-                # Get end differences and calculate per-minute rates
-                gold_diff_end, exp_diff_end = self.get_end_differences(
-                    match_data, participant_id
-                )
-                gold_diff_per_min = gold_diff_end / game_duration_minutes if game_duration_minutes > 0 else 0
-                exp_diff_per_min = exp_diff_end / game_duration_minutes if game_duration_minutes > 0 else 0
-                
-                # Calculate kill participation
-                team_data = None
-                for team in match_data['info']['teams']:
-                    if team['teamId'] == participant['teamId']:
-                        team_data = team
-                        break
-                
-                kill_participation = self.calculate_kill_participation(participant, team_data)
-                
-                # Calculate team shares
-                team_shares = self.calculate_team_shares(match_data, participant_id)
-                
-                # Get per-minute stats
-                dmg_to_champions_per_min = participant['totalDamageDealtToChampions'] / game_duration_minutes
-                objective_damage_per_min = participant['damageDealtToObjectives'] / game_duration_minutes
-                vision_score_per_min = participant['visionScore'] / game_duration_minutes
-                damage_taken_per_min = participant['totalDamageTaken'] / game_duration_minutes
-                
-                # Calculate healing + shielding to allies per minute
-                healing_allies = participant.get('totalHealsOnTeammates', 0)
-                shielding_allies = participant.get('totalDamageShieldedOnTeammates', 0)
-                healing_shielding_allies_per_min = (healing_allies + shielding_allies) / game_duration_minutes
-                
-                # Get other stats
-                role = self.role_mapping.get(participant['teamPosition'], 0)
-                win_loss = 1 if participant['win'] else 0
+                f = dict(zip(FEATURE_ORDER, values.tolist()))
                 
                 # Create row
                 row = {
                     'match_id': match_id,
                     'summoner_name': participant['summonerName'],
-                    'role': role,
+                    'role': self.role_mapping.get(participant['teamPosition'], 0),
                     'champion': participant['championName'],
                     'game_length_mins': round(game_duration_minutes, 1),
-                    'kda': round(kda, 2),
-                    'dmg_to_champions_per_min': round(dmg_to_champions_per_min, 1),
-                    'team_damage_share': team_shares['team_damage_share'],
-                    'team_gold_share': team_shares['team_gold_share'],
-                    'gold_diff_15': gold_diff_15,
-                    'exp_diff_15': exp_diff_15,
-                    'kill_participation': kill_participation,
-                    'objective_damage_per_min': round(objective_damage_per_min, 1),
-                    'team_objective_damage_share': team_shares['team_objective_damage_share'],
-                    'vision_score_per_min': round(vision_score_per_min, 2),
-                    'team_vision_score_share': team_shares['team_vision_score_share'],
-                    'gold_diff_per_min': round(gold_diff_per_min, 1),
-                    'exp_diff_per_min': round(exp_diff_per_min, 1),
-                    'damage_taken_per_min': round(damage_taken_per_min, 1),
-                    'damage_taken_share': team_shares['damage_taken_share'],
-                    'healing_shielding_allies_per_min': round(healing_shielding_allies_per_min, 1),
-                    'win_loss': win_loss
+                    'kda': round(f['kda'], 2),
+                    'dmg_to_champions_per_min': round(f['dmg_to_champions_per_min'], 1),
+                    'team_damage_share': round(f['team_damage_share'], 1),
+                    'team_gold_share': round(f['team_gold_share'], 1),
+                    'gold_diff_15': int(f['gold_diff_15']),
+                    'exp_diff_15': int(f['exp_diff_15']),
+                    'kill_participation': f['kill_participation'],
+                    'objective_damage_per_min': round(f['objective_damage_per_min'], 1),
+                    'team_objective_damage_share': round(f['team_objective_damage_share'], 1),
+                    'vision_score_per_min': round(f['vision_score_per_min'], 2),
+                    'team_vision_score_share': round(f['team_vision_score_share'], 1),
+                    'gold_diff_per_min': round(f['gold_diff_per_min'], 1),
+                    'exp_diff_per_min': round(f['exp_diff_per_min'], 1),
+                    'damage_taken_per_min': round(f['damage_taken_per_min'], 1),
+                    'damage_taken_share': round(f['damage_taken_share'], 1),
+                    'healing_shielding_allies_per_min': round(f['healing_shielding_allies_per_min'], 1),
+                    'win_loss': int(f['win_loss'])
                 }
                 
                 match_rows.append(row)
             
-            return match_rows
+            return match_rows, [p['puuid'] for p in match_data['info']['participants']]
             
         except Exception as e:
+            # Not checkpointed, so the match is retried on the next run
             print(f"Error processing match {match_id}: {e}")
-            return []
+            return None
 
-    def collect_data_for_summoner(self, summoner_name, games_per_summoner=100):
-        """Collect data for a specific summoner"""
+    async def resolve_seed(self, session, summoner_name):
+        """Seed Riot ID -> PUUID, or None if the lookup fails"""
         try:
-            print(f"\nProcessing summoner: {summoner_name}")
-            
-            # Get account info
-            game_name, tag_line = summoner_name.split('#')
-            account_data = self.get_account_by_riot_id(game_name, tag_line)
-            puuid = account_data['puuid']
-            
-            # Get match history
-            match_ids = self.get_match_history(puuid, games_per_summoner)
-            print(f"Found {len(match_ids)} matches for {summoner_name}")
-            
-            all_data = []
-            
-            for i, match_id in enumerate(match_ids):
-                print(f"Processing match {i+1}/{len(match_ids)}")
-                
-                match_data = self.process_match(match_id)
-                all_data.extend(match_data)
-                
-                # Rate limiting
-                if i % 10 == 0:
-                    time.sleep(2)
-            
-            return all_data
-            
+            # Cached PUUID lookup
+            return await resolve_puuid(session, summoner_name, self.headers)
         except Exception as e:
             print(f"Error processing summoner {summoner_name}: {e}")
-            return []
+            return None
 
-    def collect_all_data(self, summoner_names, games_per_summoner=100):
-        """Collect data for all summoners and save to CSV in batches"""
-        all_data = []
-        batch_size = 10
-        
-        for batch_num in range(0, len(summoner_names), batch_size):
-            batch_summoners = summoner_names[batch_num:batch_num + batch_size]
-            batch_data = []
-            
-            print(f"\n{'='*50}")
-            print(f"Processing batch {batch_num//batch_size + 1} - Summoners {batch_num+1} to {min(batch_num+batch_size, len(summoner_names))}")
-            print(f"{'='*50}")
-            
-            # Process each summoner in the batch
-            for i, summoner_name in enumerate(batch_summoners):
-                summoner_data = self.collect_data_for_summoner(summoner_name, games_per_summoner)
-                batch_data.extend(summoner_data)
-                all_data.extend(summoner_data)
-                
-                print(f"Collected {len(summoner_data)} data points for {summoner_name}")
-                print(f"Batch total: {len(batch_data)} | Overall total: {len(all_data)}")
-            
-            # Save batch to CSV
-            if batch_data:
-                batch_filename = f"lol_ai_batch_{batch_num//batch_size + 1}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-                
-                fieldnames = [
-                    'match_id', 'summoner_name', 'role', 'champion', 'game_length_mins',
-                    'kda', 'dmg_to_champions_per_min', 'team_damage_share', 'team_gold_share',
-                    'gold_diff_15', 'exp_diff_15', 'kill_participation',
-                    'objective_damage_per_min', 'team_objective_damage_share',
-                    'vision_score_per_min', 'team_vision_score_share',
-                    'gold_diff_per_min', 'exp_diff_per_min',
-                    'damage_taken_per_min', 'damage_taken_share',
-                    'healing_shielding_allies_per_min', 'win_loss'
-                ]
-                
-                with open(batch_filename, 'w', newline='', encoding='utf-8') as csvfile:
-                    writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                    writer.writeheader()
-                    writer.writerows(batch_data)
-                
-                print(f"\n✅ Batch {batch_num//batch_size + 1} saved to {batch_filename}")
-                print(f"   Batch rows: {len(batch_data)}")
-                print(f"   Total progress: {len(all_data)} rows")
-        
-        # Save final combined CSV
-        if all_data:
-            final_filename = f"lol_ai_data_FINAL_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-            
-            fieldnames = [
-                'match_id', 'summoner_name', 'role', 'champion', 'game_length_mins',
-                'kda', 'dmg_to_champions_per_min', 'team_damage_share', 'team_gold_share',
-                'gold_diff_15', 'exp_diff_15', 'kill_participation',
-                'objective_damage_per_min', 'team_objective_damage_share',
-                'vision_score_per_min', 'team_vision_score_share',
-                'gold_diff_per_min', 'exp_diff_per_min',
-                'damage_taken_per_min', 'damage_taken_share',
-                'healing_shielding_allies_per_min', 'win_loss'
-            ]
-            
-            with open(final_filename, 'w', newline='', encoding='utf-8') as csvfile:
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                writer.writeheader()
-                writer.writerows(all_data)
-            
-            print(f"\n🎉 FINAL DATA saved to {final_filename}")
-            print(f"   Total rows: {len(all_data)}")
-        
-        return all_data
+    async def get_player_match_ids(self, session, puuid, games_per_player=100):
+        """A player's match ids, or None if the lookup fails"""
+        try:
+            return await self.get_match_history(session, puuid, games_per_player)
+        except Exception as e:
+            print(f"Error fetching match history for {puuid}: {e}")
+            return None
+
+    async def collect_all_data(self, summoner_names, games_per_summoner=100, output_path='lol_ai_data.csv',
+                               max_matches=None):
+        """
+        Crawls matches into output_path, streaming each match's rows as it finishes.
+
+        The seed summoners are crawled first; after that, every collected match adds its
+        participants to a persistent frontier whose match histories are crawled in turn, until
+        max_matches new matches are collected or the frontier runs dry. The seen-match index in
+        the state directory next to output_path means a match is fetched and emitted once across
+        all runs (each yields all 10 participants), and re-running resumes after the last
+        checkpointed match.
+        """
+        store = CheckpointedCSV(output_path)
+        frontier = CrawlFrontier(state_dir_for(output_path))
+        progress = {'done': 0, 'failed': 0, 'players_crawled': 0}
+        try:
+            async with aiohttp.ClientSession() as session:
+                seeds = await asyncio.gather(*[self.resolve_seed(session, name) for name in summoner_names])
+                for puuid in reversed([p for p in seeds if p]):
+                    frontier.prioritize(puuid)
+                print(f"\n{len(store.done)} matches already collected; frontier holds {len(frontier.queue)} players.")
+
+                match_queue = deque()
+                queued = set()
+                busy = [0]  # workers currently waiting on Riot, who may still add work
+
+                def finished():
+                    return max_matches is not None and progress['done'] >= max_matches
+
+                async def worker():
+                    while not finished():
+                        # Collect queued matches before crawling more players, so the queue stays short
+                        if match_queue:
+                            match_id = match_queue.popleft()
+                            busy[0] += 1
+                            try:
+                                result = await self.process_match(session, match_id)
+                            finally:
+                                busy[0] -= 1
+                            if result is None:
+                                progress['failed'] += 1
+                                continue
+                            rows, participant_puuids = result
+                            store.record(match_id, rows)
+                            frontier.add(participant_puuids)
+                            progress['done'] += 1
+                            if progress['done'] % 25 == 0:
+                                print(f"Progress: {progress['done']} matches | {store.rows_written} rows written | "
+                                      f"{progress['players_crawled']} players crawled | {len(frontier.queue)} in frontier")
+                        elif frontier.queue:
+                            puuid = frontier.pop()
+                            busy[0] += 1
+                            try:
+                                match_ids = await self.get_player_match_ids(session, puuid, games_per_summoner)
+                            finally:
+                                busy[0] -= 1
+                            if match_ids is None:
+                                continue
+                            frontier.mark_crawled(puuid)
+                            progress['players_crawled'] += 1
+                            for match_id in match_ids:
+                                if match_id not in store.done and match_id not in queued:
+                                    queued.add(match_id)
+                                    match_queue.append(match_id)
+                        elif busy[0]:
+                            await asyncio.sleep(0.5)
+                        else:
+                            return
+
+                await asyncio.gather(*[worker() for _ in range(MAX_CONCURRENT_MATCHES)])
+        finally:
+            store.close()
+            frontier.close()
+
+        print(f"\n🎉 DATA saved to {output_path}")
+        print(f"   Matches collected this run: {progress['done']} | failed (retried next run): {progress['failed']}")
+        print(f"   Players crawled: {progress['players_crawled']} | still in frontier: {len(frontier.queue)}")
+        print(f"   Rows written this run: {store.rows_written}")
+        return store.rows_written
 
 if __name__ == "__main__":
     collector = AIDataCollector()
@@ -498,7 +483,11 @@ if __name__ == "__main__":
         "Linuz#Hello"
     ]
     
-    # Collect data (100 games per summoner = 1000 games total)
-    data = collector.collect_all_data(summoner_names, games_per_summoner=100)
+    # Collect data (100 games per player), crawling outwards from the seeds; re-run to resume after a crash
+    # Usage: python datafarmer.py [output.csv] [max_new_matches]
+    output_path = sys.argv[1] if len(sys.argv) > 1 else 'lol_ai_data.csv'
+    max_matches = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    rows_written = asyncio.run(collector.collect_all_data(summoner_names, games_per_summoner=100,
+                                                          output_path=output_path, max_matches=max_matches))
     
-    print(f"\nData collection complete! Total data points: {len(data)}")
\ No newline at end of file
+    print(f"\nData collection complete! Data points written this run: {rows_written}")
\ No newline at end of file
@@ -0,0 +1,92 @@
+import math
+from datetime import timedelta
+
+# Rollup resolutions kept in stock_candles, finest first
+RESOLUTIONS = {
+    '15m': timedelta(minutes=15),
+    '1h': timedelta(hours=1),
+    '1d': timedelta(days=1),
+}
+# Buckets returned per request, whatever the period or the amount of history
+MAX_CANDLES = 200
+# Every bucket, stored or regrouped, is aligned to this origin
+CANDLE_ORIGIN = '2000-01-01 00:00:00+00'
+_RESOLUTION_ROWS = ', '.join(f"('{name}', INTERVAL '{int(width.total_seconds())} seconds')" for name, width in RESOLUTIONS.items())
+
+# Folds prices into their bucket at every resolution. {prices} is a VALUES list or a
+# query yielding (market_player_id, market_id, price, at).
+CANDLE_UPSERT_SQL = f"""
+    INSERT INTO stock_candles
+        (market_player_id, market_id, resolution, bucket_start, open, high, low, close, open_at, close_at, samples)
+    SELECT p.market_player_id, p.market_id, r.resolution,
+           date_bin(r.width, p.at, TIMESTAMPTZ '{CANDLE_ORIGIN}'),
+           p.price, p.price, p.price, p.price, p.at, p.at, 1
+    FROM ({{prices}}) AS p(market_player_id, market_id, price, at)
+    CROSS JOIN (VALUES {_RESOLUTION_ROWS}) AS r(resolution, width)
+    ON CONFLICT (market_player_id, resolution, bucket_start) DO UPDATE SET
+        open = CASE WHEN EXCLUDED.open_at < stock_candles.open_at THEN EXCLUDED.open ELSE stock_candles.open END,
+        open_at = LEAST(stock_candles.open_at, EXCLUDED.open_at),
+        high = GREATEST(stock_candles.high, EXCLUDED.high),
+        low = LEAST(stock_candles.low, EXCLUDED.low),
+        close = CASE WHEN EXCLUDED.close_at >= stock_candles.close_at THEN EXCLUDED.close ELSE stock_candles.close END,
+        close_at = GREATEST(stock_candles.close_at, EXCLUDED.close_at),
+        samples = stock_candles.samples + 1
+"""
+
+# Recomputes a market's candles from stock_values, for writes that rewrite history (price replays)
+CANDLE_REBUILD_SQL = f"""
+    DELETE FROM stock_candles WHERE market_id = %(market_id)s;
+    INSERT INTO stock_candles
+        (market_player_id, market_id, resolution, bucket_start, open, high, low, close, open_at, close_at, samples)
+    SELECT sv.market_player_id, sv.market_id, r.resolution,
+           date_bin(r.width, sv.timestamp, TIMESTAMPTZ '{CANDLE_ORIGIN}') AS bucket_start,
+           (array_agg(sv.stock_value ORDER BY sv.timestamp ASC))[1],
+           MAX(sv.stock_value), MIN(sv.stock_value),
+           (array_agg(sv.stock_value ORDER BY sv.timestamp DESC))[1],
+           MIN(sv.timestamp), MAX(sv.timestamp), COUNT(*)
+    FROM stock_values sv
+    CROSS JOIN (VALUES {_RESOLUTION_ROWS}) AS r(resolution, width)
+    WHERE sv.market_id = %(market_id)s
+    GROUP BY sv.market_player_id, sv.market_id, r.resolution, 4;
+"""
+
+# A player's buckets of %(width)s since %(start_date)s, regrouped from the stored
+# %(resolution)s rollup (width is a whole multiple of it, on the same date_bin origin).
+# The first bucket's open and the last bucket's close become the regrouped candle's.
+CANDLES_SQL = f"""
+    SELECT
+        date_bin(%(width)s, c.bucket_start, TIMESTAMPTZ '{CANDLE_ORIGIN}') AS bucket_start,
+        (array_agg(c.open ORDER BY c.bucket_start ASC))[1] AS open,
+        MAX(c.high) AS high,
+        MIN(c.low) AS low,
+        (array_agg(c.close ORDER BY c.bucket_start DESC))[1] AS close,
+        SUM(c.samples) AS samples
+    FROM stock_candles c
+    JOIN market_players mp ON mp.id = c.market_player_id
+    WHERE mp.market_id = %(market_id)s AND mp.player_tag = %(player_tag)s
+      AND c.resolution = %(resolution)s AND c.bucket_start >= %(start_date)s
+    GROUP BY 1
+    ORDER BY 1
+"""
+
+# Where a player's daily candles begin, for the "all" period
+FIRST_CANDLE_SQL = """
+    SELECT MIN(c.bucket_start) AS first_at
+    FROM stock_candles c
+    JOIN market_players mp ON mp.id = c.market_player_id
+    WHERE mp.market_id = %(market_id)s AND mp.player_tag = %(player_tag)s AND c.resolution = '1d'
+"""
+
+
+def candle_layout(start, end):
+    """
+    The stored resolution to read and the bucket width to return for [start, end]: the
+    finest resolution that fits in MAX_CANDLES buckets, else whole days regrouped so
+    that it does.
+    """
+    span = max(end - start, timedelta(0))
+    for name, width in RESOLUTIONS.items():
+        if span / width <= MAX_CANDLES:
+            return name, width
+    days = math.ceil(span / (RESOLUTIONS['1d'] * MAX_CANDLES))
+    return '1d', timedelta(days=days)
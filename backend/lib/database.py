@@ -1,6 +1,15 @@
+import asyncio
 import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
 import psycopg2
+from psycopg2 import extensions
 from psycopg2.extras import RealDictCursor
+from psycopg.rows import dict_row
+from psycopg.types.string import TextLoader
+from psycopg_pool import AsyncConnectionPool
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -8,6 +17,18 @@ load_dotenv()
 # Get connection string from environment variables
 DATABASE_URL = os.environ.get('DATABASE_URL')
 
+# --- Pool Configuration ---
+DB_POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', 1))
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', 10))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 30))            # seconds to wait for a free connection
+DB_POOL_MAX_LIFETIME = float(os.environ.get('DB_POOL_MAX_LIFETIME', 1800)) # recycle connections after 30 minutes
+DB_POOL_MAX_IDLE = float(os.environ.get('DB_POOL_MAX_IDLE', 300))         # close connections idle for 5 minutes
+DB_POOL_CHECK_AFTER = float(os.environ.get('DB_POOL_CHECK_AFTER', 30))    # health-check sync connections idle this long
+
+# Advisory lock namespace for transactions that write a market's price series (the
+# tracker's flush, a price replay, a new listing's IPO price); the second key is the market id
+MARKET_PRICES_LOCK = 7_301_015
+
 def get_connection():
     """Get a PostgreSQL connection using connection string"""
     return psycopg2.connect(DATABASE_URL)
@@ -16,4 +37,311 @@ def get_dict_connection():
     """Get a PostgreSQL connection that returns results as dictionaries"""
     conn = get_connection()
     conn.cursor_factory = RealDictCursor
-    return conn
\ No newline at end of file
+    return conn
+
+
+def lock_market_prices(cursor, market_id):
+    """Waits until no other transaction is writing this market's prices; held until commit or rollback."""
+    cursor.execute("SELECT pg_advisory_xact_lock(%s, %s)", (MARKET_PRICES_LOCK, market_id))
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection becomes available within the timeout."""
+
+
+class SyncConnectionPool:
+    """
+    A bounded, thread-safe pool of psycopg2 connections.
+
+    Connections are handed out LIFO so the hottest ones stay warm, health-checked
+    when they have been idle for a while, recycled once they exceed max_lifetime
+    and closed when they sit unused for longer than max_idle.
+    """
+
+    def __init__(self, dsn, min_size=DB_POOL_MIN_SIZE, max_size=DB_POOL_MAX_SIZE, timeout=DB_POOL_TIMEOUT,
+                 max_lifetime=DB_POOL_MAX_LIFETIME, max_idle=DB_POOL_MAX_IDLE, check_after=DB_POOL_CHECK_AFTER):
+        if max_size < 1 or min_size > max_size:
+            raise ValueError("Pool sizes must satisfy 0 <= min_size <= max_size and max_size >= 1")
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.max_idle = max_idle
+        self.check_after = check_after
+
+        self._cond = threading.Condition()
+        self._idle = deque()   # (conn, created_at, last_used_at)
+        self._in_use = {}      # id(conn) -> created_at
+        self._connecting = 0
+        self._closed = False
+        self._stats = {
+            'connections_opened': 0,
+            'connections_closed': 0,
+            'connections_expired': 0,
+            'connections_idle_evicted': 0,
+            'health_check_failures': 0,
+            'requests': 0,
+            'requests_waited': 0,
+            'requests_timed_out': 0,
+            'wait_time_ms': 0.0,
+        }
+
+    # --- Connection lifecycle helpers ---
+    def _connect(self):
+        conn = psycopg2.connect(self.dsn)
+        with self._cond:
+            self._stats['connections_opened'] += 1
+        return conn
+
+    def _discard(self, conn, reason=None):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._stats['connections_closed'] += 1
+            if reason:
+                self._stats[reason] += 1
+
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+        try:
+            with conn.cursor() as c:
+                c.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _evict_idle_locked(self, now):
+        """Drops idle connections past max_idle / max_lifetime. Caller holds the lock."""
+        keep = deque()
+        evicted = []
+        # The oldest idle connections are at the left end of the deque.
+        while self._idle:
+            conn, created_at, last_used = self._idle.popleft()
+            total = len(keep) + len(self._idle) + len(self._in_use)
+            if now - created_at > self.max_lifetime:
+                evicted.append((conn, 'connections_expired'))
+            elif now - last_used > self.max_idle and total >= self.min_size:
+                evicted.append((conn, 'connections_idle_evicted'))
+            else:
+                keep.append((conn, created_at, last_used))
+        self._idle = keep
+        return evicted
+
+    # --- Public API ---
+    def getconn(self, timeout=None):
+        """Borrows a connection, blocking up to `timeout` seconds if the pool is exhausted."""
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        waited = False
+        with self._cond:
+            self._stats['requests'] += 1
+
+        while True:
+            conn = None
+            evicted = []
+            try:
+                with self._cond:
+                    while True:
+                        if self._closed:
+                            raise PoolTimeout("Connection pool is closed")
+                        now = time.monotonic()
+                        evicted.extend(self._evict_idle_locked(now))
+                        if self._idle:
+                            conn, created_at, last_used = self._idle.pop()
+                            self._in_use[id(conn)] = created_at
+                            break
+                        if len(self._in_use) + self._connecting < self.max_size:
+                            self._connecting += 1
+                            break
+                        remaining = deadline - now
+                        if remaining <= 0:
+                            self._stats['requests_timed_out'] += 1
+                            raise PoolTimeout(f"No database connection available after {timeout:.1f}s")
+                        if not waited:
+                            self._stats['requests_waited'] += 1
+                            waited = True
+                        self._cond.wait(remaining)
+            finally:
+                for stale, reason in evicted:
+                    self._discard(stale, reason)
+
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._connecting -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    # Swap the reserved slot for the real connection under one lock
+                    self._connecting -= 1
+                    self._in_use[id(conn)] = time.monotonic()
+                    self._stats['wait_time_ms'] += (time.monotonic() - started) * 1000
+                return conn
+            elif now - last_used > self.check_after and not self._is_healthy(conn):
+                self._discard(conn)
+                with self._cond:
+                    del self._in_use[id(conn)]
+                    self._stats['health_check_failures'] += 1
+                continue
+
+            with self._cond:
+                self._stats['wait_time_ms'] += (time.monotonic() - started) * 1000
+            return conn
+
+    def putconn(self, conn, discard=False):
+        """Returns a borrowed connection, rolling back any open transaction."""
+        with self._cond:
+            created_at = self._in_use.get(id(conn))
+        if created_at is None:
+            raise ValueError("Connection does not belong to this pool")
+
+        # The connection stays counted as in-use until it is either idle again or closed,
+        # so a waiting thread can never open a connection beyond max_size in between.
+        expired = time.monotonic() - created_at > self.max_lifetime
+        if not (discard or expired or conn.closed or self._closed):
+            try:
+                if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+                conn.cursor_factory = None
+            except Exception:
+                discard = True
+
+        if discard or expired or conn.closed or self._closed:
+            self._discard(conn, 'connections_expired' if expired else None)
+            with self._cond:
+                del self._in_use[id(conn)]
+                self._cond.notify()
+            return
+
+        with self._cond:
+            del self._in_use[id(conn)]
+            self._idle.append((conn, created_at, time.monotonic()))
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = list(self._idle), deque()
+            self._cond.notify_all()
+        for conn, _, _ in idle:
+            self._discard(conn)
+
+    def get_stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                'pool_min': self.min_size,
+                'pool_max': self.max_size,
+                'pool_size': len(self._idle) + len(self._in_use) + self._connecting,
+                'pool_available': len(self._idle),
+                'pool_in_use': len(self._in_use),
+            })
+        return stats
+
+
+# --- Shared pools ---
+_sync_pool = None
+_sync_pool_lock = threading.Lock()
+_async_pool = None
+# Created on first use, so it belongs to the event loop that opens the pool
+_async_pool_lock = None
+
+def get_sync_pool():
+    """Returns the process-wide sync pool, creating it on first use."""
+    global _sync_pool
+    if _sync_pool is None:
+        with _sync_pool_lock:
+            if _sync_pool is None:
+                _sync_pool = SyncConnectionPool(DATABASE_URL)
+    return _sync_pool
+
+@contextmanager
+def db_connection(dict_rows=False):
+    """
+    Borrows a pooled connection for the duration of the block.
+    Work that is not committed by the caller is rolled back when the connection is returned.
+    """
+    pool = get_sync_pool()
+    conn = pool.getconn()
+    broken = False
+    try:
+        conn.cursor_factory = RealDictCursor if dict_rows else None
+        yield conn
+    except psycopg2.InterfaceError:
+        broken = True
+        raise
+    except Exception:
+        try:
+            conn.rollback()
+        except Exception:
+            broken = True
+        raise
+    finally:
+        pool.putconn(conn, discard=broken)
+
+async def _configure_async_connection(conn):
+    # psycopg2 hands back UUID columns as str; the routes compare and serialize them as such
+    conn.adapters.register_loader('uuid', TextLoader)
+
+async def open_async_pool():
+    """Opens the process-wide async pool (psycopg 3). Safe to call more than once, concurrently too."""
+    global _async_pool, _async_pool_lock
+    if _async_pool is None:
+        if _async_pool_lock is None:
+            _async_pool_lock = asyncio.Lock()
+        async with _async_pool_lock:
+            if _async_pool is None:
+                # No per-checkout health check: it costs a round-trip on every request. Stale
+                # connections are recycled by max_idle/max_lifetime, and one that breaks in use
+                # is discarded when it is returned, with the pool reconnecting in the background.
+                pool = AsyncConnectionPool(
+                    conninfo=DATABASE_URL,
+                    min_size=DB_POOL_MIN_SIZE,
+                    max_size=DB_POOL_MAX_SIZE,
+                    timeout=DB_POOL_TIMEOUT,
+                    max_lifetime=DB_POOL_MAX_LIFETIME,
+                    max_idle=DB_POOL_MAX_IDLE,
+                    configure=_configure_async_connection,
+                    # prepare_threshold=None keeps us compatible with pgbouncer in transaction mode
+                    kwargs={'row_factory': dict_row, 'prepare_threshold': None},
+                    open=False,
+                )
+                await pool.open()
+                _async_pool = pool
+    return _async_pool
+
+@asynccontextmanager
+async def async_db_connection():
+    """
+    Borrows a connection from the async pool. The transaction is committed when the
+    block exits normally and rolled back if it raises.
+    """
+    pool = await open_async_pool()
+    async with pool.connection() as conn:
+        yield conn
+
+async def close_pools():
+    global _sync_pool, _async_pool, _async_pool_lock
+    if _async_pool is not None:
+        await _async_pool.close()
+        _async_pool = None
+    _async_pool_lock = None
+    with _sync_pool_lock:
+        if _sync_pool is not None:
+            _sync_pool.close()
+            _sync_pool = None
+
+def pool_stats():
+    """Pool-level counters for both pools, suitable for a health endpoint."""
+    return {
+        'sync': _sync_pool.get_stats() if _sync_pool else None,
+        'async': _async_pool.get_stats() if _async_pool else None,
+    }
@@ -0,0 +1,115 @@
+import numpy as np
+
+# The model inputs, in the column order every role model was trained on
+FEATURE_ORDER = [
+    'kda',
+    'kill_participation',
+    'team_damage_share',
+    'team_gold_share',
+    'win_loss',
+    'dmg_to_champions_per_min',
+    'gold_diff_15',
+    'exp_diff_15',
+    'objective_damage_per_min',
+    'team_objective_damage_share',
+    'vision_score_per_min',
+    'team_vision_score_share',
+    'damage_taken_per_min',
+    'damage_taken_share',
+    'healing_shielding_allies_per_min',
+    'gold_diff_per_min',
+    'exp_diff_per_min'
+]
+
+FIFTEEN_MINUTES_MS = 900000
+
+# Per-participant fields read from the match-v5 details payload, in one pass
+STAT_FIELDS = [
+    'kills', 'deaths', 'assists', 'totalDamageDealtToChampions', 'goldEarned', 'damageDealtToObjectives',
+    'visionScore', 'totalDamageTaken', 'totalHealsOnTeammates', 'totalDamageShieldedOnTeammates',
+    'champExperience', 'win',
+]
+(KILLS, DEATHS, ASSISTS, DAMAGE, GOLD, OBJECTIVE_DAMAGE, VISION, DAMAGE_TAKEN, HEALS, SHIELDS,
+ EXPERIENCE, WIN) = range(len(STAT_FIELDS))
+
+
+def participant_index(match_data, puuid):
+    """Row of `puuid` in the feature matrix, or None if they did not play in the match."""
+    return next((i for i, p in enumerate(match_data['info']['participants']) if p['puuid'] == puuid), None)
+
+
+def frame_at_15(timeline_data):
+    """The first timeline frame at or after 15:00, or None for shorter games."""
+    if not timeline_data:
+        return None
+    return next((f for f in timeline_data['info']['frames'] if f['timestamp'] >= FIFTEEN_MINUTES_MS), None)
+
+
+def extract_match_features(match_data, timeline_data=None):
+    """
+    Features for every participant of a match: an (n_participants x 17) float64 matrix with
+    columns in FEATURE_ORDER and rows in match_data['info']['participants'] order.
+
+    Team totals come from one team-membership matrix product and lane opponents (same
+    teamPosition, other team) from one position comparison, instead of a loop per player.
+    Without a timeline, or without an opponent, gold_diff_15 and exp_diff_15 are 0.
+
+    kill_participation is takedowns over the sum of the team's participants' kills, as the
+    tracker always computed it. Before this module the data farmer divided by
+    teams[].objectives.champion.kills instead, so training rows farmed earlier used that
+    count; it is the same number whenever every champion kill is credited to a participant.
+    """
+    info = match_data['info']
+    participants = info['participants']
+    minutes = info.get('gameDuration', 0) / 60.0
+    if minutes <= 0:
+        raise ValueError(f"Match {match_data['metadata']['matchId']} has no duration")
+
+    stats = np.array([[float(p.get(field, 0) or 0) for field in STAT_FIELDS] for p in participants])
+    teams = np.array([p['teamId'] for p in participants])
+    positions = np.array([p.get('teamPosition') or '' for p in participants])
+
+    same_team = teams[:, None] == teams[None, :]
+    team_totals = np.maximum(same_team.astype(np.float64) @ stats, 1.0)
+
+    lane_opponent = (positions[:, None] == positions[None, :]) & ~same_team & (positions != '')[:, None]
+    has_opponent = lane_opponent.any(axis=1)
+    opponent = lane_opponent.argmax(axis=1)
+
+    def vs_opponent(values):
+        return np.where(has_opponent, values - values[opponent], 0.0)
+
+    gold_diff_15 = exp_diff_15 = np.zeros(len(participants))
+    frame = frame_at_15(timeline_data)
+    if frame is not None:
+        try:
+            at_15 = np.array([
+                [frame['participantFrames'][str(p['participantId'])]['totalGold'],
+                 frame['participantFrames'][str(p['participantId'])]['xp']]
+                for p in participants
+            ], dtype=np.float64)
+            gold_diff_15, exp_diff_15 = vs_opponent(at_15[:, 0]), vs_opponent(at_15[:, 1])
+        except KeyError:
+            print(f"Warning: Could not find timeline frame data at 15 mins for match {match_data['metadata']['matchId']}.")
+
+    takedowns = stats[:, KILLS] + stats[:, ASSISTS]
+    columns = {
+        'kda': takedowns / np.maximum(stats[:, DEATHS], 1.0),
+        'kill_participation': takedowns / team_totals[:, KILLS] * 100,
+        'team_damage_share': stats[:, DAMAGE] / team_totals[:, DAMAGE] * 100,
+        'team_gold_share': stats[:, GOLD] / team_totals[:, GOLD] * 100,
+        'win_loss': stats[:, WIN],
+        'dmg_to_champions_per_min': stats[:, DAMAGE] / minutes,
+        'gold_diff_15': gold_diff_15,
+        'exp_diff_15': exp_diff_15,
+        'objective_damage_per_min': stats[:, OBJECTIVE_DAMAGE] / minutes,
+        'team_objective_damage_share': stats[:, OBJECTIVE_DAMAGE] / team_totals[:, OBJECTIVE_DAMAGE] * 100,
+        'vision_score_per_min': stats[:, VISION] / minutes,
+        'team_vision_score_share': stats[:, VISION] / team_totals[:, VISION] * 100,
+        'damage_taken_per_min': stats[:, DAMAGE_TAKEN] / minutes,
+        'damage_taken_share': stats[:, DAMAGE_TAKEN] / team_totals[:, DAMAGE_TAKEN] * 100,
+        'healing_shielding_allies_per_min': (stats[:, HEALS] + stats[:, SHIELDS]) / minutes,
+        'gold_diff_per_min': vs_opponent(stats[:, GOLD]) / minutes,
+        'exp_diff_per_min': vs_opponent(stats[:, EXPERIENCE]) / minutes,
+    }
+    return np.column_stack([columns[name] for name in FEATURE_ORDER])
@@ -0,0 +1,344 @@
+"""
+Async data-access layer for the API.
+
+Every function takes a psycopg 3 AsyncConnection borrowed from
+lib.database.async_db_connection() and returns plain dicts, so the FastAPI
+routes never touch cursors or block the event loop. Transactions are owned by
+the caller: the connection context commits on success and rolls back on error.
+
+The SQL of the hot queries, the tracker's included, lives in *_SQL constants so the plan
+check (python -m lib.migrations check-plans) EXPLAINs exactly what runs.
+"""
+from lib.candles import CANDLE_UPSERT_SQL, CANDLES_SQL, FIRST_CANDLE_SQL
+from lib.database import MARKET_PRICES_LOCK
+from lib.price_anchors import ANCHOR_PRICE_SQL
+
+# --- Profiles & Tiers ---
+async def get_user_tier_and_market_count(conn, user_id):
+    cur = await conn.execute("""
+        SELECT
+            p.subscription_tier,
+            (SELECT COUNT(*) FROM market_members WHERE user_id = p.id) as market_count
+        FROM profiles p WHERE id = %s
+    """, (user_id,))
+    return await cur.fetchone()
+
+async def get_user_tier(conn, user_id):
+    cur = await conn.execute("SELECT subscription_tier FROM profiles WHERE id = %s", (user_id,))
+    profile = await cur.fetchone()
+    return profile['subscription_tier'] if profile else 'free'
+
+async def fetch_user_profile(conn, user_id):
+    cur = await conn.execute("SELECT id, username, subscription_tier FROM profiles WHERE id = %s", (user_id,))
+    return await cur.fetchone()
+
+
+# --- Markets ---
+async def get_market_refresh_state(conn, market_id):
+    cur = await conn.execute("SELECT last_refreshed_at, tier FROM markets WHERE id = %s", (market_id,))
+    return await cur.fetchone()
+
+async def touch_market_refreshed(conn, market_id, refreshed_at):
+    await conn.execute("UPDATE markets SET last_refreshed_at = %s WHERE id = %s", (refreshed_at, market_id))
+
+async def invite_code_exists(conn, invite_code):
+    cur = await conn.execute("SELECT 1 FROM markets WHERE invite_code = %s", (invite_code,))
+    return await cur.fetchone() is not None
+
+async def insert_market(conn, name, creator_id, invite_code):
+    cur = await conn.execute("INSERT INTO markets (name, creator_id, invite_code) VALUES (%s, %s, %s) RETURNING id",
+                             (name, creator_id, invite_code))
+    return (await cur.fetchone())['id']
+
+async def get_market_by_invite_code(conn, invite_code):
+    cur = await conn.execute("SELECT id, player_limit FROM markets WHERE invite_code = %s", (invite_code,))
+    return await cur.fetchone()
+
+async def get_market_creator(conn, market_id):
+    """Returns the creator's user id, or None if the market does not exist."""
+    cur = await conn.execute("SELECT creator_id FROM markets WHERE id = %s", (market_id,))
+    market = await cur.fetchone()
+    return market['creator_id'] if market else None
+
+async def delete_market(conn, market_id):
+    # ON DELETE CASCADE rules take care of players, prices and members
+    await conn.execute("DELETE FROM markets WHERE id = %s", (market_id,))
+
+async def fetch_market(conn, market_id):
+    cur = await conn.execute("SELECT * FROM markets WHERE id = %s", (market_id,))
+    return await cur.fetchone()
+
+async def fetch_user_markets(conn, user_id):
+    cur = await conn.execute("""
+        SELECT
+            m.id,
+            m.name,
+            m.creator_id,
+            CASE WHEN m.creator_id = %s THEN m.invite_code ELSE NULL END as invite_code,
+            (SELECT COUNT(*) FROM market_members WHERE market_id = m.id) as member_count
+        FROM markets m
+        JOIN market_members mm ON m.id = mm.market_id
+        WHERE mm.user_id = %s
+    """, (user_id, user_id))
+    return await cur.fetchall()
+
+
+# --- Market Members ---
+async def add_market_member(conn, market_id, user_id):
+    await conn.execute("INSERT INTO market_members (market_id, user_id) VALUES (%s, %s)", (market_id, user_id))
+
+async def is_market_member(conn, market_id, user_id):
+    cur = await conn.execute("SELECT 1 FROM market_members WHERE market_id = %s AND user_id = %s", (market_id, user_id))
+    return await cur.fetchone() is not None
+
+async def count_market_members(conn, market_id):
+    cur = await conn.execute("SELECT COUNT(*) as member_count FROM market_members WHERE market_id = %s", (market_id,))
+    return (await cur.fetchone())['member_count']
+
+async def remove_market_member(conn, market_id, user_id):
+    """Deletes a membership and reports whether one existed."""
+    cur = await conn.execute("DELETE FROM market_members WHERE market_id = %s AND user_id = %s RETURNING *", (market_id, user_id))
+    return await cur.fetchone() is not None
+
+async def fetch_market_members(conn, market_id):
+    cur = await conn.execute("""
+        SELECT p.id, p.username
+        FROM profiles p
+        JOIN market_members mm ON p.id = mm.user_id
+        WHERE mm.market_id = %s
+    """, (market_id,))
+    return await cur.fetchall()
+
+
+# --- Market Players & Champion Pools ---
+async def count_player_listings(conn, player_tag):
+    cur = await conn.execute("SELECT COUNT(*) FROM market_players WHERE player_tag = %s", (player_tag,))
+    return (await cur.fetchone())['count']
+
+async def insert_market_player(conn, market_id, player_tag, listed_by_user_id, puuid=None):
+    cur = await conn.execute(
+        "INSERT INTO market_players (market_id, player_tag, listed_by_user_id, puuid) VALUES (%s, %s, %s, %s) RETURNING id",
+        (market_id, player_tag, listed_by_user_id, puuid)
+    )
+    return (await cur.fetchone())['id']
+
+async def get_player_market_id(conn, market_player_id):
+    """The market a listed player belongs to, or None if the listing does not exist."""
+    cur = await conn.execute("SELECT market_id FROM market_players WHERE id = %s", (market_player_id,))
+    player = await cur.fetchone()
+    return player['market_id'] if player else None
+
+async def delete_market_player(conn, market_player_id):
+    """Deletes a listing and returns its market id, or None if it did not exist."""
+    # ON DELETE CASCADE will handle deleting their champions
+    cur = await conn.execute("DELETE FROM market_players WHERE id = %s RETURNING market_id", (market_player_id,))
+    player = await cur.fetchone()
+    return player['market_id'] if player else None
+
+async def add_player_champion(conn, market_player_id, champion_name):
+    await conn.execute("INSERT INTO player_champions (market_player_id, champion_name) VALUES (%s, %s)",
+                       (market_player_id, champion_name))
+
+async def count_player_champions(conn, market_player_id):
+    cur = await conn.execute("SELECT COUNT(*) FROM player_champions WHERE market_player_id = %s", (market_player_id,))
+    return (await cur.fetchone())['count']
+
+async def delete_player_champion(conn, market_player_id, champion_name):
+    await conn.execute("DELETE FROM player_champions WHERE market_player_id = %s AND champion_name = %s",
+                       (market_player_id, champion_name))
+
+async def get_champion_limit(conn, market_player_id):
+    """The market's per-player champion limit alongside the player's current pool size."""
+    cur = await conn.execute("""
+        SELECT
+            m.champions_per_player_limit,
+            (SELECT COUNT(*) FROM player_champions WHERE market_player_id = %s) as current_champion_count
+        FROM market_players mp
+        JOIN markets m ON mp.market_id = m.id
+        WHERE mp.id = %s
+    """, (market_player_id, market_player_id))
+    return await cur.fetchone()
+
+async def fetch_market_players_with_champions(conn, market_id):
+    cur = await conn.execute("""
+        SELECT
+            mp.id,
+            mp.player_tag,
+            COALESCE(array_agg(pc.champion_name) FILTER (WHERE pc.champion_name IS NOT NULL), '{}') as champions
+        FROM market_players mp
+        LEFT JOIN player_champions pc ON mp.id = pc.market_player_id
+        WHERE mp.market_id = %s
+        GROUP BY mp.id, mp.player_tag
+    """, (market_id,))
+    return await cur.fetchall()
+
+
+# --- Prices & Scores ---
+async def insert_ipo_price(conn, market_id, market_player_id, player_tag, champion_name, price=10.0, model_score=5.0):
+    """Creates the initial "IPO" price entry for a newly listed player, with their latest-price summary and first candles."""
+    # Same lock as the tracker's flush and price replays (lib.database.lock_market_prices)
+    await conn.execute("SELECT pg_advisory_xact_lock(%s, %s)", (MARKET_PRICES_LOCK, market_id))
+    await conn.execute("""
+        INSERT INTO stock_values
+            (market_id, market_player_id, player_tag, stock_value, model_score, champion_played)
+        VALUES (%s, %s, %s, %s, %s, %s)
+    """, (market_id, market_player_id, player_tag, price, model_score, champion_name))
+    await conn.execute("""
+        INSERT INTO market_player_latest
+            (market_player_id, market_id, current_price, last_update, next_24h_at, next_7d_at)
+        VALUES (%s, %s, %s, NOW(), NOW() + INTERVAL '1 day', NOW() + INTERVAL '7 days')
+        ON CONFLICT (market_player_id) DO UPDATE SET
+            current_price = EXCLUDED.current_price,
+            last_update = EXCLUDED.last_update,
+            next_24h_at = COALESCE(market_player_latest.next_24h_at, EXCLUDED.next_24h_at),
+            next_7d_at = COALESCE(market_player_latest.next_7d_at, EXCLUDED.next_7d_at)
+    """, (market_player_id, market_id, price))
+    await conn.execute(CANDLE_UPSERT_SQL.format(prices='VALUES (%s, %s, %s::DOUBLE PRECISION, NOW())'),
+                       (market_player_id, market_id, price))
+
+# Every player in a market with their champion pool, current price and 24h/7d changes
+MARKET_STOCKS_SQL = f"""
+    WITH player_champion_list AS (
+        -- First, get every player in the market and their full champion pool
+        SELECT mp.id, mp.player_tag, array_agg(pc.champion_name) as champions
+        FROM market_players mp
+        JOIN player_champions pc ON mp.id = pc.market_player_id
+        WHERE mp.market_id = %(market_id)s
+        GROUP BY mp.id, mp.player_tag
+    )
+    SELECT
+        pcl.player_tag,
+        pcl.champions,
+        l.current_price,
+        l.last_update,
+        -- Safely calculate price changes, defaulting to 0 if no historical data exists
+        l.current_price - COALESCE(a.price_24h, l.current_price) AS price_change_24h,
+        (l.current_price - COALESCE(a.price_24h, l.current_price)) / NULLIF(COALESCE(a.price_24h, l.current_price), 0) * 100 AS price_change_percent_24h,
+        l.current_price - COALESCE(a.price_7d, l.current_price) AS price_change_7d,
+        (l.current_price - COALESCE(a.price_7d, l.current_price)) / NULLIF(COALESCE(a.price_7d, l.current_price), 0) * 100 AS price_change_percent_7d
+    FROM player_champion_list pcl
+    -- LEFT JOIN so players appear even before their first price
+    LEFT JOIN market_player_latest l ON pcl.id = l.market_player_id
+    -- An anchor that has come due since a writer last stored it is looked up, not written
+    LEFT JOIN LATERAL (
+        SELECT
+            CASE WHEN l.next_24h_at <= NOW() THEN {ANCHOR_PRICE_SQL.format(interval='1 day')} ELSE l.price_24h END AS price_24h,
+            CASE WHEN l.next_7d_at <= NOW() THEN {ANCHOR_PRICE_SQL.format(interval='7 days')} ELSE l.price_7d END AS price_7d
+    ) a ON TRUE
+"""
+
+STOCK_HISTORY_SQL = """
+    SELECT stock_value, timestamp, champion_played
+    FROM stock_values
+    WHERE market_id = %(market_id)s AND player_tag = %(player_tag)s AND timestamp >= %(start_date)s
+    ORDER BY timestamp ASC
+"""
+
+async def fetch_market_stocks(conn, market_id):
+    """Every player in a market with their champion pool, current price and 24h/7d changes."""
+    cur = await conn.execute(MARKET_STOCKS_SQL, {'market_id': market_id})
+    return await cur.fetchall()
+
+async def fetch_stock_history(conn, market_id, player_tag, start_date):
+    cur = await conn.execute(STOCK_HISTORY_SQL, {'market_id': market_id, 'player_tag': player_tag,
+                                                 'start_date': start_date})
+    return await cur.fetchall()
+
+async def fetch_first_candle_at(conn, market_id, player_tag):
+    cur = await conn.execute(FIRST_CANDLE_SQL, {'market_id': market_id, 'player_tag': player_tag})
+    return (await cur.fetchone())['first_at']
+
+async def fetch_candles(conn, market_id, player_tag, resolution, width, start_date):
+    """
+    OHLC buckets of `width` since start_date, regrouped from the stored `resolution`
+    rollup (width is a whole multiple of it, on the same date_bin origin).
+    """
+    cur = await conn.execute(CANDLES_SQL, {'market_id': market_id, 'player_tag': player_tag, 'resolution': resolution,
+                                           'width': width, 'start_date': start_date})
+    return await cur.fetchall()
+
+async def fetch_price_changes(conn, market_id, start_date):
+    """Current price and % change since start_date for every player with a price in the market."""
+    cur = await conn.execute("""
+        WITH player_list AS (
+            SELECT DISTINCT player_tag FROM stock_values WHERE market_id = %(market_id)s
+        ),
+        latest_prices AS (
+            SELECT DISTINCT ON (player_tag)
+                player_tag, stock_value
+            FROM stock_values
+            WHERE market_id = %(market_id)s
+            ORDER BY player_tag, timestamp DESC
+        ),
+        historical_prices AS (
+            SELECT DISTINCT ON (player_tag)
+                player_tag, stock_value
+            FROM stock_values
+            WHERE market_id = %(market_id)s AND timestamp >= %(start_date)s
+            ORDER BY player_tag, timestamp ASC
+        )
+        SELECT
+            pl.player_tag,
+            lp.stock_value as current_price,
+            (lp.stock_value - hp.stock_value) / hp.stock_value * 100 AS price_change_percent
+        FROM player_list pl
+        JOIN latest_prices lp ON pl.player_tag = lp.player_tag
+        JOIN historical_prices hp ON pl.player_tag = hp.player_tag
+        WHERE hp.stock_value > 0;
+    """, {'market_id': market_id, 'start_date': start_date})
+    return await cur.fetchall()
+
+# A player's newest scored games with the price before each. LEAD over the newest-first
+# order is LAG in time order, and lets the (market_id, player_tag, timestamp) index feed
+# the window row by row, so LIMIT stops the scan instead of sorting the whole history.
+RECENT_SCORES_SQL = """
+    SELECT model_score, timestamp, game_id, stock_value, champion_played, previous_stock_value
+    FROM (
+        SELECT model_score, timestamp, game_id, stock_value, champion_played,
+               LEAD(stock_value) OVER (ORDER BY timestamp DESC) AS previous_stock_value
+        FROM stock_values
+        WHERE market_id = %(market_id)s AND player_tag = {player_tag}
+        ORDER BY timestamp DESC
+    ) history
+    WHERE model_score IS NOT NULL
+    ORDER BY timestamp DESC
+    LIMIT %(limit)s
+"""
+
+async def fetch_player_scores(conn, market_id, player_tag, limit):
+    cur = await conn.execute(RECENT_SCORES_SQL.format(player_tag='%(player_tag)s'),
+                             {'market_id': market_id, 'player_tag': player_tag, 'limit': limit})
+    return await cur.fetchall()
+
+# The same recent scores for every player in a market
+MARKET_SCORES_SQL = f"""
+    SELECT mp.player_tag, s.*
+    FROM market_players mp
+    CROSS JOIN LATERAL ({RECENT_SCORES_SQL.format(player_tag='mp.player_tag')}) s
+    WHERE mp.market_id = %(market_id)s
+    ORDER BY mp.player_tag, s.timestamp DESC
+"""
+
+async def fetch_market_scores(conn, market_id, limit):
+    """The same recent scores for every player in a market, in one round trip."""
+    cur = await conn.execute(MARKET_SCORES_SQL, {'market_id': market_id, 'limit': limit})
+    scores = {}
+    for row in await cur.fetchall():
+        scores.setdefault(row.pop('player_tag'), []).append(row)
+    return scores
+
+# --- Tracker queries (run through psycopg2 by services.stock_tracker) ---
+MARKET_PLAYERS_SQL = """
+    SELECT mp.id, mp.player_tag, mp.puuid, mp.match_watermark, array_agg(pc.champion_name) as champions
+    FROM market_players mp
+    JOIN player_champions pc ON mp.id = pc.market_player_id
+    WHERE mp.market_id = %(market_id)s
+    GROUP BY mp.id, mp.player_tag, mp.puuid, mp.match_watermark
+"""
+
+PROCESSED_GAMES_SQL = """
+    SELECT market_player_id, game_id FROM processed_games
+    WHERE market_player_id = ANY(%(market_player_ids)s) AND game_id = ANY(%(game_ids)s)
+"""
+
+LATEST_PRICES_SQL = "SELECT market_player_id, current_price FROM market_player_latest WHERE market_id = %(market_id)s"
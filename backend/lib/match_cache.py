@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Match-v5 payloads never change once a game has ended, so they can be kept indefinitely
+MATCH_CACHE_DIR = os.environ.get('MATCH_CACHE_DIR', os.path.join(os.path.dirname(__file__), '..', '.match_cache'))
+MATCH_CACHE_MAX_BYTES = int(os.environ.get('MATCH_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+# Budget of the in-memory LRU, counted in serialized JSON bytes; the parsed objects
+# take several times that, so keep it small in every API and tracker process
+MATCH_CACHE_MEMORY_BYTES = int(os.environ.get('MATCH_CACHE_MEMORY_BYTES', 16 * 1024 * 1024))
+# Timelines (around a megabyte of JSON each) are read once, when their game is scored,
+# so only match details are worth keeping in memory
+MEMORY_KINDS = ('match',)
+
+
+class MatchCache:
+    """
+    Content-addressed, zlib-compressed JSON store for match details and timelines,
+    with a small in-memory LRU of match details in front of it. The directory is
+    capped at max_bytes and the LRU at memory_bytes of serialized JSON; past either
+    cap the least recently used entries are dropped.
+    """
+
+    def __init__(self, directory=MATCH_CACHE_DIR, max_bytes=MATCH_CACHE_MAX_BYTES, memory_bytes=MATCH_CACHE_MEMORY_BYTES):
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_bytes
+        self.memory_bytes = memory_bytes
+        self._memory = OrderedDict()  # key -> (payload, serialized size)
+        self._memory_used = 0
+        self._lock = threading.Lock()
+        self._disk_bytes = None  # computed lazily on first write
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'writes': 0, 'evictions': 0}
+
+    def _key(self, kind, match_id):
+        return hashlib.sha256(f"{kind}:{match_id}".encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json.z")
+
+    def _remember(self, kind, key, payload, size):
+        """Caller holds the lock."""
+        if kind not in MEMORY_KINDS or size > self.memory_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_used -= old[1]
+        self._memory[key] = (payload, size)
+        self._memory_used += size
+        while self._memory_used > self.memory_bytes:
+            _, (_, evicted_size) = self._memory.popitem(last=False)
+            self._memory_used -= evicted_size
+
+    def get(self, kind, match_id):
+        """Returns the cached payload, or None on a miss."""
+        key = self._key(kind, match_id)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.stats['memory_hits'] += 1
+                return self._memory[key][0]
+
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                raw = zlib.decompress(f.read())
+            payload = json.loads(raw)
+            os.utime(path)  # mark as recently used for eviction
+        except (FileNotFoundError, zlib.error, ValueError):
+            with self._lock:
+                self.stats['misses'] += 1
+            return None
+
+        with self._lock:
+            self.stats['disk_hits'] += 1
+            self._remember(kind, key, payload, len(raw))
+        return payload
+
+    def put(self, kind, match_id, payload):
+        key = self._key(kind, match_id)
+        path = self._path(key)
+        raw = json.dumps(payload, separators=(',', ':')).encode()
+        blob = zlib.compress(raw, 6)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(blob)
+
+        with self._lock:
+            # An overwritten entry's old file no longer counts towards the cap
+            try:
+                replaced = os.path.getsize(path)
+            except FileNotFoundError:
+                replaced = 0
+            os.replace(tmp_path, path)  # atomic, so readers never see half a file
+            self._remember(kind, key, payload, len(raw))
+            self.stats['writes'] += 1
+            if self._disk_bytes is None:
+                self._disk_bytes = self._scan()[1]
+            else:
+                self._disk_bytes += len(blob) - replaced
+            if self._disk_bytes > self.max_bytes:
+                self._evict()
+
+    def _scan(self):
+        entries, total = [], 0
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith('.json.z'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        return entries, total
+
+    def _evict(self):
+        """Deletes least recently used files until the cache is back under 90% of its cap. Caller holds the lock."""
+        entries, total = self._scan()
+        target = self.max_bytes * 0.9
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            self.stats['evictions'] += 1
+        self._disk_bytes = total
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+            stats['hit_ratio'] = (stats['memory_hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+            stats['memory_items'] = len(self._memory)
+            stats['memory_bytes'] = self._memory_used
+            stats['disk_bytes'] = self._disk_bytes
+        return stats
+
+
+# --- Shared, process-wide cache for every match/timeline download ---
+match_cache = MatchCache()
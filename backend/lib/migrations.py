@@ -0,0 +1,286 @@
+import hashlib
+import json
+import os
+import re
+import sys
+from datetime import datetime, timedelta, timezone
+from lib.candles import CANDLES_SQL, FIRST_CANDLE_SQL
+from lib.database import get_connection
+from lib.market_queries import (LATEST_PRICES_SQL, MARKET_PLAYERS_SQL, MARKET_SCORES_SQL, MARKET_STOCKS_SQL,
+                                PROCESSED_GAMES_SQL, RECENT_SCORES_SQL, STOCK_HISTORY_SQL)
+from lib.price_anchors import PRICE_ANCHOR_REFRESH_SQL
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), '..', 'migrations')
+PARTITIONING_SQL = os.path.join(MIGRATIONS_DIR, 'optional', 'stock_values_partitioning.sql')
+MIGRATION_FILE = re.compile(r'^(\d{3})_(\w+)\.sql$')
+# Serializes concurrent runs (two deploys starting at once); any constant key works
+ADVISORY_LOCK_KEY = 7_301_025
+# Months of stock_values partitions kept ready ahead of time
+PARTITION_MONTHS_AHEAD = 3
+
+
+# --- Discovery & bookkeeping ---
+def discover(directory=MIGRATIONS_DIR):
+    """[(version, name, path)] for every NNN_name.sql in the directory, in version order."""
+    migrations = []
+    for filename in os.listdir(directory):
+        match = MIGRATION_FILE.match(filename)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2), os.path.join(directory, filename)))
+    migrations.sort()
+    versions = [version for version, _, _ in migrations]
+    if len(versions) != len(set(versions)):
+        raise ValueError(f"Duplicate migration versions in {directory}: {versions}")
+    return migrations
+
+
+def checksum(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def ensure_migrations_table(c):
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            checksum TEXT NOT NULL,
+            applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        )
+    """)
+
+
+def applied_migrations(c):
+    c.execute("SELECT version, name, checksum, applied_at FROM schema_migrations ORDER BY version")
+    return {row[0]: {'name': row[1], 'checksum': row[2], 'applied_at': row[3]} for row in c.fetchall()}
+
+
+# --- Commands ---
+def status():
+    conn = get_connection()
+    try:
+        with conn.cursor() as c:
+            ensure_migrations_table(c)
+            applied = applied_migrations(c)
+        conn.commit()
+    finally:
+        conn.close()
+    for version, name, path in discover():
+        row = applied.get(version)
+        if row is None:
+            state = 'pending'
+        elif row['checksum'] != checksum(path):
+            state = f"applied {row['applied_at']:%Y-%m-%d %H:%M}, file changed since"
+        else:
+            state = f"applied {row['applied_at']:%Y-%m-%d %H:%M}"
+        print(f"{version:03d}_{name:<40} {state}")
+
+
+def apply(target=None):
+    """
+    Applies every pending migration up to `target` (default: all), each in its own
+    transaction together with its schema_migrations row, so a failure leaves the
+    database at the last migration that succeeded. The files are idempotent, so a
+    database created before this runner simply records them as it re-runs them.
+    """
+    conn = get_connection()
+    try:
+        with conn.cursor() as c:
+            c.execute("SELECT pg_advisory_lock(%s)", (ADVISORY_LOCK_KEY,))
+            ensure_migrations_table(c)
+            applied = applied_migrations(c)
+        conn.commit()
+
+        count = 0
+        for version, name, path in discover():
+            if target is not None and version > target:
+                break
+            if version in applied:
+                if applied[version]['checksum'] != checksum(path):
+                    print(f"Warning: {version:03d}_{name} changed after it was applied; not re-running it.")
+                continue
+            with open(path) as f:
+                sql = f.read()
+            print(f"Applying {version:03d}_{name}...")
+            try:
+                with conn.cursor() as c:
+                    c.execute(sql)
+                    c.execute("INSERT INTO schema_migrations (version, name, checksum) VALUES (%s, %s, %s)",
+                              (version, name, checksum(path)))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                print(f"!!! {version:03d}_{name} failed; it and every later migration are left pending.")
+                raise
+            count += 1
+        print(f"Applied {count} migration(s); the schema is up to date." if count else "Nothing to apply.")
+    finally:
+        conn.close()  # also releases the advisory lock
+
+
+def is_stock_values_partitioned(c):
+    c.execute("""
+        SELECT 1 FROM pg_partitioned_table pt
+        JOIN pg_class cl ON cl.oid = pt.partrelid
+        WHERE cl.relname = 'stock_values'
+    """)
+    return c.fetchone() is not None
+
+
+def partition():
+    """Opt-in: converts stock_values into monthly range partitions in one transaction."""
+    conn = get_connection()
+    try:
+        with conn.cursor() as c:
+            if is_stock_values_partitioned(c):
+                print("stock_values is already partitioned.")
+                return
+            with open(PARTITIONING_SQL) as f:
+                c.execute(f.read())
+            c.execute("SELECT COUNT(*) FROM stock_values")
+            rows = c.fetchone()[0]
+        conn.commit()
+        print(f"stock_values is now partitioned by month ({rows} rows copied). "
+              f"The old table is kept as stock_values_unpartitioned.")
+    finally:
+        conn.close()
+
+
+def create_partitions(months_ahead=PARTITION_MONTHS_AHEAD):
+    """Creates the coming months' stock_values partitions; run it regularly once partitioned."""
+    conn = get_connection()
+    try:
+        with conn.cursor() as c:
+            if not is_stock_values_partitioned(c):
+                print("stock_values is not partitioned; nothing to do.")
+                return
+            c.execute("SELECT create_stock_values_partitions(%s)", (months_ahead,))
+            created = c.fetchone()[0]
+        conn.commit()
+        print(f"Created {created} stock_values partition(s); covered through {months_ahead} months ahead.")
+    finally:
+        conn.close()
+
+
+# --- Plan regression check ---
+# The queries that run on every page load or refresh, imported from the modules that run
+# them so the check cannot drift from the real SQL. With sequential scans disabled the
+# planner still picks one only when no index can serve the query, so any "Seq Scan" on
+# these tables means a query has lost its index. Without its own index a query can also
+# fall back to walking another index end to end (a condition on its second column only),
+# so every index scan must also constrain the index's leading key.
+HOT_QUERIES = {
+    'recent scores (fetch_player_scores)': RECENT_SCORES_SQL.format(player_tag='%(player_tag)s'),
+    'market scores (fetch_market_scores)': MARKET_SCORES_SQL,
+    'price history (fetch_stock_history)': STOCK_HISTORY_SQL,
+    'market stocks (fetch_market_stocks)': MARKET_STOCKS_SQL,
+    'candles (fetch_candles)': CANDLES_SQL,
+    'first candle (fetch_first_candle_at)': FIRST_CANDLE_SQL,
+    'latest prices (prefetch_market_state)': LATEST_PRICES_SQL,
+    'processed games (prefetch_market_state)': PROCESSED_GAMES_SQL,
+    'market players (get_market_config_and_players)': MARKET_PLAYERS_SQL,
+    # The tracker's flush and the catch-up job; EXPLAIN without ANALYZE plans an UPDATE without running it
+    'anchor refresh (refresh_price_anchors)': PRICE_ANCHOR_REFRESH_SQL.format(scope='AND l.market_id = %(market_id)s'),
+    'all due anchors (refresh_all_price_anchors)': PRICE_ANCHOR_REFRESH_SQL.format(scope=''),
+}
+WATCHED_TABLES = ('stock_values', 'processed_games', 'market_player_latest', 'stock_candles', 'market_players')
+
+
+def sequential_scans(plan):
+    """Relations read with a Seq Scan anywhere in an EXPLAIN (FORMAT JSON) plan tree."""
+    scans = []
+    if plan.get('Node Type') == 'Seq Scan':
+        scans.append(plan['Relation Name'])
+    for child in plan.get('Plans', []):
+        scans.extend(sequential_scans(child))
+    return scans
+
+
+INDEX_SCANS = ('Index Scan', 'Index Only Scan', 'Bitmap Index Scan')
+
+
+def index_scans(plan):
+    """(index name, index condition or None) for every index scan in an EXPLAIN (FORMAT JSON) plan tree."""
+    scans = []
+    if plan.get('Node Type') in INDEX_SCANS:
+        scans.append((plan['Index Name'], plan.get('Index Cond')))
+    for child in plan.get('Plans', []):
+        scans.extend(index_scans(child))
+    return scans
+
+
+def unkeyed_index_scans(c, plan):
+    """Indexes of watched tables that the plan scans without a condition on their leading key."""
+    unkeyed = []
+    for index, condition in index_scans(plan):
+        c.execute("SELECT indrelid::regclass::text, pg_get_indexdef(indexrelid, 1, true) FROM pg_index "
+                  "WHERE indexrelid = %s::regclass", (index,))
+        table, leading_key = c.fetchone()
+        if not is_watched(table):
+            continue
+        if condition is None or not re.search(rf"(?<!\w){re.escape(leading_key)}(?!\w)", condition):
+            unkeyed.append(f"{index} (no condition on {leading_key})")
+    return unkeyed
+
+
+def is_watched(relation):
+    # Partitions are named <table>_<suffix>, so they count as their parent
+    return any(relation == t or relation.startswith(f"{t}_") for t in WATCHED_TABLES)
+
+
+def check_plans():
+    """
+    EXPLAINs every hot query; returns False if any of them sequentially scans a watched
+    table or scans one of its indexes without a condition on the leading key.
+    """
+    conn = get_connection()
+    failures = []
+    try:
+        with conn.cursor() as c:
+            c.execute("SELECT id, market_id, player_tag FROM market_players ORDER BY id LIMIT 1")
+            sample = c.fetchone() or (0, 0, '')
+            params = {
+                'market_player_id': sample[0], 'market_id': sample[1], 'player_tag': sample[2],
+                'market_player_ids': [sample[0]], 'game_ids': ['NA1_0'], 'limit': 5,
+                'start_date': datetime.now(timezone.utc) - timedelta(days=7),
+                'resolution': '1h', 'width': timedelta(hours=1),
+            }
+            c.execute("SET LOCAL enable_seqscan = off")
+            for name, sql in HOT_QUERIES.items():
+                c.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+                plan = c.fetchone()[0]
+                plan = json.loads(plan) if isinstance(plan, str) else plan
+                problems = [f"Seq Scan on {rel}" for rel in sequential_scans(plan[0]['Plan']) if is_watched(rel)]
+                problems += [f"Index scan of {index}" for index in unkeyed_index_scans(c, plan[0]['Plan'])]
+                print(f"{'FAIL' if problems else 'ok':<5} {name}{': ' + '; '.join(problems) if problems else ''}")
+                if problems:
+                    failures.append(name)
+        conn.rollback()
+    finally:
+        conn.close()
+    if failures:
+        print(f"{len(failures)} hot quer{'y' if len(failures) == 1 else 'ies'} lost {'its' if len(failures) == 1 else 'their'} index.")
+    return not failures
+
+
+if __name__ == "__main__":
+    # Usage (from backend/):
+    #   python -m lib.migrations status
+    #   python -m lib.migrations apply [<target version>]
+    #   python -m lib.migrations check-plans     (exits 1 if a hot query lost its index)
+    #   python -m lib.migrations partition       (opt-in: monthly partitions for stock_values)
+    #   python -m lib.migrations partitions [<months ahead>]
+    command = sys.argv[1] if len(sys.argv) > 1 else 'status'
+    if command == 'status':
+        status()
+    elif command == 'apply' and len(sys.argv) <= 3:
+        apply(int(sys.argv[2]) if len(sys.argv) == 3 else None)
+    elif command == 'check-plans':
+        sys.exit(0 if check_plans() else 1)
+    elif command == 'partition':
+        partition()
+    elif command == 'partitions' and len(sys.argv) <= 3:
+        create_partitions(int(sys.argv[2]) if len(sys.argv) == 3 else PARTITION_MONTHS_AHEAD)
+    else:
+        print("Usage: python -m lib.migrations [status | apply [version] | check-plans | partition | partitions [months]]")
+        sys.exit(1)
@@ -0,0 +1,246 @@
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import sys
+import time
+from datetime import datetime, timezone
+import numpy as np
+
+ROLES = ['Top', 'Jungle', 'Mid', 'ADC', 'Support']
+MODEL_DIR = os.path.join(os.path.dirname(__file__), '..')
+MODELS_DIR = os.environ.get('MODELS_DIR', os.path.join(MODEL_DIR, 'models'))
+ARTIFACT_FORMAT = 1
+
+
+class CompiledGradientBoosting:
+    """
+    A GradientBoostingRegressor flattened into NumPy arrays.
+
+    All trees share one set of node arrays (feature, threshold, left, right, value);
+    `roots` holds the index of each tree's root node and leaves have left == -1.
+    predict() walks every row down every tree at once, one NumPy step per tree level,
+    and reproduces sklearn's arithmetic exactly: inputs are compared as float32 against
+    float64 thresholds, and leaf values are accumulated tree by tree onto the init constant.
+    """
+
+    ARRAYS = ('feature', 'threshold', 'left', 'right', 'value', 'roots')
+
+    def __init__(self, feature, threshold, left, right, value, roots, init, learning_rate, max_depth, feature_names):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.init = float(init)
+        self.learning_rate = float(learning_rate)
+        self.max_depth = int(max_depth)
+        self.feature_names = list(feature_names)
+
+    @classmethod
+    def from_sklearn(cls, model):
+        """Flattens a fitted sklearn GradientBoostingRegressor (squared_error loss, constant init)."""
+        if getattr(model, 'loss', 'squared_error') != 'squared_error':
+            raise ValueError(f"Only squared_error models can be compiled, got loss={model.loss!r}")
+        if model.init_ == 'zero':
+            init = 0.0
+        elif hasattr(model.init_, 'constant_'):
+            init = np.asarray(model.init_.constant_, dtype=np.float64).ravel()[0]
+        else:
+            raise ValueError(f"Unsupported init estimator: {type(model.init_).__name__}")
+
+        feature, threshold, left, right, value, roots = [], [], [], [], [], []
+        offset, max_depth = 0, 0
+        for estimator in model.estimators_[:model.n_estimators_, 0]:
+            tree = estimator.tree_
+            is_leaf = tree.children_left == -1
+            roots.append(offset)
+            feature.append(np.where(is_leaf, 0, tree.feature))
+            threshold.append(tree.threshold)
+            # Child indices are shifted so they point into the concatenated arrays
+            left.append(np.where(is_leaf, -1, tree.children_left + offset))
+            right.append(np.where(is_leaf, -1, tree.children_right + offset))
+            value.append(tree.value.reshape(tree.node_count, -1)[:, 0])
+            offset += tree.node_count
+            max_depth = max(max_depth, tree.max_depth)
+
+        return cls(
+            feature=np.concatenate(feature).astype(np.intp),
+            threshold=np.concatenate(threshold).astype(np.float64),
+            left=np.concatenate(left).astype(np.intp),
+            right=np.concatenate(right).astype(np.intp),
+            value=np.concatenate(value).astype(np.float64),
+            roots=np.asarray(roots, dtype=np.intp),
+            init=init,
+            learning_rate=model.learning_rate,
+            max_depth=max_depth,
+            feature_names=getattr(model, 'feature_names_in_', []),
+        )
+
+    def predict(self, X):
+        """Scores an (n_rows, n_features) matrix; same results as the sklearn model's predict."""
+        # sklearn's trees compare float32 inputs against float64 thresholds
+        X = np.asarray(X, dtype=np.float32).astype(np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        n_rows = X.shape[0]
+        rows = np.arange(n_rows)[:, None]
+
+        node = np.broadcast_to(self.roots, (n_rows, len(self.roots))).copy()
+        for _ in range(self.max_depth):
+            left = self.left[node]
+            go_left = X[rows, self.feature[node]] <= self.threshold[node]
+            node = np.where(left == -1, node, np.where(go_left, left, self.right[node]))
+
+        # cumsum adds strictly left to right, matching sklearn's tree-by-tree `raw += lr * value`
+        terms = np.empty((n_rows, len(self.roots) + 1), dtype=np.float64)
+        terms[:, 0] = self.init
+        terms[:, 1:] = self.learning_rate * self.value[node]
+        return np.cumsum(terms, axis=1)[:, -1]
+
+    def save(self, directory, name):
+        """Writes one .npy file per array as <name>.<array>.npy and returns the scalars for the manifest."""
+        for array in self.ARRAYS:
+            np.save(os.path.join(directory, f'{name}.{array}.npy'), getattr(self, array))
+        return {
+            'init': self.init,
+            'learning_rate': self.learning_rate,
+            'max_depth': self.max_depth,
+            'feature_names': self.feature_names,
+            'n_trees': int(len(self.roots)),
+            'n_nodes': int(len(self.value)),
+        }
+
+    @classmethod
+    def load(cls, directory, name, meta, mmap=True):
+        """
+        Loads the arrays written by save(). With mmap the files are mapped read-only, so loading
+        is near-instant and every process scoring with the same version shares one copy in the page cache.
+        """
+        arrays = {}
+        for array in cls.ARRAYS:
+            data = np.load(os.path.join(directory, f'{name}.{array}.npy'), mmap_mode='r' if mmap else None,
+                           allow_pickle=False)
+            arrays[array] = np.asarray(data)  # plain ndarray view of the mapping; indexing a memmap is slower
+        return cls(**arrays, init=meta['init'], learning_rate=meta['learning_rate'], max_depth=meta['max_depth'],
+                   feature_names=meta['feature_names'])
+
+
+def parity_sample(compiled, n_rows=2000, seed=0):
+    """
+    Rows built from the models' own split thresholds (and values just either side of them),
+    so every comparison edge case is exercised, not just typical inputs.
+    """
+    rng = np.random.default_rng(seed)
+    n_features = len(compiled.feature_names) or int(compiled.feature.max()) + 1
+    X = rng.normal(0, 50, size=(n_rows, n_features))
+    internal = compiled.left != -1
+    for f in range(n_features):
+        thresholds = compiled.threshold[internal & (compiled.feature == f)]
+        if len(thresholds) == 0:
+            continue
+        picks = rng.choice(thresholds, size=n_rows)
+        nudge = rng.choice([-1e-3, 0.0, 1e-3], size=n_rows)
+        mask = rng.random(n_rows) < 0.75
+        X[mask, f] = picks[mask] + nudge[mask]
+    return X
+
+
+def check_parity(model, compiled, X):
+    """Returns (max abs difference, sklearn seconds per row, compiled seconds per row)."""
+    import pandas as pd
+    frame = pd.DataFrame(X, columns=compiled.feature_names) if compiled.feature_names else X
+    expected = model.predict(frame)
+    actual = compiled.predict(X)
+    max_diff = float(np.max(np.abs(expected - actual)))
+
+    # Per-row cost the way the tracker used to pay it: one predict call per game
+    one_row = X[:1]
+    one_frame = frame.iloc[:1] if compiled.feature_names else one_row
+    reps = 200
+    t0 = time.perf_counter()
+    for _ in range(reps):
+        model.predict(one_frame)
+    sklearn_cost = (time.perf_counter() - t0) / reps
+    t0 = time.perf_counter()
+    for _ in range(reps):
+        compiled.predict(one_row)
+    compiled_cost = (time.perf_counter() - t0) / reps
+    return max_diff, sklearn_cost, compiled_cost
+
+
+def find_role_pickle(model_dir, role, variant=None):
+    """
+    <role>_model.pkl, or with a variant the one pickle for the role whose name contains it,
+    e.g. variant='2.1' picks 'top_model - 5median, 2.1 sperate z score.pkl' in Old Models.
+    """
+    if variant is None:
+        return os.path.join(model_dir, f'{role.lower()}_model.pkl')
+    matches = [name for name in os.listdir(model_dir)
+               if name.lower().startswith(f'{role.lower()}_model') and name.endswith('.pkl') and variant in name]
+    if len(matches) != 1:
+        raise FileNotFoundError(f"Expected one {role} pickle containing {variant!r} in {model_dir}, found {matches}")
+    return os.path.join(model_dir, matches[0])
+
+
+def compile_models(model_dir=MODEL_DIR, models_dir=MODELS_DIR, version=None, variant=None, shadow_only=None):
+    """
+    Compiles every role's pickle (see find_role_pickle) into a new artifact version,
+    models_dir/<version>/, holding the .npy arrays and a manifest.json. Nothing is written
+    unless every role has exact parity with its pickle. Returns the version, or None on failure.
+    With shadow_only (the reason, kept in the manifest) the registry will shadow-score the
+    version but never serve it.
+    """
+    version = version or datetime.now(timezone.utc).strftime('v%Y%m%d%H%M%S')
+    manifest = {'format': ARTIFACT_FORMAT, 'version': version,
+                'created_at': datetime.now(timezone.utc).isoformat(), 'roles': {}}
+    if shadow_only:
+        manifest['shadow_only'] = shadow_only
+    compiled_models = {}
+    for role in ROLES:
+        pkl_path = find_role_pickle(model_dir, role, variant)
+        with open(pkl_path, 'rb') as f:
+            content = f.read()
+        model = pickle.loads(content)
+        compiled = CompiledGradientBoosting.from_sklearn(model)
+        max_diff, sklearn_cost, compiled_cost = check_parity(model, compiled, parity_sample(compiled))
+        print(f"{role}: {len(compiled.roots)} trees, {len(compiled.value)} nodes, max |diff| = {max_diff:.3g}, "
+              f"1-row predict {sklearn_cost * 1e6:.0f}us -> {compiled_cost * 1e6:.0f}us "
+              f"({sklearn_cost / compiled_cost:.1f}x)")
+        if max_diff != 0.0:
+            print(f"!!! {role}: compiled scores differ from the pickle, not writing version {version}")
+            return None
+        compiled_models[role] = (compiled, os.path.basename(pkl_path), hashlib.sha256(content).hexdigest())
+
+    # Written to a temporary directory and renamed into place, so readers never see a partial version
+    final_dir = os.path.join(models_dir, version)
+    if os.path.exists(final_dir):
+        raise FileExistsError(f"Model version {version} already exists in {models_dir}")
+    tmp_dir = f"{final_dir}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    for role, (compiled, source, source_sha256) in compiled_models.items():
+        meta = compiled.save(tmp_dir, role.lower())
+        meta['source'] = source
+        meta['source_sha256'] = source_sha256
+        manifest['roles'][role] = meta
+    with open(os.path.join(tmp_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.rename(tmp_dir, final_dir)
+    print(f"Wrote model version {version} to {final_dir}")
+    return version
+
+
+if __name__ == "__main__":
+    # Usage (from backend/):
+    #   python -m lib.model_compiler                      # the production pickles, timestamped version
+    #   python -m lib.model_compiler v20250801-median-z --from "../Old Models" --variant 2.1
+    parser = argparse.ArgumentParser(description="Compile the role pickles into a versioned model artifact.")
+    parser.add_argument('version', nargs='?')
+    parser.add_argument('--from', dest='model_dir', default=MODEL_DIR, help="directory holding the pickles")
+    parser.add_argument('--variant', help="substring selecting one pickle per role, for variant model sets")
+    args = parser.parse_args()
+    sys.exit(0 if compile_models(args.model_dir, version=args.version, variant=args.variant) else 1)
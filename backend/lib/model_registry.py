@@ -0,0 +1,197 @@
+import json
+import os
+import pickle
+import sys
+import threading
+import time
+from lib.model_compiler import CompiledGradientBoosting, MODEL_DIR, MODELS_DIR, ROLES, ARTIFACT_FORMAT
+
+# Pin a version with MODEL_VERSION; otherwise the ACTIVE pointer. Without either the production
+# pickles are served: a newly compiled version is never promoted until it is activated
+MODEL_VERSION = os.environ.get('MODEL_VERSION')
+PICKLE_VERSION = 'pickle'
+# Pointer files in MODELS_DIR naming the serving version and the candidate to shadow-score
+ACTIVE_POINTER = 'ACTIVE'
+SHADOW_POINTER = 'SHADOW'
+# How often (seconds) the pointer files are re-read; a swap reaches every process within this window
+POINTER_CHECK_INTERVAL = float(os.environ.get('MODEL_POINTER_CHECK_INTERVAL', 5))
+
+
+class ModelRegistry:
+    """
+    Process-wide home of the per-role scoring models.
+
+    Each version is loaded at most once per process. Compiled artifacts
+    (python -m lib.model_compiler) are memory-mapped, so loading them costs
+    almost nothing and every process scoring with a version shares its pages.
+    Until a version is activated, the <role>_model.pkl files are unpickled once
+    instead.
+
+    The ACTIVE and SHADOW pointer files select the serving and candidate versions;
+    without ACTIVE the pickles are served. current() re-reads them at most every
+    POINTER_CHECK_INTERVAL seconds, so a swap takes effect in running API processes
+    without a restart.
+    """
+
+    def __init__(self, models_dir=MODELS_DIR, pickle_dir=MODEL_DIR):
+        self.models_dir = models_dir
+        self.pickle_dir = pickle_dir
+        self._lock = threading.Lock()
+        self._loaded = {}  # version -> {role: model}
+        self._current = None  # {'version', 'models', 'shadow_version', 'shadow_models'}
+        self._checked_at = 0.0
+
+    def versions(self):
+        """Compiled versions on disk, oldest first (version names sort by creation time)."""
+        if not os.path.isdir(self.models_dir):
+            return []
+        return sorted(
+            name for name in os.listdir(self.models_dir)
+            if os.path.isfile(os.path.join(self.models_dir, name, 'manifest.json'))
+        )
+
+    def read_pointer(self, name):
+        try:
+            with open(os.path.join(self.models_dir, name)) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def set_pointer(self, name, version):
+        """Points ACTIVE/SHADOW at a version (None clears it). Written atomically."""
+        path = os.path.join(self.models_dir, name)
+        if version is None:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        if version != PICKLE_VERSION and version not in self.versions():
+            raise ValueError(f"Unknown model version {version}; available: {self.versions()}")
+        if name == ACTIVE_POINTER and self.shadow_only(version):
+            raise ValueError(f"Model version {version} can only be shadow-scored: {self.shadow_only(version)}")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(version + '\n')
+        os.replace(tmp_path, path)
+
+    def shadow_only(self, version):
+        """Why a compiled version may only be shadow-scored (see compile_models), or None if it may be served."""
+        if version == PICKLE_VERSION:
+            return None
+        try:
+            with open(os.path.join(self.models_dir, version, 'manifest.json')) as f:
+                return json.load(f).get('shadow_only')
+        except FileNotFoundError:
+            return None
+
+    def default_version(self):
+        if MODEL_VERSION:
+            return MODEL_VERSION
+        return self.read_pointer(ACTIVE_POINTER) or PICKLE_VERSION
+
+    def current(self):
+        """
+        Returns {'version', 'models', 'shadow_version', 'shadow_models'} for scoring.
+        Between pointer checks this is a plain attribute read. A version that fails to
+        load never replaces the one being served, and a broken shadow is just dropped.
+        """
+        now = time.monotonic()
+        if self._current is not None and now - self._checked_at < POINTER_CHECK_INTERVAL:
+            return self._current
+
+        version = self.default_version()
+        shadow_version = os.environ.get('MODEL_SHADOW_VERSION') or self.read_pointer(SHADOW_POINTER)
+        previous = self._current
+        try:
+            models = self.get(version)
+        except Exception as e:
+            if previous is None:
+                raise
+            print(f"!!! Could not load model version {version}, still serving {previous['version']}: {e}")
+            version, models = previous['version'], previous['models']
+
+        shadow_models = None
+        if shadow_version and shadow_version != version:
+            try:
+                shadow_models = self.get(shadow_version, serving=False)
+            except Exception as e:
+                print(f"!!! Could not load shadow model version {shadow_version}, shadow scoring disabled: {e}")
+                shadow_version = None
+        else:
+            shadow_version = None
+
+        current = {'version': version, 'models': models,
+                   'shadow_version': shadow_version, 'shadow_models': shadow_models}
+        if previous and (previous['version'], previous['shadow_version']) != (version, shadow_version):
+            print(f"Model registry switched to {version} (shadow: {shadow_version}).")
+        with self._lock:
+            # Versions nobody serves any more are dropped; their mappings close once unreferenced
+            for stale in set(self._loaded) - {version, shadow_version}:
+                del self._loaded[stale]
+            self._current = current
+            self._checked_at = now
+        return current
+
+    def get(self, version=None, serving=True):
+        """
+        Returns {role: model} for a version (default: the pinned or active one). Versions
+        compiled as shadow-only are refused unless serving=False (shadow scoring).
+        """
+        version = version or self.default_version()
+        if serving and self.shadow_only(version):
+            raise ValueError(f"Model version {version} can only be shadow-scored: {self.shadow_only(version)}")
+        models = self._loaded.get(version)
+        if models is not None:
+            return models
+        with self._lock:
+            if version not in self._loaded:
+                if version == PICKLE_VERSION:
+                    self._loaded[version] = self._load_pickles()
+                else:
+                    self._loaded[version] = self._load_version(version)
+            return self._loaded[version]
+
+    def _load_version(self, version):
+        directory = os.path.join(self.models_dir, version)
+        with open(os.path.join(directory, 'manifest.json')) as f:
+            manifest = json.load(f)
+        if manifest.get('format') != ARTIFACT_FORMAT:
+            raise ValueError(f"Model version {version} has unsupported format {manifest.get('format')}")
+        models = {
+            role: CompiledGradientBoosting.load(directory, role.lower(), meta)
+            for role, meta in manifest['roles'].items()
+        }
+        print(f"Loaded model version {version} (memory-mapped).")
+        return models
+
+    def _load_pickles(self):
+        print(f"No active model version in {self.models_dir}; unpickling <role>_model.pkl (slower).")
+        models = {}
+        for role in ROLES:
+            with open(os.path.join(self.pickle_dir, f'{role.lower()}_model.pkl'), 'rb') as f:
+                models[role] = pickle.load(f)
+        return models
+
+
+# --- Shared, process-wide registry used by the tracker and the manual tester ---
+model_registry = ModelRegistry()
+
+
+if __name__ == "__main__":
+    # Usage (from backend/):
+    #   python -m lib.model_registry list
+    #   python -m lib.model_registry activate <version>
+    #   python -m lib.model_registry shadow <version|none>
+    command = sys.argv[1] if len(sys.argv) > 1 else 'list'
+    if command == 'list':
+        active, shadow = model_registry.default_version(), model_registry.read_pointer(SHADOW_POINTER)
+        for v in [PICKLE_VERSION, *model_registry.versions()]:
+            print(f"{v}{'  <- active' if v == active else ''}{'  <- shadow' if v == shadow else ''}")
+    elif command == 'activate' and len(sys.argv) == 3:
+        model_registry.set_pointer(ACTIVE_POINTER, sys.argv[2])
+        print(f"Active model version is now {sys.argv[2]}.")
+    elif command == 'shadow' and len(sys.argv) == 3:
+        model_registry.set_pointer(SHADOW_POINTER, None if sys.argv[2] == 'none' else sys.argv[2])
+        print(f"Shadow model version is now {sys.argv[2]}.")
+    else:
+        print("Usage: python -m lib.model_registry [list | activate <version> | shadow <version|none>]")
+        sys.exit(1)
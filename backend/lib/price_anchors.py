@@ -0,0 +1,68 @@
+import sys
+from lib.database import db_connection
+
+# Anchors (market_player_latest.price_24h/price_7d) are the newest prices at or before 24h/7d
+# ago. They change as time passes, not only when a price is written: next_24h_at/next_7d_at
+# are when the next younger price crosses that line. Only writers store them; reads of a
+# summary row whose anchor is due look it up with ANCHOR_PRICE_SQL instead of writing.
+PRICE_ANCHORS_DUE = "LEAST(l.next_24h_at, l.next_7d_at) <= NOW()"
+
+# The anchor of the summary row `l` for an interval ('1 day' or '7 days'), from the price history
+ANCHOR_PRICE_SQL = """(
+    SELECT sv.stock_value FROM stock_values sv
+    WHERE sv.market_player_id = l.market_player_id AND sv.timestamp <= NOW() - INTERVAL '{interval}'
+    ORDER BY sv.timestamp DESC LIMIT 1
+)"""
+
+# Recomputes the anchors of the players whose anchors are due; {scope} narrows the rows
+# further, e.g. to one market. Returns the markets it touched.
+PRICE_ANCHOR_REFRESH_SQL = f"""
+    UPDATE market_player_latest l SET
+        price_24h = {ANCHOR_PRICE_SQL.format(interval='1 day')},
+        price_7d = {ANCHOR_PRICE_SQL.format(interval='7 days')},
+        -- LEAST ignores NULLs; last_update also covers a price committed while this ran
+        next_24h_at = LEAST(
+            (SELECT MIN(sv.timestamp) FROM stock_values sv
+             WHERE sv.market_player_id = l.market_player_id AND sv.timestamp > NOW() - INTERVAL '1 day'),
+            CASE WHEN l.last_update > NOW() - INTERVAL '1 day' THEN l.last_update END
+        ) + INTERVAL '1 day',
+        next_7d_at = LEAST(
+            (SELECT MIN(sv.timestamp) FROM stock_values sv
+             WHERE sv.market_player_id = l.market_player_id AND sv.timestamp > NOW() - INTERVAL '7 days'),
+            CASE WHEN l.last_update > NOW() - INTERVAL '7 days' THEN l.last_update END
+        ) + INTERVAL '7 days'
+    WHERE {PRICE_ANCHORS_DUE} {{scope}}
+    RETURNING l.market_id
+"""
+
+
+def refresh_price_anchors(cursor, market_id=None):
+    """
+    Recomputes the due anchors of one market, or of every market; usually touches no rows.
+    Runs in the caller's transaction. Returns the ids of the markets whose rows changed.
+    """
+    if market_id is None:
+        cursor.execute(PRICE_ANCHOR_REFRESH_SQL.format(scope=''))
+    else:
+        cursor.execute(PRICE_ANCHOR_REFRESH_SQL.format(scope='AND l.market_id = %(market_id)s'), {'market_id': market_id})
+    return {row[0] for row in cursor.fetchall()}
+
+
+def refresh_all_price_anchors():
+    """
+    The catch-up job: stores every market's due anchors in one transaction, so markets
+    without new games stop paying for the lookup on every read. Optional for correctness.
+    """
+    with db_connection() as conn:
+        with conn.cursor() as c:
+            markets = refresh_price_anchors(c)
+        conn.commit()
+    print(f"Refreshed price anchors in {len(markets)} market(s).")
+    return markets
+
+
+if __name__ == "__main__":
+    # Usage (from backend/): python -m lib.price_anchors refresh
+    if sys.argv[1:] != ['refresh']:
+        sys.exit("Usage: python -m lib.price_anchors refresh")
+    refresh_all_price_anchors()
@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Serialized response bytes kept per process; /candles and /manage bodies vary widely in size
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get('RESPONSE_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+# Upper bound on staleness for writes this process never hears about (price replays and
+# anchor refreshes run from the command line, other API instances) and for time-relative results
+RESPONSE_CACHE_TTL = float(os.environ.get('RESPONSE_CACHE_TTL', 60))
+
+
+class ResponseCache:
+    """
+    Serialized JSON responses of the market read endpoints, keyed by market and request.
+
+    Every market has a version number. Writers bump it after their transaction
+    commits (the tracker after a refresh, the API after a mutation), which makes
+    every cached response of that market stale at once; entries are only reused
+    while their version is current and they are younger than ttl. The store is one
+    LRU across all markets, capped at max_bytes of response bodies; a body larger than
+    that is served but not kept.
+    """
+
+    def __init__(self, max_bytes=RESPONSE_CACHE_MAX_BYTES, ttl=RESPONSE_CACHE_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._versions = {}  # market_id -> int
+        self._entries = OrderedDict()  # (market_id, key) -> (version, stored_at, etag, body)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'not_modified': 0, 'misses': 0, 'stale': 0, 'evictions': 0, 'invalidations': 0}
+
+    def version(self, market_id):
+        """Read before querying the database, so a bump during the query marks the result stale."""
+        return self._versions.get(market_id, 0)
+
+    def bump(self, market_id):
+        with self._lock:
+            self._versions[market_id] = self._versions.get(market_id, 0) + 1
+            self.stats['invalidations'] += 1
+
+    def get(self, market_id, key, if_none_match=None):
+        """
+        Returns (etag, body) for a fresh entry, or None on a miss. body is None when
+        the client's If-None-Match already names this version (answer 304).
+        """
+        with self._lock:
+            entry = self._entries.get((market_id, key))
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            version, stored_at, etag, body = entry
+            if version != self._versions.get(market_id, 0) or time.monotonic() - stored_at > self.ttl:
+                del self._entries[(market_id, key)]
+                self._bytes -= len(body)
+                self.stats['stale'] += 1
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end((market_id, key))
+            if if_none_match and etag in (tag.strip() for tag in if_none_match.split(',')):
+                self.stats['not_modified'] += 1
+                return etag, None
+            self.stats['hits'] += 1
+            return etag, body
+
+    def put(self, market_id, key, version, payload):
+        """Serializes payload and stores it under the version read before the query; returns (etag, body)."""
+        body = json.dumps(payload, separators=(',', ':')).encode()
+        etag = f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"'
+        with self._lock:
+            if version == self._versions.get(market_id, 0) and len(body) <= self.max_bytes:
+                old = self._entries.pop((market_id, key), None)
+                if old is not None:
+                    self._bytes -= len(old[3])
+                self._entries[(market_id, key)] = (version, time.monotonic(), etag, body)
+                self._bytes += len(body)
+                while self._bytes > self.max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self._bytes -= len(evicted[3])
+                    self.stats['evictions'] += 1
+        return etag, body
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            lookups = stats['hits'] + stats['not_modified'] + stats['misses']
+            stats['hit_ratio'] = (stats['hits'] + stats['not_modified']) / lookups if lookups else 0.0
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._bytes
+            stats['markets'] = len({market_id for market_id, _ in self._entries})
+        return stats
+
+
+# --- Shared, process-wide cache for the market read endpoints ---
+response_cache = ResponseCache()
@@ -0,0 +1,278 @@
+import asyncio
+import os
+import re
+import threading
+import time
+from collections import deque
+import requests
+from dotenv import load_dotenv
+from lib.match_cache import match_cache
+
+load_dotenv()
+
+RIOT_BASE_URL = "https://americas.api.riotgames.com"
+
+# Development keys: 20 requests every 1s and 100 requests every 2 minutes.
+# Production keys advertise their own limits through the response headers.
+DEFAULT_APP_RATE_LIMIT = os.environ.get('RIOT_APP_RATE_LIMIT', '20:1,100:120')
+# Riot starts its windows when it receives the first request, so leave a little slack
+WINDOW_SAFETY_MARGIN = 0.05
+# Until a method's first response reveals its limits, only one request of it is in flight.
+# A probe that never answers (network error) stops holding the others back after this long.
+METHOD_PROBE_TIMEOUT = 10.0
+METHOD_PROBE_POLL = 0.05
+MAX_RETRIES = 3
+# A Riot ID maps to a stable PUUID, so resolutions are kept for a day
+PUUID_CACHE_TTL = float(os.environ.get('PUUID_CACHE_TTL', 24 * 60 * 60))
+
+
+class RiotRateLimitError(Exception):
+    """Raised when a request is still rate limited after MAX_RETRIES attempts."""
+
+
+def parse_rate_limits(header_value):
+    """Parses a Riot limit header such as '20:1,100:120' into [(20, 1.0), (100, 120.0)]."""
+    limits = []
+    for part in (header_value or '').split(','):
+        if ':' not in part:
+            continue
+        count, seconds = part.strip().split(':')
+        limits.append((int(count), float(seconds)))
+    return limits
+
+
+def method_key(url):
+    """Groups URLs into the endpoint buckets Riot applies method rate limits to."""
+    path = url.split('?', 1)[0].replace(RIOT_BASE_URL, '')
+    if '/riot/account/v1/accounts/by-riot-id/' in path:
+        return 'account-v1.by-riot-id'
+    if '/lol/match/v5/matches/by-puuid/' in path:
+        return 'match-v5.by-puuid-ids'
+    if re.search(r'/lol/match/v5/matches/[^/]+/timeline$', path):
+        return 'match-v5.timeline'
+    if re.search(r'/lol/match/v5/matches/[^/]+$', path):
+        return 'match-v5.match'
+    return path
+
+
+class _Window:
+    """A sliding log of request times for one `limit` per `seconds` window."""
+
+    def __init__(self, limit, seconds):
+        self.limit = limit
+        self.seconds = seconds
+        self.sent = deque()
+
+    def _prune(self, now):
+        horizon = now - self.seconds - WINDOW_SAFETY_MARGIN
+        while self.sent and self.sent[0] <= horizon:
+            self.sent.popleft()
+
+    def wait_time(self, now):
+        self._prune(now)
+        if len(self.sent) < self.limit:
+            return 0.0
+        return self.sent[len(self.sent) - self.limit] + self.seconds + WINDOW_SAFETY_MARGIN - now
+
+    def record(self, now):
+        self.sent.append(now)
+
+
+class RiotRateLimiter:
+    """
+    Proactive limiter for Riot's application and method rate limits.
+
+    Every request reserves a slot in all application windows (per-second and
+    per-2-minutes) and in the windows of its method before it is sent, so the
+    process stays under the limits instead of reacting to 429s. The windows
+    re-tune themselves from the X-App-Rate-Limit / X-Method-Rate-Limit headers
+    and their -Count companions; a method whose limits are not known yet gets a
+    single probe request first. Safe to share between threads and coroutines.
+    """
+
+    def __init__(self, app_limits=DEFAULT_APP_RATE_LIMIT):
+        self._lock = threading.Lock()
+        self._app_windows = [_Window(limit, seconds) for limit, seconds in parse_rate_limits(app_limits)]
+        self._method_windows = {}
+        self._probes = {}  # method -> when its probe request was sent
+        self._blocked_until = 0.0
+        self.stats = {'requests': 0, 'throttled': 0, 'rate_limited_429': 0}
+
+    def _reserve(self, method):
+        """Records a request and returns 0 if it may go now, otherwise the seconds to wait."""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._blocked_until:
+                return self._blocked_until - now
+            method_windows = self._method_windows.get(method)
+            if method_windows is None and now - self._probes.get(method, -METHOD_PROBE_TIMEOUT) < METHOD_PROBE_TIMEOUT:
+                return METHOD_PROBE_POLL
+            windows = self._app_windows + (method_windows or [])
+            wait = max((w.wait_time(now) for w in windows), default=0.0)
+            if wait > 0:
+                return wait
+            for w in windows:
+                w.record(now)
+            if method_windows is None:
+                self._probes[method] = now
+            self.stats['requests'] += 1
+            return 0.0
+
+    async def acquire(self, method):
+        throttled = False
+        while (wait := self._reserve(method)) > 0:
+            throttled = True
+            await asyncio.sleep(wait)
+        if throttled:
+            with self._lock:
+                self.stats['throttled'] += 1
+
+    def acquire_sync(self, method):
+        throttled = False
+        while (wait := self._reserve(method)) > 0:
+            throttled = True
+            time.sleep(wait)
+        if throttled:
+            with self._lock:
+                self.stats['throttled'] += 1
+
+    def _retune(self, windows, limits_header, counts_header):
+        limits = parse_rate_limits(limits_header)
+        if limits and [(w.limit, w.seconds) for w in windows] != limits:
+            old = {w.seconds: w for w in windows}
+            windows[:] = [_Window(limit, seconds) for limit, seconds in limits]
+            for w in windows:
+                if w.seconds in old:
+                    w.sent = old[w.seconds].sent
+        # If Riot has counted more requests than we have (another process, a restart), catch up
+        now = time.monotonic()
+        for count, seconds in parse_rate_limits(counts_header):
+            for w in windows:
+                if w.seconds == seconds:
+                    w._prune(now)
+                    while len(w.sent) < count:
+                        w.sent.append(now)
+
+    def update_from_headers(self, method, headers):
+        with self._lock:
+            if headers.get('X-App-Rate-Limit'):
+                self._retune(self._app_windows, headers.get('X-App-Rate-Limit'), headers.get('X-App-Rate-Limit-Count'))
+            # Any answer settles the probe; no method header means the method has no limit of its own
+            self._probes.pop(method, None)
+            windows = self._method_windows.setdefault(method, [])
+            if headers.get('X-Method-Rate-Limit'):
+                self._retune(windows, headers.get('X-Method-Rate-Limit'), headers.get('X-Method-Rate-Limit-Count'))
+
+    def penalize(self, retry_after):
+        """Blocks every caller until Retry-After has elapsed."""
+        with self._lock:
+            self.stats['rate_limited_429'] += 1
+            self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+
+
+# --- Shared, process-wide limiter used by the tracker, the data farmer and the analyzers ---
+riot_limiter = RiotRateLimiter()
+
+
+async def fetch_json(session, url, headers, params=None):
+    """GETs a Riot endpoint with an aiohttp session, waiting for a rate-limit slot first."""
+    method = method_key(url)
+    for _ in range(MAX_RETRIES + 1):
+        await riot_limiter.acquire(method)
+        async with session.get(url, headers=headers, params=params) as response:
+            riot_limiter.update_from_headers(method, response.headers)
+            if response.status == 429:
+                retry_after = float(response.headers.get("Retry-After", 10))
+                print(f"Rate limit hit on {method}, waiting {retry_after:.0f}s...")
+                riot_limiter.penalize(retry_after)
+                continue
+            response.raise_for_status()
+            return await response.json()
+    raise RiotRateLimitError(f"Still rate limited after {MAX_RETRIES} retries: {url}")
+
+
+def get_json(url, headers, params=None):
+    """Blocking counterpart of fetch_json for the requests-based scripts."""
+    method = method_key(url)
+    for _ in range(MAX_RETRIES + 1):
+        riot_limiter.acquire_sync(method)
+        response = requests.get(url, headers=headers, params=params)
+        riot_limiter.update_from_headers(method, response.headers)
+        if response.status_code == 429:
+            retry_after = float(response.headers.get("Retry-After", 10))
+            print(f"Rate limit hit on {method}, waiting {retry_after:.0f}s...")
+            riot_limiter.penalize(retry_after)
+            continue
+        response.raise_for_status()
+        return response.json()
+    raise RiotRateLimitError(f"Still rate limited after {MAX_RETRIES} retries: {url}")
+
+
+# --- Match-v5 downloads, served from the shared match cache when possible ---
+def _match_url(match_id, kind):
+    url = f"{RIOT_BASE_URL}/lol/match/v5/matches/{match_id}"
+    return f"{url}/timeline" if kind == 'timeline' else url
+
+
+async def fetch_match(session, match_id, headers, kind='match'):
+    """Async match details (kind='match') or timeline (kind='timeline'), fetched at most once per game."""
+    payload = await asyncio.to_thread(match_cache.get, kind, match_id)
+    if payload is None:
+        payload = await fetch_json(session, _match_url(match_id, kind), headers)
+        await asyncio.to_thread(match_cache.put, kind, match_id, payload)
+    return payload
+
+
+def get_match(match_id, headers, kind='match'):
+    """Blocking counterpart of fetch_match."""
+    payload = match_cache.get(kind, match_id)
+    if payload is None:
+        payload = get_json(_match_url(match_id, kind), headers)
+        match_cache.put(kind, match_id, payload)
+    return payload
+
+
+# --- PUUID resolution with an in-process TTL cache ---
+_puuid_cache = {}  # lower-cased Riot ID -> (puuid, expires_at)
+_puuid_lock = threading.Lock()
+
+
+def _account_url(player_tag):
+    game_name, tag_line = player_tag.split('#')
+    return f"{RIOT_BASE_URL}/riot/account/v1/accounts/by-riot-id/{game_name}/{tag_line}"
+
+
+def cached_puuid(player_tag):
+    with _puuid_lock:
+        entry = _puuid_cache.get(player_tag.lower())
+    if entry and entry[1] > time.monotonic():
+        return entry[0]
+    return None
+
+
+def remember_puuid(player_tag, puuid):
+    with _puuid_lock:
+        _puuid_cache[player_tag.lower()] = (puuid, time.monotonic() + PUUID_CACHE_TTL)
+
+
+def forget_puuid(player_tag):
+    with _puuid_lock:
+        _puuid_cache.pop(player_tag.lower(), None)
+
+
+async def resolve_puuid(session, player_tag, headers):
+    """Async Riot ID -> PUUID, calling account-v1 only on a cache miss."""
+    puuid = cached_puuid(player_tag)
+    if puuid is None:
+        puuid = (await fetch_json(session, _account_url(player_tag), headers))['puuid']
+        remember_puuid(player_tag, puuid)
+    return puuid
+
+
+def get_puuid(player_tag, headers):
+    """Blocking counterpart of resolve_puuid."""
+    puuid = cached_puuid(player_tag)
+    if puuid is None:
+        puuid = get_json(_account_url(player_tag), headers)['puuid']
+        remember_puuid(player_tag, puuid)
+    return puuid
@@ -3,6 +3,7 @@ import requests
 from dotenv import load_dotenv
 import json
 from datetime import datetime
+from lib.riot_api import get_json, get_match, get_puuid
 
 # Load environment variables
 load_dotenv()
@@ -17,25 +18,16 @@ class MatchAnalyzer:
     def get_account_by_riot_id(self, game_name, tag_line):
         """Get account info using Riot ID (game name + tag)"""
         url = f"https://americas.api.riotgames.com/riot/account/v1/accounts/by-riot-id/{game_name}/{tag_line}"
-        response = requests.get(url, headers=self.headers)
-        response.raise_for_status()
-        return response.json()
+        return get_json(url, self.headers)
 
     def get_match_data(self, match_id, summoner_name):
         """Get all data for a specific player in a match"""
         try:
-            # Split summoner name into game name and tag
-            game_name, tag_line = summoner_name.split('#')
-            
-            # Get PUUID
-            account_data = self.get_account_by_riot_id(game_name, tag_line)
-            puuid = account_data['puuid']
+            # Get PUUID (cached after the first lookup)
+            puuid = get_puuid(summoner_name, self.headers)
             
             # Get match details
-            url = f"https://americas.api.riotgames.com/lol/match/v5/matches/{match_id}"
-            response = requests.get(url, headers=self.headers)
-            response.raise_for_status()
-            match_data = response.json()
+            match_data = get_match(match_id, self.headers)
             
             # Find player in participants
             player_data = None
@@ -0,0 +1,85 @@
+-- Base schema: the tables the API, tracker and worker were written against, plus the indexes
+-- their hot queries need. Every statement is idempotent, so this is a no-op for tables that
+-- already exist and only adds the missing indexes to an existing database.
+-- Columns added later (puuid, match_watermark, ...) come from the numbered migrations after this one.
+-- Apply with: python -m lib.migrations apply
+CREATE TABLE IF NOT EXISTS profiles (
+    -- Supabase auth user id
+    id UUID PRIMARY KEY,
+    username TEXT,
+    subscription_tier TEXT NOT NULL DEFAULT 'free',
+    -- Read by the frontend's trade page
+    gold DOUBLE PRECISION NOT NULL DEFAULT 0,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS markets (
+    id SERIAL PRIMARY KEY,
+    name TEXT NOT NULL,
+    creator_id UUID NOT NULL REFERENCES profiles(id) ON DELETE CASCADE,
+    invite_code TEXT NOT NULL UNIQUE,
+    tier TEXT NOT NULL DEFAULT 'free',
+    player_limit INTEGER NOT NULL DEFAULT 10,
+    champions_per_player_limit INTEGER NOT NULL DEFAULT 1,
+    config_multipliers JSONB,
+    last_refreshed_at TIMESTAMPTZ,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS market_members (
+    market_id INTEGER NOT NULL REFERENCES markets(id) ON DELETE CASCADE,
+    user_id UUID NOT NULL REFERENCES profiles(id) ON DELETE CASCADE,
+    joined_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (market_id, user_id)
+);
+
+CREATE TABLE IF NOT EXISTS market_players (
+    id SERIAL PRIMARY KEY,
+    market_id INTEGER NOT NULL REFERENCES markets(id) ON DELETE CASCADE,
+    player_tag TEXT NOT NULL,
+    listed_by_user_id UUID REFERENCES profiles(id) ON DELETE SET NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    UNIQUE (market_id, player_tag)
+);
+
+CREATE TABLE IF NOT EXISTS player_champions (
+    market_player_id INTEGER NOT NULL REFERENCES market_players(id) ON DELETE CASCADE,
+    champion_name TEXT NOT NULL,
+    PRIMARY KEY (market_player_id, champion_name)
+);
+
+CREATE TABLE IF NOT EXISTS stock_values (
+    id BIGSERIAL PRIMARY KEY,
+    market_id INTEGER NOT NULL REFERENCES markets(id) ON DELETE CASCADE,
+    market_player_id INTEGER NOT NULL REFERENCES market_players(id) ON DELETE CASCADE,
+    player_tag TEXT NOT NULL,
+    stock_value DOUBLE PRECISION NOT NULL,
+    model_score DOUBLE PRECISION,
+    -- NULL for the IPO row written when a player is listed
+    game_id TEXT,
+    champion_played TEXT,
+    timestamp TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS processed_games (
+    market_player_id INTEGER NOT NULL REFERENCES market_players(id) ON DELETE CASCADE,
+    game_id TEXT NOT NULL,
+    player_tag TEXT NOT NULL,
+    champion TEXT,
+    processed_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- --- Hot-path indexes ---
+-- Scores, history and performers: one player's prices in a market, newest first
+CREATE INDEX IF NOT EXISTS stock_values_market_tag_timestamp_idx
+    ON stock_values (market_id, player_tag, timestamp DESC);
+-- Latest price and 24h/7d anchors per player (market_player_latest, price replay)
+CREATE INDEX IF NOT EXISTS stock_values_player_timestamp_idx
+    ON stock_values (market_player_id, timestamp DESC);
+-- The tracker's "already processed?" lookup for a refresh's candidate matches
+CREATE INDEX IF NOT EXISTS processed_games_player_game_idx
+    ON processed_games (market_player_id, game_id);
+-- "Which markets is this user in?" (market_members' primary key leads with market_id)
+CREATE INDEX IF NOT EXISTS market_members_user_idx ON market_members (user_id);
+-- Tier limit on how many markets list the same player
+CREATE INDEX IF NOT EXISTS market_players_player_tag_idx ON market_players (player_tag);
@@ -0,0 +1,4 @@
+-- Store each listed player's PUUID so the tracker does not call account-v1 on every refresh.
+-- NULL means "not resolved yet"; the tracker fills it in on the next refresh.
+-- Apply with: python -m lib.migrations apply
+ALTER TABLE market_players ADD COLUMN IF NOT EXISTS puuid TEXT;
@@ -0,0 +1,4 @@
+-- Per-player polling watermark: end time (epoch seconds) of the newest game the tracker has examined.
+-- Refreshes ask match-v5 only for games since this point. NULL means "never polled".
+-- Apply with: python -m lib.migrations apply
+ALTER TABLE market_players ADD COLUMN IF NOT EXISTS match_watermark BIGINT;
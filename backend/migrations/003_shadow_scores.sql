@@ -0,0 +1,19 @@
+-- Shadow scoring: every game scored by the serving model version is also scored by the
+-- candidate in models/SHADOW, and both scores are kept here to compare the two versions.
+-- Apply with: python -m lib.migrations apply
+CREATE TABLE IF NOT EXISTS shadow_scores (
+    id BIGSERIAL PRIMARY KEY,
+    market_id INTEGER NOT NULL,
+    market_player_id INTEGER NOT NULL,
+    game_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    primary_version TEXT NOT NULL,
+    primary_score DOUBLE PRECISION NOT NULL,
+    primary_inference_us DOUBLE PRECISION,
+    shadow_version TEXT NOT NULL,
+    shadow_score DOUBLE PRECISION NOT NULL,
+    shadow_inference_us DOUBLE PRECISION,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_shadow_scores_versions ON shadow_scores (shadow_version, primary_version, created_at);
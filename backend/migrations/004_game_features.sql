@@ -0,0 +1,29 @@
+-- Feature store: the 17 FEATURE_ORDER inputs of every scored game, written in the same
+-- transaction as its price, so history can be re-scored without calling the Riot API again.
+-- REAL (float4) is lossless for scoring: the tree models compare their inputs as float32.
+-- Apply with: python -m lib.migrations apply
+CREATE TABLE IF NOT EXISTS game_features (
+    market_player_id INTEGER NOT NULL REFERENCES market_players(id) ON DELETE CASCADE,
+    game_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    champion TEXT NOT NULL,
+    kda REAL NOT NULL,
+    kill_participation REAL NOT NULL,
+    team_damage_share REAL NOT NULL,
+    team_gold_share REAL NOT NULL,
+    win_loss REAL NOT NULL,
+    dmg_to_champions_per_min REAL NOT NULL,
+    gold_diff_15 REAL NOT NULL,
+    exp_diff_15 REAL NOT NULL,
+    objective_damage_per_min REAL NOT NULL,
+    team_objective_damage_share REAL NOT NULL,
+    vision_score_per_min REAL NOT NULL,
+    team_vision_score_share REAL NOT NULL,
+    damage_taken_per_min REAL NOT NULL,
+    damage_taken_share REAL NOT NULL,
+    healing_shielding_allies_per_min REAL NOT NULL,
+    gold_diff_per_min REAL NOT NULL,
+    exp_diff_per_min REAL NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (market_player_id, game_id)
+);
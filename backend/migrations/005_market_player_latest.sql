@@ -0,0 +1,28 @@
+-- Per-player price summary read by GET /api/markets/{id}/stocks instead of scanning stock_values.
+-- current_price/last_update are the newest stock_values row, written in the same transaction as it.
+-- price_24h/price_7d are the newest prices at or before 24h/7d ago. They only change as time passes:
+-- next_24h_at/next_7d_at are when the next younger price crosses that line (NULL: no younger price yet),
+-- and the API recomputes a row's anchors once that moment has passed.
+-- Apply with: python -m lib.migrations apply
+CREATE INDEX IF NOT EXISTS stock_values_player_timestamp_idx
+    ON stock_values (market_player_id, timestamp DESC);
+
+CREATE TABLE IF NOT EXISTS market_player_latest (
+    market_player_id INTEGER PRIMARY KEY REFERENCES market_players(id) ON DELETE CASCADE,
+    market_id INTEGER NOT NULL,
+    current_price DOUBLE PRECISION NOT NULL,
+    last_update TIMESTAMPTZ NOT NULL,
+    price_24h DOUBLE PRECISION,
+    price_7d DOUBLE PRECISION,
+    next_24h_at TIMESTAMPTZ,
+    next_7d_at TIMESTAMPTZ
+);
+
+CREATE INDEX IF NOT EXISTS market_player_latest_market_idx ON market_player_latest (market_id);
+
+-- Backfill from the existing history; anchors are refreshed by the first read after this
+INSERT INTO market_player_latest (market_player_id, market_id, current_price, last_update, next_24h_at, next_7d_at)
+SELECT DISTINCT ON (market_player_id) market_player_id, market_id, stock_value, timestamp, NOW(), NOW()
+FROM stock_values
+ORDER BY market_player_id, timestamp DESC
+ON CONFLICT (market_player_id) DO NOTHING;
@@ -0,0 +1,34 @@
+-- OHLC rollups of stock_values at 15m/1h/1d (lib/candles.py RESOLUTIONS), folded in by the same
+-- transaction that writes each price, so a chart read touches a bounded number of rows per player.
+-- Buckets are date_bin() aligned to 2000-01-01 UTC.
+-- Apply with: python -m lib.migrations apply
+CREATE TABLE IF NOT EXISTS stock_candles (
+    market_player_id INTEGER NOT NULL REFERENCES market_players(id) ON DELETE CASCADE,
+    market_id INTEGER NOT NULL,
+    resolution TEXT NOT NULL,
+    bucket_start TIMESTAMPTZ NOT NULL,
+    open DOUBLE PRECISION NOT NULL,
+    high DOUBLE PRECISION NOT NULL,
+    low DOUBLE PRECISION NOT NULL,
+    close DOUBLE PRECISION NOT NULL,
+    open_at TIMESTAMPTZ NOT NULL,
+    close_at TIMESTAMPTZ NOT NULL,
+    samples INTEGER NOT NULL,
+    PRIMARY KEY (market_player_id, resolution, bucket_start)
+);
+
+CREATE INDEX IF NOT EXISTS stock_candles_market_idx ON stock_candles (market_id);
+
+-- Backfill from the existing history
+INSERT INTO stock_candles
+    (market_player_id, market_id, resolution, bucket_start, open, high, low, close, open_at, close_at, samples)
+SELECT sv.market_player_id, sv.market_id, r.resolution,
+       date_bin(r.width, sv.timestamp, TIMESTAMPTZ '2000-01-01 00:00:00+00') AS bucket_start,
+       (array_agg(sv.stock_value ORDER BY sv.timestamp ASC))[1],
+       MAX(sv.stock_value), MIN(sv.stock_value),
+       (array_agg(sv.stock_value ORDER BY sv.timestamp DESC))[1],
+       MIN(sv.timestamp), MAX(sv.timestamp), COUNT(*)
+FROM stock_values sv
+CROSS JOIN (VALUES ('15m', INTERVAL '15 minutes'), ('1h', INTERVAL '1 hour'), ('1d', INTERVAL '1 day')) AS r(resolution, width)
+GROUP BY sv.market_player_id, sv.market_id, r.resolution, 4
+ON CONFLICT (market_player_id, resolution, bucket_start) DO NOTHING;
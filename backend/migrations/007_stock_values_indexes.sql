@@ -0,0 +1,6 @@
+-- Composite index for the per-player reads of stock_values: recent scores (a LEAD window that
+-- stops after LIMIT rows), price history and the performers' DISTINCT ON (player_tag) all
+-- filter on (market_id, player_tag) and walk timestamp newest first.
+-- Apply with: python -m lib.migrations apply
+CREATE INDEX IF NOT EXISTS stock_values_market_tag_timestamp_idx
+    ON stock_values (market_id, player_tag, timestamp DESC);
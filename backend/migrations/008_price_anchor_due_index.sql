@@ -0,0 +1,7 @@
+-- The 24h/7d anchors in market_player_latest (see 005) are no longer recomputed by the API's
+-- reads: the tracker's flush, price replays and the scheduled job (lib.price_anchors) refresh
+-- every row whose next_24h_at/next_7d_at has passed. This index finds those rows without
+-- reading the whole summary; LEAST ignores NULLs, like the job's predicate.
+-- Apply with: python -m lib.migrations apply
+CREATE INDEX IF NOT EXISTS market_player_latest_anchor_due_idx
+    ON market_player_latest ((LEAST(next_24h_at, next_7d_at)));
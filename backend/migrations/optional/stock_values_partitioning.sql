@@ -0,0 +1,62 @@
+-- Opt-in: range-partitions stock_values by month on timestamp, so old months can be detached or
+-- dropped cheaply and time-bounded reads only touch the months they cover.
+-- Written against the stock_values of 000_base_schema.sql (BIGSERIAL id). The primary key becomes
+-- (id, timestamp) because a partitioned table's keys must include the partition column.
+-- The old table is kept as stock_values_unpartitioned; drop it once the new one checks out.
+-- Run `python -m lib.migrations partitions` (e.g. daily) so next months' partitions exist before
+-- rows arrive: rows that land in stock_values_default block creating their month's partition.
+-- Apply with: python -m lib.migrations partition
+ALTER TABLE stock_values RENAME TO stock_values_unpartitioned;
+ALTER INDEX IF EXISTS stock_values_pkey RENAME TO stock_values_unpartitioned_pkey;
+ALTER INDEX IF EXISTS stock_values_market_tag_timestamp_idx RENAME TO stock_values_unpartitioned_market_tag_timestamp_idx;
+ALTER INDEX IF EXISTS stock_values_player_timestamp_idx RENAME TO stock_values_unpartitioned_player_timestamp_idx;
+
+CREATE TABLE stock_values (
+    id BIGINT NOT NULL DEFAULT nextval('stock_values_id_seq'),
+    market_id INTEGER NOT NULL REFERENCES markets(id) ON DELETE CASCADE,
+    market_player_id INTEGER NOT NULL REFERENCES market_players(id) ON DELETE CASCADE,
+    player_tag TEXT NOT NULL,
+    stock_value DOUBLE PRECISION NOT NULL,
+    model_score DOUBLE PRECISION,
+    game_id TEXT,
+    champion_played TEXT,
+    timestamp TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (id, timestamp)
+) PARTITION BY RANGE (timestamp);
+ALTER SEQUENCE stock_values_id_seq OWNED BY stock_values.id;
+
+CREATE TABLE stock_values_default PARTITION OF stock_values DEFAULT;
+
+-- Creates the monthly partitions from the given month through `months_ahead` months from now
+CREATE OR REPLACE FUNCTION create_stock_values_partitions(months_ahead INTEGER, from_month TIMESTAMPTZ DEFAULT NOW())
+RETURNS INTEGER AS $$
+DECLARE
+    month_start TIMESTAMPTZ := date_trunc('month', from_month);
+    last_month TIMESTAMPTZ := date_trunc('month', NOW()) + make_interval(months => months_ahead);
+    created INTEGER := 0;
+    partition_name TEXT;
+BEGIN
+    WHILE month_start <= last_month LOOP
+        partition_name := 'stock_values_' || to_char(month_start, 'YYYY_MM');
+        IF to_regclass(partition_name) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF stock_values FOR VALUES FROM (%L) TO (%L)',
+                partition_name, month_start, month_start + INTERVAL '1 month'
+            );
+            created := created + 1;
+        END IF;
+        month_start := month_start + INTERVAL '1 month';
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT create_stock_values_partitions(3, COALESCE((SELECT MIN(timestamp) FROM stock_values_unpartitioned), NOW()));
+
+-- Created on the parent, so every partition gets them
+CREATE INDEX stock_values_market_tag_timestamp_idx ON stock_values (market_id, player_tag, timestamp DESC);
+CREATE INDEX stock_values_player_timestamp_idx ON stock_values (market_player_id, timestamp DESC);
+
+INSERT INTO stock_values (id, market_id, market_player_id, player_tag, stock_value, model_score, game_id, champion_played, timestamp)
+SELECT id, market_id, market_player_id, player_tag, stock_value, model_score, game_id, champion_played, timestamp
+FROM stock_values_unpartitioned;
@@ -1,44 +1,18 @@
-import pickle
 import pandas as pd
 import numpy as np
 import os
+import sys
 
-# --- CRITICAL: This list MUST be identical to the one in your tracker.py ---
-FEATURE_ORDER = [
-    'kda',
-    'kill_participation',
-    'team_damage_share',
-    'team_gold_share',
-    'win_loss',
-    'dmg_to_champions_per_min',
-    'gold_diff_15',
-    'exp_diff_15',
-    'objective_damage_per_min',
-    'team_objective_damage_share',
-    'vision_score_per_min',
-    'team_vision_score_share',
-    'damage_taken_per_min',
-    'damage_taken_share',
-    'healing_shielding_allies_per_min',
-    'gold_diff_per_min',
-    'exp_diff_per_min'
-]
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from lib.model_registry import model_registry
+from lib.features import FEATURE_ORDER
 
 
 def load_models():
-    """Loads the 5 specialist model .pkl files from the parent 'backend' directory."""
+    """Loads the 5 specialist models through the shared model registry (compiled artifacts or the .pkl files)."""
     print("--- Loading all specialist models ---")
-    models = {}
-    roles = ['Top', 'Jungle', 'Mid', 'ADC', 'Support']
-    
-    script_dir = os.path.dirname(__file__)
-    backend_dir = os.path.join(script_dir, '..')
-
     try:
-        for role in roles:
-            model_path = os.path.join(backend_dir, f'{role.lower()}_model.pkl')
-            with open(model_path, 'rb') as f_model:
-                models[role] = pickle.load(f_model)
+        models = model_registry.get()
         print("All 5 models loaded successfully.\n")
         return models
     except FileNotFoundError as e:
@@ -0,0 +1,226 @@
+import argparse
+import io
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.append('.')
+
+from lib.candles import CANDLE_REBUILD_SQL
+from lib.database import db_connection, lock_market_prices
+from lib.model_compiler import CompiledGradientBoosting
+from lib.model_registry import model_registry
+from lib.features import FEATURE_ORDER
+from lib.price_anchors import refresh_price_anchors
+
+IPO_PRICE = 10.0
+PRICE_FLOOR = 0.1
+FETCH_CHUNK = 100_000
+PREDICT_CHUNK = 100_000
+
+
+# --- Load: a market's scored games, player by player in timestamp order ---
+def load_market_history(conn, market_id):
+    """
+    Streams the market's scored games with a server-side cursor into column arrays, ordered
+    by player then time. Games scored before the feature store existed have no features;
+    they keep their stored model_score.
+    """
+    columns = {name: [] for name in ('market_player_id', 'player_tag', 'game_id', 'stock_value', 'model_score', 'role')}
+    feature_chunks = []
+    with conn.cursor() as c:
+        c.execute("SELECT tier, config_multipliers FROM markets WHERE id = %s", (market_id,))
+        row = c.fetchone()
+        if not row:
+            raise ValueError(f"Market {market_id} does not exist")
+        multipliers = row[1] or {}
+
+        # The IPO row (no game) is each player's starting price
+        c.execute("""
+            SELECT DISTINCT ON (market_player_id) market_player_id, stock_value
+            FROM stock_values
+            WHERE market_id = %s AND game_id IS NULL
+            ORDER BY market_player_id, timestamp ASC
+        """, (market_id,))
+        ipo_prices = {mp_id: float(price) for mp_id, price in c.fetchall()}
+
+    with conn.cursor(name='price_replay') as c:
+        c.itersize = FETCH_CHUNK
+        c.execute(f"""
+            SELECT sv.market_player_id, sv.player_tag, sv.game_id, sv.stock_value, sv.model_score, gf.role,
+                   {', '.join(f'gf.{name}' for name in FEATURE_ORDER)}
+            FROM stock_values sv
+            LEFT JOIN game_features gf
+                ON gf.market_player_id = sv.market_player_id AND gf.game_id = sv.game_id
+            WHERE sv.market_id = %s AND sv.game_id IS NOT NULL
+            ORDER BY sv.market_player_id, sv.timestamp, sv.game_id
+        """, (market_id,))
+        while True:
+            rows = c.fetchmany(FETCH_CHUNK)
+            if not rows:
+                break
+            head = list(zip(*(r[:6] for r in rows)))
+            for name, values in zip(columns, head):
+                columns[name].extend(values)
+            # Missing features come back as None -> NaN
+            feature_chunks.append(np.array([r[6:] for r in rows], dtype=np.float64))
+
+    history = {
+        'market_player_id': np.array(columns['market_player_id'], dtype=np.int64),
+        'player_tag': np.array(columns['player_tag'], dtype=object),
+        'game_id': np.array(columns['game_id'], dtype=object),
+        'stock_value': np.array(columns['stock_value'], dtype=np.float64),
+        'model_score': np.array(columns['model_score'], dtype=np.float64),
+        'role': np.array(columns['role'], dtype=object),
+        'features': np.vstack(feature_chunks) if feature_chunks else np.empty((0, len(FEATURE_ORDER))),
+    }
+    return history, ipo_prices, multipliers
+
+
+# --- Inference: one vectorized predict per role and chunk ---
+def _predict(model, matrix):
+    if isinstance(model, CompiledGradientBoosting):
+        return model.predict(matrix)
+    return model.predict(pd.DataFrame(matrix, columns=FEATURE_ORDER))
+
+
+def rescore(history, models):
+    """New clipped model scores; games without stored features keep their old score."""
+    scores = history['model_score'].copy()
+    has_features = ~np.isnan(history['features']).any(axis=1)
+    for role, model in models.items():
+        idx = np.flatnonzero(has_features & (history['role'] == role))
+        for start in range(0, len(idx), PREDICT_CHUNK):
+            chunk = idx[start:start + PREDICT_CHUNK]
+            scores[chunk] = np.clip(_predict(model, history['features'][chunk]), 0, 10)
+    return scores, int(has_features.sum())
+
+
+# --- Pricing: the calculate_new_stock recurrence, folded per player with NumPy ---
+def replay_prices(player_ids, scores, ipo_prices, multiplier=1.0, alpha=0.4):
+    """
+    calculate_new_stock is x_t = max(0.1, x_{t-1} + alpha * 2 * (score_t * multiplier - 5)).
+    That is a random walk reflected at the floor, so with S_t = x_0 + cumsum(d)_t it has the
+    closed form x_t = S_t + max(0, max_{k<=t}(0.1 - S_k)), which is two cumulative ufuncs per player.
+    player_ids must be grouped (the order load_market_history returns).
+    """
+    prices = np.empty_like(scores)
+    steps = alpha * 2 * (scores * multiplier - 5)
+    boundaries = np.flatnonzero(np.diff(player_ids)) + 1
+    for start, end in zip(np.r_[0, boundaries], np.r_[boundaries, len(player_ids)]):
+        if start == end:
+            continue
+        walk = ipo_prices.get(int(player_ids[start]), IPO_PRICE) + np.cumsum(steps[start:end])
+        lift = np.maximum.accumulate(PRICE_FLOOR - walk)
+        prices[start:end] = walk + np.maximum(lift, 0.0)
+    return prices
+
+
+# --- Output: dry-run diff, or an atomic rewrite of the series ---
+def print_diff(history, new_scores, new_prices, top=20):
+    old_prices = history['stock_value']
+    delta = new_prices - old_prices
+    frame = pd.DataFrame({
+        'player_tag': history['player_tag'], 'old_price': old_prices, 'new_price': new_prices,
+        'abs_delta': np.abs(delta), 'score_changed': np.abs(new_scores - history['model_score']) > 1e-9,
+    })
+    summary = frame.groupby('player_tag', sort=False).agg(
+        games=('new_price', 'size'), old_final=('old_price', 'last'), new_final=('new_price', 'last'),
+        max_abs_delta=('abs_delta', 'max'), rescored=('score_changed', 'sum'),
+    ).sort_values('max_abs_delta', ascending=False)
+    print(summary.head(top).to_string(float_format=lambda v: f"{v:.2f}"))
+    print(f"{int((np.abs(delta) > 1e-6).sum())} of {len(delta)} prices change; "
+          f"largest change {np.abs(delta).max() if len(delta) else 0.0:.4f}.")
+
+
+def write_series(conn, market_id, history, new_scores, new_prices):
+    """
+    Rewrites model_score and stock_value for every replayed game, and the market's
+    market_player_latest rows and stock_candles. The caller commits.
+    """
+    buffer = io.StringIO()
+    for mp_id, game_id, score, price in zip(history['market_player_id'], history['game_id'], new_scores, new_prices):
+        buffer.write(f"{int(mp_id)}\t{game_id}\t{float(score)!r}\t{float(price)!r}\n")
+    buffer.seek(0)
+    with conn.cursor() as c:
+        c.execute("""
+            CREATE TEMP TABLE replay_prices (
+                market_player_id INTEGER, game_id TEXT, model_score DOUBLE PRECISION, stock_value DOUBLE PRECISION
+            ) ON COMMIT DROP
+        """)
+        c.copy_from(buffer, 'replay_prices', columns=('market_player_id', 'game_id', 'model_score', 'stock_value'))
+        c.execute("""
+            UPDATE stock_values sv
+            SET model_score = rp.model_score, stock_value = rp.stock_value
+            FROM replay_prices rp
+            WHERE sv.market_id = %s AND sv.market_player_id = rp.market_player_id AND sv.game_id = rp.game_id
+        """, (market_id,))
+        updated = c.rowcount
+        # Replayed prices change the summary too: reload current prices, and recompute the
+        # 24h/7d anchors from the new series
+        c.execute("""
+            UPDATE market_player_latest l SET
+                current_price = (
+                    SELECT sv.stock_value FROM stock_values sv
+                    WHERE sv.market_player_id = l.market_player_id
+                    ORDER BY sv.timestamp DESC LIMIT 1
+                ),
+                next_24h_at = NOW(),
+                next_7d_at = NOW()
+            WHERE l.market_id = %s
+        """, (market_id,))
+        refresh_price_anchors(c, market_id)
+        c.execute(CANDLE_REBUILD_SQL, {'market_id': market_id})
+    return updated
+
+
+def replay_market(market_id, version=None, alpha=0.4, multiplier=None, apply=False):
+    """
+    Re-scores and re-prices a market's history and prints the diff; with apply, writes it.
+    An applied replay holds the market's price lock from the history load to the commit,
+    so a tracker refresh of the same market waits for it and then prices from the new series.
+    """
+    started = time.perf_counter()
+    with db_connection() as conn:
+        if apply:
+            with conn.cursor() as c:
+                lock_market_prices(c, market_id)
+        history, ipo_prices, multipliers = load_market_history(conn, market_id)
+        loaded = time.perf_counter()
+        if len(history['game_id']) == 0:
+            print(f"Market {market_id} has no scored games to replay.")
+            return
+
+        models = model_registry.get(version)
+        new_scores, rescored = rescore(history, models)
+        multiplier = multipliers.get('default', 1.0) if multiplier is None else multiplier
+        new_prices = replay_prices(history['market_player_id'], new_scores, ipo_prices, multiplier, alpha)
+        computed = time.perf_counter()
+
+        games = len(new_prices)
+        print(f"Replayed {games} games for market {market_id} with model version {version or model_registry.default_version()} "
+              f"({rescored} re-scored from stored features, {games - rescored} kept their stored score); "
+              f"alpha={alpha}, multiplier={multiplier}.")
+        print(f"Load {loaded - started:.2f}s, inference + pricing {computed - loaded:.2f}s "
+              f"({games / max(computed - loaded, 1e-9):,.0f} games/s).")
+        print_diff(history, new_scores, new_prices)
+        if apply:
+            updated = write_series(conn, market_id, history, new_scores, new_prices)
+            conn.commit()
+            print(f"Wrote {updated} replayed prices for market {market_id} in one transaction "
+                  f"({time.perf_counter() - computed:.2f}s).")
+        else:
+            print("Dry run: nothing written. Re-run with --apply to rewrite the series.")
+
+
+if __name__ == "__main__":
+    # Usage (from backend/): python -m services.price_replay <market_id> [--version V] [--alpha A] [--multiplier M] [--apply]
+    parser = argparse.ArgumentParser(description="Re-score a market's history and replay its price series.")
+    parser.add_argument('market_id', type=int)
+    parser.add_argument('--version', help="model version to score with (default: the active one)")
+    parser.add_argument('--alpha', type=float, default=0.4)
+    parser.add_argument('--multiplier', type=float, help="override the market's config_multipliers default")
+    parser.add_argument('--apply', action='store_true', help="write the new series instead of only printing the diff")
+    args = parser.parse_args()
+    replay_market(args.market_id, args.version, args.alpha, args.multiplier, args.apply)
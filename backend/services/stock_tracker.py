@@ -1,36 +1,25 @@
 import asyncio
 import aiohttp
-import aiofiles
 import pandas as pd
-from datetime import datetime
-import pickle
+import time
 import sys
-import os
 import numpy as np
-from lib.database import get_connection, get_dict_connection
+from psycopg2.extras import execute_values
+from lib.database import db_connection, lock_market_prices
+from lib.riot_api import fetch_json, fetch_match, resolve_puuid, forget_puuid
+from lib.match_cache import match_cache
+from lib.response_cache import response_cache
+from lib.candles import CANDLE_UPSERT_SQL
+from lib.market_queries import LATEST_PRICES_SQL, MARKET_PLAYERS_SQL, PROCESSED_GAMES_SQL
+from lib.price_anchors import refresh_price_anchors
+from lib.features import FEATURE_ORDER, extract_match_features, participant_index
+from lib.model_compiler import CompiledGradientBoosting
+from lib.model_registry import model_registry
 
 sys.path.append('.')
 
-FEATURE_ORDER = [
-    'kda',
-    'kill_participation',
-    'team_damage_share',
-    'team_gold_share',
-    'win_loss',
-    'dmg_to_champions_per_min',
-    'gold_diff_15',
-    'exp_diff_15',
-    'objective_damage_per_min',
-    'team_objective_damage_share',
-    'vision_score_per_min',
-    'team_vision_score_share',
-    'damage_taken_per_min',
-    'damage_taken_share',
-    'healing_shielding_allies_per_min',
-    'gold_diff_per_min',
-    'exp_diff_per_min'
-]
-
+# match-v5 by-puuid returns at most 100 ids per request
+MATCH_IDS_PAGE_SIZE = 100
 
 
 class PlayerStockTracker:
@@ -39,176 +28,127 @@ class PlayerStockTracker:
         self.headers = {"X-Riot-Token": self.api_key}
         self.base_url = "https://americas.api.riotgames.com" # Corrected base URL
         self.models = {}
+        self.model_version = None
+        self.shadow_models = None
+        self.shadow_version = None
         self.role_name_mapping = {"TOP": "Top", "JUNGLE": "Jungle", "MIDDLE": "Mid", "BOTTOM": "ADC", "UTILITY": "Support"}
         self.valid_game_types = ["RANKED_SOLO_5x5", "RANKED_FLEX_SR", "CLASH", "NORMAL_DRAFT_5x5"]
+        # match-v5 identifies game types by queueId; see https://static.developer.riotgames.com/docs/lol/queues.json
+        self.queue_ids = {"RANKED_SOLO_5x5": 420, "RANKED_FLEX_SR": 440, "CLASH": 700, "NORMAL_DRAFT_5x5": 400}
+        self.valid_queue_ids = {self.queue_ids[t] for t in self.valid_game_types}
 
     async def load_models_async(self):
-        if self.models: return
-        print("--- Asynchronously loading specialist models ---")
+        """
+        Picks up the registry's serving (and shadow) model versions. Between pointer checks this
+        is a plain attribute read, so a version swapped in with `python -m lib.model_registry activate`
+        is served from the next refresh on, without restarting the API.
+        """
         try:
-            for role in ['Top', 'Jungle', 'Mid', 'ADC', 'Support']:
-                model_filename = f'{role.lower()}_model.pkl'
-                async with aiofiles.open(model_filename, 'rb') as f:
-                    content = await f.read()
-                    self.models[role] = pickle.loads(content)
-            print("All models loaded successfully.")
+            current = await asyncio.to_thread(model_registry.current)
         except FileNotFoundError as e:
             print(f"!!! CRITICAL ERROR: Could not load models. Missing file: {e.filename} !!!")
+            return
+        if (current['version'], current['shadow_version']) != (self.model_version, self.shadow_version):
+            for version, models in ((current['version'], current['models']),
+                                    (current['shadow_version'], current['shadow_models'] or {})):
+                for role, model in models.items():
+                    feature_names = getattr(model, 'feature_names', None)
+                    if feature_names and feature_names != FEATURE_ORDER:
+                        raise ValueError(f"{role} model in version {version} expects features {feature_names}")
+            print(f"Scoring with model version {current['version']} (shadow: {current['shadow_version']}).")
+        self.models, self.model_version = current['models'], current['version']
+        self.shadow_models, self.shadow_version = current['shadow_models'], current['shadow_version']
 
     # --- Database Methods (Corrected) ---
     def get_market_config_and_players(self, market_id: int):
-        conn = get_dict_connection()
-        try:
+        with db_connection(dict_rows=True) as conn:
             with conn.cursor() as c:
                 c.execute("SELECT tier, config_multipliers FROM markets WHERE id = %s", (market_id,))
                 market_config = c.fetchone()
                 if not market_config: return None, None
 
-                c.execute("""
-                    SELECT mp.id, mp.player_tag, array_agg(pc.champion_name) as champions
-                    FROM market_players mp
-                    JOIN player_champions pc ON mp.id = pc.market_player_id
-                    WHERE mp.market_id = %s
-                    GROUP BY mp.id, mp.player_tag
-                """, (market_id,))
+                c.execute(MARKET_PLAYERS_SQL, {'market_id': market_id})
                 players = c.fetchall()
-                player_map = {p['player_tag']: {'id': p['id'], 'champions': p['champions']} for p in players}
+                player_map = {
+                    p['player_tag']: {'id': p['id'], 'champions': p['champions'], 'puuid': p['puuid'],
+                                      'match_watermark': p['match_watermark']}
+                    for p in players
+                }
                 return market_config, player_map
-        finally:
-            conn.close()
 
-    def is_game_processed(self, market_player_id, game_id):
-        conn = get_connection()
-        try:
+    def prefetch_market_state(self, market_id, market_player_ids, candidate_match_ids):
+        """
+        Loads, with one query each, the already-processed (market_player_id, game_id) pairs
+        for the candidate matches and the latest stock value of every player in the market.
+        Latest values come from the market_player_latest summary, which every price write
+        updates in its own transaction, not from the market's whole stock_values history.
+        """
+        with db_connection() as conn:
             with conn.cursor() as c:
-                c.execute("SELECT 1 FROM processed_games WHERE market_player_id = %s AND game_id = %s", (market_player_id, game_id))
-                return c.fetchone() is not None
-        finally:
-            conn.close()
+                processed = set()
+                if candidate_match_ids:
+                    c.execute(PROCESSED_GAMES_SQL, {'market_player_ids': list(market_player_ids),
+                                                    'game_ids': list(candidate_match_ids)})
+                    processed = {(row[0], row[1]) for row in c.fetchall()}
 
-    def mark_game_processed(self, market_player_id, game_id, player_tag, champion):
-        conn = get_connection()
-        try:
-            with conn.cursor() as c:
-                c.execute("INSERT INTO processed_games (market_player_id, game_id, player_tag, champion) VALUES (%s, %s, %s, %s)",
-                          (market_player_id, game_id, player_tag, champion))
-                conn.commit()
-        finally:
-            conn.close()
-
-    async def _api_request(self, session, url):
-        """A helper to handle requests and potential rate limiting."""
-        async with session.get(url, headers=self.headers) as response:
-            if response.status == 429:
-                print("Rate limit hit, waiting...")
-                retry_after = int(response.headers.get("Retry-After", 10))
-                await asyncio.sleep(retry_after)
-                return await self._api_request(session, url) # Retry the request
-            response.raise_for_status()
-            return await response.json()
+                c.execute(LATEST_PRICES_SQL, {'market_id': market_id})
+                latest_prices = {row[0]: row[1] for row in c.fetchall()}
+        return processed, latest_prices
 
     async def get_puuid(self, session, player_tag):
-        gameName, tagLine = player_tag.split('#')
-        url = f"https://americas.api.riotgames.com/riot/account/v1/accounts/by-riot-id/{gameName}/{tagLine}"
-        data = await self._api_request(session, url)
-        return data['puuid']
-
-    async def get_match_ids(self, session, puuid, count=5):
-        """Gets a list of recent matches, not just the latest one."""
-        url = f"https://americas.api.riotgames.com/lol/match/v5/matches/by-puuid/{puuid}/ids?count={count}"
-        return await self._api_request(session, url)
-
-    async def get_match_data(self, session, match_id):
-        """Fetches match details and timeline concurrently."""
-        details_url = f"https://americas.api.riotgames.com/lol/match/v5/matches/{match_id}"
-        timeline_url = f"https://americas.api.riotgames.com/lol/match/v5/matches/{match_id}/timeline"
-        
-        details_task = asyncio.create_task(self._api_request(session, details_url))
-        timeline_task = asyncio.create_task(self._api_request(session, timeline_url))
-        
-        match_data, timeline_data = await asyncio.gather(details_task, timeline_task)
-        return match_data, timeline_data
-
-    # --- HEAVILY MODIFIED: Calculates all the new, advanced metrics ---
+        """Riot ID -> PUUID through the shared TTL cache; account-v1 is only hit on a miss."""
+        return await resolve_puuid(session, player_tag, self.headers)
+
+    async def get_match_ids(self, session, puuid, start_time=None, count=5):
+        """
+        Gets match ids newest-first. Without a watermark this is the `count` most recent games;
+        with one it is every game since start_time (epoch seconds), paged 100 ids at a time.
+        """
+        url = f"{self.base_url}/lol/match/v5/matches/by-puuid/{puuid}/ids"
+        if start_time is None:
+            return await fetch_json(session, url, self.headers, {'count': count})
+
+        match_ids, start = [], 0
+        while True:
+            page = await fetch_json(session, url, self.headers,
+                                    {'startTime': int(start_time), 'start': start, 'count': MATCH_IDS_PAGE_SIZE})
+            match_ids.extend(page)
+            if len(page) < MATCH_IDS_PAGE_SIZE:
+                return match_ids
+            start += MATCH_IDS_PAGE_SIZE
+
+    async def get_match_details(self, session, match_id):
+        """Fetches match details through the shared match cache."""
+        return await fetch_match(session, match_id, self.headers)
+
+    async def get_match_timeline(self, session, match_id):
+        """Fetches the (large) match timeline; only needed for gold_diff_15 / exp_diff_15."""
+        return await fetch_match(session, match_id, self.headers, kind='timeline')
+
+    def is_scoreable(self, match_data, participant, allowed_champions):
+        """Checks everything that can be decided from the details payload alone."""
+        if match_data['info'].get('queueId') not in self.valid_queue_ids:
+            return False
+        if participant['championName'] not in allowed_champions:
+            return False
+        if match_data['info'].get('gameDuration', 0) / 60.0 < 5:
+            return False
+        return self.role_name_mapping.get(participant['teamPosition'], 'UNKNOWN') in self.models
+
+    # --- Feature extraction, shared with the data farmer (lib/features.py) ---
     def calculate_metrics(self, match_data, timeline_data, puuid):
-       
         if not match_data or not timeline_data:
             return None
-        info = match_data['info']
-        participant = next((p for p in info['participants'] if p['puuid'] == puuid), None)
-        if not participant:
+        index = participant_index(match_data, puuid)
+        if index is None:
             return None
-        
-        game_duration_min = info.get('gameDuration', 0) / 60.0
-        if game_duration_min < 5:
+        if match_data['info'].get('gameDuration', 0) / 60.0 < 5:
             return None
-        
-        team_id = participant['teamId']
-        team_participants = [p for p in info['participants'] if p['teamId'] == team_id]
-        team_total_damage = max(1, sum(p.get('totalDamageDealtToChampions', 0) for p in team_participants))
-        team_total_gold = max(1, sum(p.get('goldEarned', 0) for p in team_participants))
-        team_total_vision = max(1, sum(p.get('visionScore', 0) for p in team_participants))
-        team_total_obj_damage = max(1, sum(p.get('damageDealtToObjectives', 0) for p in team_participants))
-        team_total_kills = max(1, sum(p.get('kills', 0) for p in team_participants))
-        team_total_damage_taken = max(1, sum(p.get('totalDamageTaken', 0) for p in team_participants))
-
-        participant_id = participant['participantId']
-        opponent = next((p for p in info['participants'] if p['teamId'] != team_id and p['teamPosition'] == participant['teamPosition']), None)
-        
-        gold_diff_15 = 0
-        exp_diff_15 = 0
-        if opponent and len(timeline_data['info']['frames']) > 15:
-            try:
-                frame_15 = timeline_data['info']['frames'][15]
-                player_frame = frame_15['participantFrames'][str(participant_id)]
-                opponent_frame = frame_15['participantFrames'][str(opponent['participantId'])]
-                gold_diff_15 = player_frame['totalGold'] - opponent_frame['totalGold']
-                exp_diff_15 = player_frame['xp'] - opponent_frame['xp']
-            except KeyError:
-                print(f"Warning: Could not find timeline frame data at 15 mins for match {match_data['metadata']['matchId']}.")
-        
-        player_gpm = participant.get('challenges', {}).get('goldPerMin', 0)
-        player_xpm = participant.get('challenges', {}).get('xpPerMin', 0)
 
-        gold_diff_per_min = 0
-
-        exp_diff_per_min = 0
-        if opponent:
-            # Get the final gold and XP for both players (guaranteed to exist)
-            player_total_gold = participant.get('goldEarned', 0)
-            opponent_total_gold = opponent.get('goldEarned', 0)
-            
-            player_total_exp = participant.get('champExperience', 0)
-            opponent_total_exp = opponent.get('champExperience', 0)
-
-            # Calculate the final difference
-            final_gold_diff = player_total_gold - opponent_total_gold
-            final_exp_diff = player_total_exp - opponent_total_exp
-            
-            # Divide by game length to get the average differential per minute
-            gold_diff_per_min = final_gold_diff / game_duration_min
-            exp_diff_per_min = final_exp_diff / game_duration_min
-
-        metrics = {
-            'role': self.role_name_mapping.get(participant['teamPosition'], 'UNKNOWN'),
-            'kda': (participant.get('kills', 0) + participant.get('assists', 0)) / max(1, participant.get('deaths', 1)),
-            'dmg_to_champions_per_min': participant.get('totalDamageDealtToChampions', 0) / game_duration_min,
-            'team_damage_share': (participant.get('totalDamageDealtToChampions', 0) / team_total_damage) * 100,
-            'team_gold_share': (participant.get('goldEarned', 0) / team_total_gold) * 100,
-            'kill_participation': ((participant.get('kills', 0) + participant.get('assists', 0)) / team_total_kills) * 100,
-            'team_objective_damage_share': (participant.get('damageDealtToObjectives', 0) / team_total_obj_damage) * 100,
-            'team_vision_score_share': (participant.get('visionScore', 0) / team_total_vision) * 100,
-            'damage_taken_share': (participant.get('totalDamageTaken', 0) / team_total_damage_taken) * 100,
-            'gold_diff_15': gold_diff_15,
-            'exp_diff_15': exp_diff_15,
-            'objective_damage_per_min': participant.get('damageDealtToObjectives', 0) / game_duration_min,
-            'vision_score_per_min': participant.get('visionScore', 0) / game_duration_min,
-            'gold_diff_per_min': gold_diff_per_min,
-            'exp_diff_per_min': exp_diff_per_min,
-            'damage_taken_per_min': participant.get('totalDamageTaken', 0) / game_duration_min,
-            'healing_shielding_allies_per_min': (participant.get('totalHealOnTeammates', 0) + participant.get('totalDamageShieldedOnTeammates', 0)) / game_duration_min,
-            'win_loss': 1 if participant.get('win', False) else 0
-        }
+        participant = match_data['info']['participants'][index]
+        features = extract_match_features(match_data, timeline_data)[index]
+        metrics = {'role': self.role_name_mapping.get(participant['teamPosition'], 'UNKNOWN')}
+        metrics.update(zip(FEATURE_ORDER, features.tolist()))
         
         # Print all calculated metrics for debugging
         print(f"=== CALCULATED METRICS for {participant.get('championName', 'Unknown')} ===")
@@ -221,32 +161,104 @@ class PlayerStockTracker:
         
         return metrics
 
-    def get_current_stock(self, market_player_id):
-        conn = get_connection()
-        try:
-            with conn.cursor() as c:
-                c.execute("SELECT stock_value FROM stock_values WHERE market_player_id = %s ORDER BY timestamp DESC LIMIT 1",
-                          (market_player_id,))
-                result = c.fetchone()
-                return result[0] if result else 10.0
-        finally:
-            conn.close()
-
-    def update_stock(self, market_id, market_player_id, player_tag, new_value, model_score, game_id, champion_played):
-        conn = get_connection()
-        try:
-            new_value_f = float(new_value.item() if hasattr(new_value, 'item') else new_value)
-            model_score_f = float(model_score.item() if hasattr(model_score, 'item') else model_score)
+    def flush_market_updates(self, market_id, updates, resolved_puuids=None, watermarks=None, market_config=None):
+        """
+        Write-behind stage: persists every player's new stock_values row, its market_player_latest
+        summary and stock_candles buckets, its processed_games row and its game_features row with one multi-row statement
+        each, inside a single transaction.
+        Either the whole market refresh lands or none of it does. Newly resolved
+        PUUIDs ({market_player_id: puuid}) and advanced match watermarks
+        ({market_player_id: epoch seconds}) are stored in the same transaction.
+
+        The transaction holds the market's price lock, so it cannot interleave with a
+        price replay or another refresh. Prices were computed from the latest prices read
+        before the Riot fetches; a player whose price has moved since (a replay rewrote the
+        series) is re-priced from the new one, and a game another refresh already stored is dropped.
+        The market's due 24h/7d anchors are recomputed in the same transaction.
+        """
+        if not updates and not resolved_puuids and not watermarks:
+            return
+        with db_connection() as conn:
             with conn.cursor() as c:
-                c.execute("""
+                lock_market_prices(c, market_id)
+                # Anchors whose 24h/7d line has passed, before this batch's prices are added
+                refresh_price_anchors(c, market_id)
+                if updates:
+                    updates = self.recheck_updates(c, updates, market_config)
+                if resolved_puuids:
+                    execute_values(c, """
+                        UPDATE market_players SET puuid = v.puuid
+                        FROM (VALUES %s) AS v(id, puuid)
+                        WHERE market_players.id = v.id
+                    """, list(resolved_puuids.items()), page_size=len(resolved_puuids))
+                if watermarks:
+                    execute_values(c, """
+                        UPDATE market_players SET match_watermark = GREATEST(market_players.match_watermark, v.watermark)
+                        FROM (VALUES %s) AS v(id, watermark)
+                        WHERE market_players.id = v.id
+                    """, list(watermarks.items()), page_size=len(watermarks))
+                if not updates:
+                    conn.commit()
+                    return
+                price_rows = [
+                    (market_id, u['market_player_id'], u['player_tag'], float(u['stock_value']), float(u['model_score']),
+                     u['game_id'], u['champion_played'])
+                    for u in updates
+                ]
+                processed_rows = [(u['market_player_id'], u['game_id'], u['player_tag'], u['champion_played']) for u in updates]
+                feature_rows = [
+                    (u['market_player_id'], u['game_id'], u['role'], u['champion_played'], *map(float, u['features']))
+                    for u in updates
+                ]
+                execute_values(c, """
                     INSERT INTO stock_values 
                         (market_id, market_player_id, player_tag, stock_value, model_score, game_id, champion_played) 
-                    VALUES (%s, %s, %s, %s, %s, %s, %s)
-                """,
-                (market_id, market_player_id, player_tag, new_value_f, model_score_f, game_id, champion_played))
-                conn.commit()
-        finally:
-            conn.close()
+                    VALUES %s
+                """, price_rows, page_size=len(price_rows))
+                # Latest-price summary for the stocks endpoint; a player's last update in the batch wins
+                latest_rows = {u['market_player_id']: (u['market_player_id'], market_id, float(u['stock_value'])) for u in updates}
+                execute_values(c, """
+                    INSERT INTO market_player_latest
+                        (market_player_id, market_id, current_price, last_update, next_24h_at, next_7d_at)
+                    VALUES %s
+                    ON CONFLICT (market_player_id) DO UPDATE SET
+                        current_price = EXCLUDED.current_price,
+                        last_update = EXCLUDED.last_update,
+                        next_24h_at = COALESCE(market_player_latest.next_24h_at, EXCLUDED.next_24h_at),
+                        next_7d_at = COALESCE(market_player_latest.next_7d_at, EXCLUDED.next_7d_at)
+                """, list(latest_rows.values()), page_size=len(latest_rows),
+                    template="(%s, %s, %s, NOW(), NOW() + INTERVAL '1 day', NOW() + INTERVAL '7 days')")
+                execute_values(c, CANDLE_UPSERT_SQL.format(prices='VALUES %s'), list(latest_rows.values()),
+                               page_size=len(latest_rows), template="(%s, %s, %s, NOW())")
+                execute_values(c, "INSERT INTO processed_games (market_player_id, game_id, player_tag, champion) VALUES %s",
+                               processed_rows, page_size=len(processed_rows))
+                execute_values(c, f"""
+                    INSERT INTO game_features (market_player_id, game_id, role, champion, {', '.join(FEATURE_ORDER)})
+                    VALUES %s
+                    ON CONFLICT (market_player_id, game_id) DO NOTHING
+                """, feature_rows, page_size=len(feature_rows))
+            conn.commit()
+
+    def recheck_updates(self, c, updates, market_config):
+        """Re-prices updates whose player's price moved since it was read and drops already-stored games. Runs under the lock."""
+        ids = [u['market_player_id'] for u in updates]
+        c.execute("SELECT market_player_id, current_price FROM market_player_latest WHERE market_player_id = ANY(%s)", (ids,))
+        current = dict(c.fetchall())
+        c.execute("SELECT market_player_id, game_id FROM processed_games WHERE market_player_id = ANY(%s) AND game_id = ANY(%s)",
+                  (ids, [u['game_id'] for u in updates]))
+        stored = set(c.fetchall())
+
+        checked = []
+        for u in updates:
+            if (u['market_player_id'], u['game_id']) in stored:
+                print(f"Game {u['game_id']} for {u['player_tag']} was stored by another refresh; skipping it.")
+                continue
+            price = current.get(u['market_player_id'])
+            if price is not None and price != u['priced_from']:
+                print(f"Price of {u['player_tag']} moved from {u['priced_from']:.2f} to {price:.2f} during the refresh; re-pricing.")
+                u = dict(u, priced_from=price, stock_value=self.calculate_new_stock(price, u['model_score'], market_config))
+            checked.append(u)
+        return checked
 
     def calculate_new_stock(self, current_stock, model_score, market_config, alpha=0.4):
         # This is a safer way to handle a potentially None market_config
@@ -280,82 +292,272 @@ class PlayerStockTracker:
         
         return final_stock
 
-    async def process_player(self, session, market_id, market_config, player_tag, player_data):
+    async def get_player_candidates(self, session, player_tag, stored_puuid=None, watermark=None):
+        """
+        Returns a player's PUUID and the match ids played since their watermark, or (None, []) on failure.
+        The PUUID stored on market_players is used as-is and only re-resolved if it fails.
+        """
+        try:
+            puuid = stored_puuid or await self.get_puuid(session, player_tag)
+            if not puuid: return None, []
+            try:
+                return puuid, await self.get_match_ids(session, puuid, start_time=watermark)
+            except aiohttp.ClientResponseError as e:
+                # A stored PUUID can go stale (PUUIDs are encrypted per API key), so resolve it again once
+                if not stored_puuid or e.status not in (400, 404): raise
+                print(f"Stored PUUID for {player_tag} was rejected ({e.status}); re-resolving.")
+                forget_puuid(player_tag)
+                puuid = await self.get_puuid(session, player_tag)
+                return puuid, await self.get_match_ids(session, puuid, start_time=watermark)
+        except Exception as e:
+            print(f"!!! FAILED to fetch recent matches for {player_tag}: {e}")
+            return None, []
+
+    def match_end_time(self, match_data):
+        """End of a game in epoch seconds, the unit match-v5 expects for startTime."""
+        info = match_data['info']
+        end_ms = info.get('gameEndTimestamp') or info.get('gameStartTimestamp', 0) + info.get('gameDuration', 0) * 1000
+        return int(end_ms // 1000)
+
+    async def extract_player_game(self, session, market_id, player_tag, player_data, puuid, match_ids, refresh):
+        """
+        Fetch + extract stage: finds the player's most recent unprocessed valid game and returns
+        its feature row for batch scoring, or None if there is nothing to score.
+        `refresh` carries the indexes built by prefetch_market_state (processed_games,
+        latest_prices), the per-refresh stats, and collects each player's new watermark.
+        Timelines are only downloaded for the game that is actually scored.
+        """
         try:
             market_player_id = player_data['id']
             allowed_champions = player_data['champions']
+            processed_games = refresh['processed_games']
+            refresh_stats = refresh['stats']
             print(f"Processing {player_tag} (Player ID: {market_player_id}) for market {market_id}. Pool: {allowed_champions}")
+            if not match_ids:
+                return
 
-            puuid = await self.get_puuid(session, player_tag)
-            if not puuid: return
+            # Everything up to the newest game has now been looked at; the next refresh starts after it.
+            # match_ids[0] is fetched first in the loop below anyway, so this is served from the cache there.
+            new_watermark = self.match_end_time(await self.get_match_details(session, match_ids[0]))
+            game = None
 
-            match_ids = await self.get_match_ids(session, puuid)
-            
             for match_id in match_ids:
                 # We still check processed_games to avoid re-processing a game for this player
-                if self.is_game_processed(market_player_id, match_id):
+                if (market_player_id, match_id) in processed_games:
                     print(f"Game {match_id} already processed. Stopping search.")
-                    return
+                    break
 
-                match_data, timeline_data = await self.get_match_data(session, match_id)
+                # Phase 1: filter on the details payload
+                match_data = await self.get_match_details(session, match_id)
                 participant_data = next((p for p in match_data['info']['participants'] if p['puuid'] == puuid), None)
                 
-                if not participant_data: continue
+                if not participant_data:
+                    refresh_stats['timelines_avoided'] += 1
+                    continue
                 champion_played = participant_data['championName']
                 
                 # THE CORE LOGIC: Does this game count towards the stock?
-                if champion_played in allowed_champions:
-                    print(f"Found valid game {match_id} on allowed champion: {champion_played}.")
-                    
-                    metrics = self.calculate_metrics(match_data, timeline_data, puuid)
-                    if not metrics: continue
-                    
-                    role = metrics.pop('role')
-                    if role not in self.models: continue
-
-                    model_input_df = pd.DataFrame([metrics], columns=FEATURE_ORDER)
-                    raw_model_score = self.models[role].predict(model_input_df)[0]
-                    final_model_score = np.clip(raw_model_score, 0, 10)
-                    
-                    # --- NEW PRICE LOGIC ---
-                    # Get the single, current price for the PLAYER
-                    current_stock = self.get_current_stock(market_player_id)
-                    # Calculate the new price for the PLAYER
-                    new_stock = self.calculate_new_stock(current_stock, final_model_score, market_config)
-                    
-                    # Print model and stock calculation results
-                    print(f"=== MODEL & STOCK CALCULATION for {player_tag} on {champion_played} ===")
-                    print(f"Role: {role}")
-                    print(f"Raw Model Score: {raw_model_score:.4f}")
-                    print(f"Final Model Score (clipped): {final_model_score:.2f}")
-                    print(f"Current Stock Price: {current_stock:.2f}")
-                    print(f"New Stock Price: {new_stock:.2f}")
-                    print(f"Stock Change: {new_stock - current_stock:+.2f}")
-                    print("=" * 60)
-                    
-                    # Update the PLAYER's stock price, logging which champion was played
-                    self.update_stock(market_id, market_player_id, player_tag, new_stock, final_model_score, match_id, champion_played)
-                    self.mark_game_processed(market_player_id, match_id, player_tag, champion_played)
-                    
-                    print(f"SUCCESS: Updated stock for {player_tag} to ${new_stock:.2f} based on a {champion_played} game.")
-                    return # We only process the single most recent valid game
+                if not self.is_scoreable(match_data, participant_data, allowed_champions):
+                    refresh_stats['timelines_avoided'] += 1
+                    continue
+
+                print(f"Found valid game {match_id} on allowed champion: {champion_played}.")
+
+                # Phase 2: only the game we are about to score needs its timeline
+                timeline_data = await self.get_match_timeline(session, match_id)
+                refresh_stats['timelines_fetched'] += 1
+                metrics = self.calculate_metrics(match_data, timeline_data, puuid)
+                if not metrics: continue
+                
+                role = metrics.pop('role')
+                if role not in self.models: continue
+
+                game = { # We only process the single most recent valid game
+                    'market_player_id': market_player_id,
+                    'player_tag': player_tag,
+                    'game_id': match_id,
+                    'champion_played': champion_played,
+                    'role': role,
+                    'features': [metrics[name] for name in FEATURE_ORDER],
+                }
+                break
+
+            # Only advanced once the player was processed without errors, so a failure is retried next refresh
+            refresh['watermarks'][market_player_id] = new_watermark
+            return game
 
         except Exception as e:
             print(f"!!! FAILED to process {player_tag} for market {market_id}: {e}")
 
+    def score_games(self, games, refresh, models=None):
+        """
+        Inference stage: groups the extracted games by role and calls each role's model
+        once on a (players x features) matrix, instead of once per game.
+        Adds 'raw_model_score' and 'model_score' to each game; returns the games that were scored.
+        """
+        models = models or self.models
+        by_role = {}
+        for game in games:
+            by_role.setdefault(game['role'], []).append(game)
+
+        scored = []
+        for role, role_games in by_role.items():
+            matrix = np.array([g['features'] for g in role_games], dtype=np.float64)
+            try:
+                started = time.perf_counter()
+                raw_scores = self.predict(models[role], matrix)
+                inference_us = (time.perf_counter() - started) * 1e6 / len(role_games)
+            except Exception as e:
+                print(f"!!! FAILED to score {len(role_games)} {role} game(s): {e}")
+                for g in role_games:
+                    refresh['watermarks'].pop(g['market_player_id'], None)
+                continue
+            for g, raw_score in zip(role_games, raw_scores):
+                g['raw_model_score'] = float(raw_score)
+                g['model_score'] = float(np.clip(raw_score, 0, 10))
+                g['inference_us'] = inference_us
+                scored.append(g)
+        return scored
+
+    def predict(self, model, matrix):
+        if isinstance(model, CompiledGradientBoosting):
+            return model.predict(matrix)
+        # Wrapping the matrix keeps the column names the sklearn models were fitted with
+        return model.predict(pd.DataFrame(matrix, columns=FEATURE_ORDER))
+
+    def shadow_score_games(self, market_id, games, model_version, shadow_version, shadow_models):
+        """
+        A/B stage: re-scores the feature batch the serving models just priced with the
+        candidate version and stores both scores in shadow_scores. Runs after the price
+        flush and never raises, so it cannot delay or break the real refresh.
+        """
+        try:
+            by_role = {}
+            for game in games:
+                if game['role'] in shadow_models:
+                    by_role.setdefault(game['role'], []).append(game)
+            rows = []
+            for role, role_games in by_role.items():
+                matrix = np.array([g['features'] for g in role_games], dtype=np.float64)
+                started = time.perf_counter()
+                shadow_scores = np.clip(self.predict(shadow_models[role], matrix), 0, 10)
+                shadow_us = (time.perf_counter() - started) * 1e6 / len(role_games)
+                rows.extend(
+                    (market_id, g['market_player_id'], g['game_id'], role, model_version, g['model_score'],
+                     g['inference_us'], shadow_version, float(score), shadow_us)
+                    for g, score in zip(role_games, shadow_scores)
+                )
+            if not rows:
+                return
+            with db_connection() as conn:
+                with conn.cursor() as c:
+                    execute_values(c, """
+                        INSERT INTO shadow_scores
+                            (market_id, market_player_id, game_id, role, primary_version, primary_score,
+                             primary_inference_us, shadow_version, shadow_score, shadow_inference_us)
+                        VALUES %s
+                    """, rows, page_size=len(rows))
+                conn.commit()
+            print(f"Shadow-scored {len(rows)} game(s) with model version {shadow_version}.")
+        except Exception as e:
+            print(f"!!! Shadow scoring with {shadow_version} failed for market {market_id}: {e}")
+
+    def price_games(self, games, market_config, latest_prices):
+        """Pricing stage: turns scored games into the pending updates for flush_market_updates."""
+        updates = []
+        for game in games:
+            player_tag, champion_played = game['player_tag'], game['champion_played']
+            # --- NEW PRICE LOGIC ---
+            # Get the single, current price for the PLAYER
+            current_stock = latest_prices.get(game['market_player_id'], 10.0)
+            # Calculate the new price for the PLAYER
+            new_stock = self.calculate_new_stock(current_stock, game['model_score'], market_config)
+
+            # Print model and stock calculation results
+            print(f"=== MODEL & STOCK CALCULATION for {player_tag} on {champion_played} ===")
+            print(f"Role: {game['role']}")
+            print(f"Raw Model Score: {game['raw_model_score']:.4f}")
+            print(f"Final Model Score (clipped): {game['model_score']:.2f}")
+            print(f"Current Stock Price: {current_stock:.2f}")
+            print(f"New Stock Price: {new_stock:.2f}")
+            print(f"Stock Change: {new_stock - current_stock:+.2f}")
+            print("=" * 60)
+
+            # Queue the PLAYER's new stock price, logging which champion was played.
+            # It is written together with the rest of the market in flush_market_updates.
+            print(f"SUCCESS: Scored {player_tag} at ${new_stock:.2f} based on a {champion_played} game.")
+            updates.append({
+                'market_player_id': game['market_player_id'],
+                'player_tag': player_tag,
+                'stock_value': new_stock,
+                'priced_from': current_stock,
+                'model_score': game['model_score'],
+                'game_id': game['game_id'],
+                'champion_played': champion_played,
+                'role': game['role'],
+                'features': game['features'],
+            })
+        return updates
+
     async def update_market_stocks(self, market_id: int):
         print(f"--- Starting background stock update for market {market_id} ---")
         await self.load_models_async()
+        # Pinned for the whole refresh, even if the registry swaps versions part way through
+        models, model_version = self.models, self.model_version
+        shadow_version, shadow_models = self.shadow_version, self.shadow_models
         
-        market_config, players_to_update = self.get_market_config_and_players(market_id)
+        market_config, players_to_update = await asyncio.to_thread(self.get_market_config_and_players, market_id)
         if not players_to_update:
             print(f"No players found for market {market_id}. Aborting update.")
             return
 
         async with aiohttp.ClientSession() as session:
-            # Correctly pass the entire player data object
-            tasks = [self.process_player(session, market_id, market_config, player_tag, data) for player_tag, data in players_to_update.items()]
-            await asyncio.gather(*tasks)
+            # Stage 1: resolve the match ids each player has played since their watermark
+            player_tags = list(players_to_update)
+            candidates = await asyncio.gather(*[
+                self.get_player_candidates(session, tag, players_to_update[tag]['puuid'],
+                                           players_to_update[tag]['match_watermark'])
+                for tag in player_tags
+            ])
+            candidates = dict(zip(player_tags, candidates))
+            resolved_puuids = {
+                players_to_update[tag]['id']: puuid for tag, (puuid, _) in candidates.items()
+                if puuid and puuid != players_to_update[tag]['puuid']
+            }
+
+            # Stage 2: one query each for processed games and latest prices, instead of one per match/player
+            candidate_match_ids = {match_id for _, match_ids in candidates.values() for match_id in match_ids}
+            market_player_ids = [data['id'] for data in players_to_update.values()]
+            processed_games, latest_prices = await asyncio.to_thread(
+                self.prefetch_market_state, market_id, market_player_ids, candidate_match_ids)
+
+            # Stage 3: fetch and extract each player's game against the in-memory indexes
+            refresh = {
+                'processed_games': processed_games,
+                'latest_prices': latest_prices,
+                'stats': {'timelines_fetched': 0, 'timelines_avoided': 0},
+                'watermarks': {},
+            }
+            tasks = [
+                self.extract_player_game(session, market_id, player_tag, data, *candidates[player_tag], refresh)
+                for player_tag, data in players_to_update.items() if candidates[player_tag][0]
+            ]
+            games = [game for game in await asyncio.gather(*tasks) if game]
+
+        # Stage 4: one predict per role over all extracted games, then price
+        scored_games = self.score_games(games, refresh, models)
+        updates = self.price_games(scored_games, market_config, latest_prices)
+        # Runs in a worker thread so the flush does not block the event loop
+        await asyncio.to_thread(self.flush_market_updates, market_id, updates, resolved_puuids, refresh['watermarks'],
+                                market_config)
+        print(f"Persisted {len(updates)} price update(s) for market {market_id} in one transaction.")
+        # Cached market responses in this process are now stale
+        response_cache.bump(market_id)
+        if shadow_models and scored_games:
+            await asyncio.to_thread(self.shadow_score_games, market_id, scored_games,
+                                    model_version, shadow_version, shadow_models)
+        print(f"Timelines downloaded: {refresh['stats']['timelines_fetched']}, avoided: {refresh['stats']['timelines_avoided']}")
+        print(f"Match cache: {match_cache.get_stats()}")
         
         print(f"--- Finished background update for market {market_id} ---")
 
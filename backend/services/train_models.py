@@ -0,0 +1,234 @@
+import argparse
+import json
+import os
+import pickle
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from joblib import Parallel, delayed
+import numpy as np
+import sklearn
+from sklearn.ensemble import GradientBoostingRegressor
+from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+from sklearn.model_selection import KFold
+
+sys.path.append('.')
+
+from lib.features import FEATURE_ORDER
+from services.training_data import ROLES, TRAINING_DATA_DIR, SCHEMA_VERSION, build_dataset, load_training_data
+
+MODEL_DIR = os.path.join(os.path.dirname(__file__), '..')
+TRAINING_RUNS_DIR = os.environ.get('TRAINING_RUNS_DIR', os.path.join(MODEL_DIR, 'training_runs'))
+RANDOM_STATE = 42
+CV_FOLDS = 5
+
+# Used when there is no production pickle to copy hyperparameters from
+DEFAULT_PARAMS = {'n_estimators': 300, 'learning_rate': 0.05, 'max_depth': 4, 'subsample': 0.8}
+
+# Target recipe, after the names of the pickles in Old Models ("5 median, 2.1 separate z"):
+# within each role every feature is z-scored, the z-scores are averaged into one composite,
+# and the composite is rescaled so the role's median game scores 5 and one standard deviation
+# is worth 2.1 points, clipped to 0-10. The recipe is reconstructed from those names, not from
+# the original training code, so train_all checks it against the production pickles below.
+TARGET_CENTER = 5.0
+TARGET_SCALE = 2.1
+# Taking damage is not by itself good or bad play, so it does not count towards the composite
+TARGET_WEIGHTS = {name: 1.0 for name in FEATURE_ORDER}
+TARGET_WEIGHTS.update({'damage_taken_per_min': 0.0, 'damage_taken_share': 0.0})
+
+# How closely a run's models must score each role's games like the production pickles for the
+# run to be compiled: mean absolute difference in points, and Pearson correlation. A role without
+# a production pickle has nothing to check the target against, so it never agrees. Measured on
+# the consolidated dataset, production is 0.56-0.61 points from build_target (r 0.93-0.94) for
+# Top, Jungle, Mid and ADC and 1.44 points (r 0.62) for Support, so the recipe is not yet the
+# one production learned and --compile is refused until it is.
+TARGET_AGREEMENT_MAE = 0.5
+TARGET_AGREEMENT_R = 0.9
+# Even an agreeing run is only a candidate: it is compiled for shadow scoring and the registry
+# will not serve it. Serving it takes recompiling the run's pickles with python -m lib.model_compiler.
+SHADOW_ONLY_REASON = "trained on the reconstructed target in services/train_models.py"
+
+
+def fit_target(X):
+    """The target recipe's normalization (feature means and stds, composite median and std), fit on X's rows."""
+    weights = np.array([TARGET_WEIGHTS[name] for name in FEATURE_ORDER])
+    values = np.asarray(X, dtype=np.float64)
+    mean = values.mean(axis=0)
+    std = values.std(axis=0)
+    std = np.where(std > 0, std, 1.0)
+    composite = (values - mean) / std @ weights / weights.sum()
+    return {'weights': weights, 'mean': mean, 'std': std,
+            'median': float(np.median(composite)), 'scale': float(composite.std())}
+
+
+def build_target(X, stats=None):
+    """Target scores for X's rows, normalized with `stats` from fit_target (by default fit on X itself)."""
+    values = np.asarray(X, dtype=np.float64)
+    stats = stats or fit_target(values)
+    composite = (values - stats['mean']) / stats['std'] @ stats['weights'] / stats['weights'].sum()
+    composite = (composite - stats['median']) / stats['scale']
+    return np.clip(TARGET_CENTER + TARGET_SCALE * composite, 0, 10)
+
+
+def production_params(role):
+    """Hyperparameters of the model currently in production, so a retrain uses the same settings."""
+    try:
+        with open(os.path.join(MODEL_DIR, f'{role.lower()}_model.pkl'), 'rb') as f:
+            params = pickle.load(f).get_params()
+    except FileNotFoundError:
+        return dict(DEFAULT_PARAMS)
+    return {k: v for k, v in params.items() if k not in ('init', 'random_state', 'verbose')}
+
+
+def target_agreement(role, X, scores):
+    """
+    How the production pickle's scores for X compare with `scores` (a run's model, or
+    build_target): {'mae', 'r'}, or None without a production pickle.
+    """
+    try:
+        with open(os.path.join(MODEL_DIR, f'{role.lower()}_model.pkl'), 'rb') as f:
+            model = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    production = model.predict(X)
+    return {'mae': float(np.mean(np.abs(production - scores))), 'r': float(np.corrcoef(production, scores)[0, 1])}
+
+
+def agrees_with_production(agreement):
+    """True when target_agreement is within both limits; never without a production model to compare with."""
+    return agreement is not None and agreement['mae'] <= TARGET_AGREEMENT_MAE and agreement['r'] >= TARGET_AGREEMENT_R
+
+
+def score_fold(params, X, train, test):
+    """Fits on one fold's training rows, with the target normalized on those rows only, and scores its test rows."""
+    stats = fit_target(X.iloc[train])
+    model = GradientBoostingRegressor(**params, random_state=RANDOM_STATE)
+    model.fit(X.iloc[train], build_target(X.iloc[train], stats))
+    y_true = build_target(X.iloc[test], stats)
+    y_pred = model.predict(X.iloc[test])
+    return (mean_absolute_error(y_true, y_pred), np.sqrt(mean_squared_error(y_true, y_pred)),
+            r2_score(y_true, y_pred))
+
+
+def train_role(role, out_dir, dataset_dir, cv_jobs):
+    """Cross-validates and fits one role's model in its own process; returns its metrics."""
+    started = time.perf_counter()
+    frame = load_training_data(roles=[role], columns=FEATURE_ORDER, dataset_dir=dataset_dir)
+    # Rows from exports without the per-minute features cannot be used
+    frame = frame.dropna(subset=FEATURE_ORDER)
+    X = frame[FEATURE_ORDER].astype(np.float64)
+
+    params = production_params(role)
+    cv_started = time.perf_counter()
+    # Not cross_validate: the target's normalization must be refit inside every fold, or the
+    # test rows' statistics leak into the training targets
+    folds = KFold(CV_FOLDS, shuffle=True, random_state=RANDOM_STATE).split(X)
+    scores = np.array(Parallel(n_jobs=cv_jobs)(delayed(score_fold)(params, X, train, test) for train, test in folds))
+    cv_seconds = time.perf_counter() - cv_started
+
+    fit_started = time.perf_counter()
+    model = GradientBoostingRegressor(**params, random_state=RANDOM_STATE)
+    model.fit(X, build_target(X))
+    fit_seconds = time.perf_counter() - fit_started
+
+    metrics = {
+        'role': role,
+        'rows': int(len(frame)),
+        'cv_folds': CV_FOLDS,
+        'cv_mae': float(scores[:, 0].mean()),
+        'cv_rmse': float(scores[:, 1].mean()),
+        'cv_r2': float(scores[:, 2].mean()),
+        # The gate: the new model against production on the same games. The target's own gap is
+        # reported alongside, to tell a recipe mismatch from a poor fit.
+        'production_agreement': target_agreement(role, X, model.predict(X)),
+        'target_agreement': target_agreement(role, X, build_target(X)),
+        'cv_seconds': round(cv_seconds, 2),
+        'fit_seconds': round(fit_seconds, 2),
+        'total_seconds': round(time.perf_counter() - started, 2),
+    }
+    # Embedded so the pickle describes itself; feature_names_in_ already carries FEATURE_ORDER
+    model.training_metadata_ = {
+        'feature_order': list(FEATURE_ORDER),
+        'sklearn_version': sklearn.__version__,
+        'numpy_version': np.__version__,
+        'params': params,
+        'random_state': RANDOM_STATE,
+        'target': {'center': TARGET_CENTER, 'scale': TARGET_SCALE, 'weights': TARGET_WEIGHTS},
+        'dataset_schema_version': SCHEMA_VERSION,
+        'metrics': metrics,
+    }
+    with open(os.path.join(out_dir, f'{role.lower()}_model.pkl'), 'wb') as f:
+        pickle.dump(model, f)
+    return metrics
+
+
+def train_all(run_id=None, dataset_dir=TRAINING_DATA_DIR, workers=None, compile_version=None):
+    """
+    Trains the five role models in parallel processes into training_runs/<run_id>/ and writes
+    training_report.json. Cross-validation inside each process uses the CPUs left over.
+    """
+    if not os.path.exists(os.path.join(dataset_dir, f'v{SCHEMA_VERSION}', 'manifest.json')):
+        build_dataset(dataset_dir=dataset_dir)
+    run_id = run_id or datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S')
+    out_dir = os.path.join(TRAINING_RUNS_DIR, run_id)
+    os.makedirs(out_dir, exist_ok=False)
+
+    workers = workers or min(len(ROLES), os.cpu_count() or 1)
+    cv_jobs = max(1, (os.cpu_count() or 1) // workers)
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {role: pool.submit(train_role, role, out_dir, dataset_dir, cv_jobs) for role in ROLES}
+        results = {role: future.result() for role, future in futures.items()}
+    wall_seconds = time.perf_counter() - started
+
+    report = {
+        'run_id': run_id,
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'sklearn_version': sklearn.__version__,
+        'feature_order': list(FEATURE_ORDER),
+        'workers': workers,
+        'cv_jobs_per_worker': cv_jobs,
+        'wall_seconds': round(wall_seconds, 2),
+        'roles': results,
+    }
+    with open(os.path.join(out_dir, 'training_report.json'), 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"{'Role':<8} {'Rows':>6} {'CV MAE':>7} {'CV RMSE':>8} {'CV R2':>6} {'Prod MAE':>9} {'Prod r':>7} "
+          f"{'CV s':>7} {'Fit s':>7}")
+    for role, m in results.items():
+        a = m['production_agreement'] or {'mae': float('nan'), 'r': float('nan')}
+        print(f"{role:<8} {m['rows']:>6} {m['cv_mae']:>7.3f} {m['cv_rmse']:>8.3f} {m['cv_r2']:>6.3f} "
+              f"{a['mae']:>9.3f} {a['r']:>7.3f} {m['cv_seconds']:>7.1f} {m['fit_seconds']:>7.1f}")
+    print(f"Trained {len(results)} models in {wall_seconds:.1f}s wall clock ({workers} workers); "
+          f"artifacts in {out_dir}")
+
+    disagreeing = [role for role, m in results.items() if not agrees_with_production(m['production_agreement'])]
+    for role in disagreeing:
+        a = results[role]['production_agreement']
+        if a is None:
+            print(f"!!! {role}: no production model to check the trained model against")
+            continue
+        print(f"!!! {role}: the trained model scores these games {a['mae']:.2f} points from production "
+              f"on average (r = {a['r']:.2f}); the target recipe does not match what production learned")
+
+    if compile_version:
+        if disagreeing:
+            print(f"!!! Not compiling version {compile_version}: {', '.join(disagreeing)} disagree with production")
+            return report
+        # Ready to be shadow-scored (python -m lib.model_registry shadow <version>), never served
+        from lib.model_compiler import compile_models
+        compile_models(out_dir, version=compile_version, shadow_only=SHADOW_ONLY_REASON)
+    return report
+
+
+if __name__ == "__main__":
+    # Usage (from backend/): python -m services.train_models [--run-id ID] [--workers N] [--compile VERSION]
+    parser = argparse.ArgumentParser(description="Train the five role models in parallel.")
+    parser.add_argument('--run-id')
+    parser.add_argument('--dataset', default=TRAINING_DATA_DIR)
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--compile', dest='compile_version', help="also compile the run as this shadow-only model version")
+    args = parser.parse_args()
+    train_all(args.run_id, args.dataset, args.workers, args.compile_version)
@@ -0,0 +1,61 @@
+import pytest
+
+
+@pytest.fixture(scope='session')
+def database_url(tmp_path_factory):
+    """
+    A private, migrated Postgres for the session (pgserver). lib.database is pointed at
+    it, so the DATABASE_URL in .env is never touched by the tests.
+    """
+    pgserver = pytest.importorskip('pgserver')
+    import lib.database
+    from lib.migrations import apply
+
+    server = pgserver.get_server(str(tmp_path_factory.mktemp('pgdata')), cleanup_mode='stop')
+    url = server.get_uri()
+    patch = pytest.MonkeyPatch()
+    patch.setattr(lib.database, 'DATABASE_URL', url)
+    apply()
+    yield url
+    patch.undo()
+    server.cleanup()
+
+
+@pytest.fixture
+def make_market(database_url):
+    """
+    Factory for a market whose players each have their IPO price (10.0) and latest-price
+    summary. Returns (market_id, {player_tag: market_player_id}).
+    """
+    import uuid
+    from lib.database import get_connection
+
+    def make(players=('Alice#NA1',)):
+        conn = get_connection()
+        try:
+            with conn.cursor() as c:
+                user_id = str(uuid.uuid4())
+                c.execute("INSERT INTO profiles (id, username) VALUES (%s, 'test')", (user_id,))
+                c.execute("INSERT INTO markets (name, creator_id, invite_code) VALUES ('test', %s, %s) RETURNING id",
+                          (user_id, uuid.uuid4().hex[:8]))
+                market_id = c.fetchone()[0]
+                ids = {}
+                for tag in players:
+                    c.execute("INSERT INTO market_players (market_id, player_tag) VALUES (%s, %s) RETURNING id",
+                              (market_id, tag))
+                    ids[tag] = c.fetchone()[0]
+                    c.execute("INSERT INTO player_champions VALUES (%s, 'Ahri')", (ids[tag],))
+                    c.execute("""
+                        INSERT INTO stock_values (market_id, market_player_id, player_tag, stock_value, model_score,
+                                                  champion_played, timestamp)
+                        VALUES (%s, %s, %s, 10.0, 5.0, 'Ahri', NOW() - INTERVAL '30 days')
+                    """, (market_id, ids[tag], tag))
+                    c.execute("""
+                        INSERT INTO market_player_latest (market_player_id, market_id, current_price, last_update)
+                        VALUES (%s, %s, 10.0, NOW() - INTERVAL '30 days')
+                    """, (ids[tag], market_id))
+            conn.commit()
+        finally:
+            conn.close()
+        return market_id, ids
+    return make
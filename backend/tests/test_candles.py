@@ -0,0 +1,110 @@
+import json
+import random
+from datetime import datetime, timedelta, timezone
+import pytest
+from psycopg2.extras import execute_values
+from starlette.requests import Request
+from lib.candles import CANDLE_UPSERT_SQL, MAX_CANDLES, RESOLUTIONS, candle_layout
+from lib.database import close_pools, get_connection
+from lib.response_cache import response_cache
+
+ORIGIN = datetime(2000, 1, 1, tzinfo=timezone.utc)
+
+
+@pytest.mark.parametrize('span, resolution, width', [
+    (timedelta(days=1), '15m', timedelta(minutes=15)),
+    (timedelta(days=7), '1h', timedelta(hours=1)),
+    (timedelta(days=30), '1d', timedelta(days=1)),
+    (timedelta(days=200), '1d', timedelta(days=1)),
+    (timedelta(days=201), '1d', timedelta(days=2)),
+    (timedelta(days=5 * 365), '1d', timedelta(days=10)),
+])
+def test_layout_picks_the_finest_resolution_under_the_cap(span, resolution, width):
+    end = datetime(2026, 6, 1, tzinfo=timezone.utc)
+    assert candle_layout(end - span, end) == (resolution, width)
+    assert span / width <= MAX_CANDLES
+    # Regrouped widths are whole multiples of the stored resolution
+    assert width % RESOLUTIONS[resolution] == timedelta(0)
+
+
+def expected_candles(prices, width, start):
+    """OHLC of (at, price) pairs per date_bin(width) bucket, for the buckets starting at or after start."""
+    buckets = {}
+    for at, price in sorted(prices):
+        bucket = ORIGIN + (at - ORIGIN) // width * width
+        buckets.setdefault(bucket, []).append(price)
+    return [{'open': p[0], 'high': max(p), 'low': min(p), 'close': p[-1], 'samples': len(p)}
+            for bucket, p in sorted(buckets.items()) if bucket >= start]
+
+
+def upsert_prices(market_id, market_player_id, prices):
+    """Folds prices into the rollups one write at a time, in the given (not time) order, like the tracker's flushes."""
+    conn = get_connection()
+    try:
+        with conn.cursor() as c:
+            for at, price in prices:
+                execute_values(c, CANDLE_UPSERT_SQL.format(prices='VALUES %s'), [(market_player_id, market_id, price, at)],
+                               template="(%s, %s, %s::DOUBLE PRECISION, %s::TIMESTAMPTZ)")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def get_request(path, query):
+    return Request({'type': 'http', 'method': 'GET', 'scheme': 'http', 'server': ('test', 80), 'path': path,
+                    'query_string': query.encode(), 'headers': []})
+
+
+async def fetch_candles(market_id, period):
+    from api.main import get_stock_candles
+    path = f"/api/markets/{market_id}/stocks/Alice%23NA1/candles"
+    response = await get_stock_candles(market_id, 'Alice#NA1', get_request(path, f"period={period}"), period=period)
+    return json.loads(response.body)
+
+
+def ohlc(candles):
+    return [{k: c[k] for k in ('open', 'high', 'low', 'close', 'samples')} for c in candles]
+
+
+@pytest.mark.asyncio
+async def test_day_candles_take_open_and_close_from_the_first_and_last_price(make_market):
+    market_id, ids = make_market()
+    now = datetime.now(timezone.utc)
+    rng = random.Random(0)
+    prices = [(now - timedelta(hours=20) + timedelta(minutes=7 * i), round(rng.uniform(5, 15), 2)) for i in range(120)]
+    shuffled = prices[:]
+    rng.shuffle(shuffled)
+    upsert_prices(market_id, ids['Alice#NA1'], shuffled)
+    try:
+        body = await fetch_candles(market_id, '1d')
+    finally:
+        await close_pools()
+        response_cache.bump(market_id)
+
+    assert (body['resolution'], body['bucket_seconds']) == ('15m', 15 * 60)
+    start = now - timedelta(days=1)
+    assert ohlc(body['candles']) == expected_candles(prices, timedelta(minutes=15), start)
+    assert len(body['candles']) <= MAX_CANDLES
+
+
+@pytest.mark.asyncio
+async def test_long_histories_are_regrouped_under_the_cap(make_market):
+    market_id, ids = make_market()
+    now = datetime.now(timezone.utc)
+    rng = random.Random(1)
+    # Two prices a day for 450 days: 'all' needs 3-day candles to stay under MAX_CANDLES
+    prices = [(now - timedelta(days=450) + timedelta(hours=12 * i, minutes=5), round(rng.uniform(5, 15), 2))
+              for i in range(900)]
+    upsert_prices(market_id, ids['Alice#NA1'], prices)
+    try:
+        body = await fetch_candles(market_id, 'all')
+        week = await fetch_candles(market_id, '1w')
+    finally:
+        await close_pools()
+        response_cache.bump(market_id)
+
+    assert body['resolution'] == '1d' and body['bucket_seconds'] == 3 * 86400
+    assert len(body['candles']) <= MAX_CANDLES
+    assert ohlc(body['candles']) == expected_candles(prices, timedelta(days=3), ORIGIN)
+    assert (week['resolution'], week['bucket_seconds']) == ('1h', 3600)
+    assert ohlc(week['candles']) == expected_candles(prices, timedelta(hours=1), now - timedelta(days=7))
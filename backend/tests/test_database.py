@@ -0,0 +1,174 @@
+import asyncio
+import threading
+import time
+import psycopg2
+import pytest
+from psycopg2 import extensions
+from psycopg_pool import AsyncConnectionPool
+from lib.database import (PoolTimeout, SyncConnectionPool, async_db_connection, close_pools, db_connection,
+                          get_connection, get_sync_pool, open_async_pool)
+
+USER_ID = '00000000-0000-0000-0000-00000000abcd'
+
+
+@pytest.mark.asyncio
+async def test_async_pool_returns_uuids_as_str(database_url):
+    # Routes compare creator ids with request strings and validate them as str
+    try:
+        async with async_db_connection() as conn:
+            cur = await conn.execute("SELECT %s::uuid AS id", (USER_ID,))
+            assert (await cur.fetchone())['id'] == USER_ID
+    finally:
+        await close_pools()
+
+
+@pytest.mark.asyncio
+async def test_slow_query_does_not_block_the_event_loop(database_url):
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    task = asyncio.create_task(ticker())
+    try:
+        started = time.monotonic()
+        async with async_db_connection() as conn:
+            await conn.execute("SELECT pg_sleep(0.5)")
+        assert time.monotonic() - started >= 0.5
+        # A blocking driver would leave the ticker at ~0 for the whole query
+        assert ticks >= 20
+    finally:
+        task.cancel()
+        await close_pools()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_first_callers_share_one_pool(database_url, monkeypatch):
+    opened = []
+    original_open = AsyncConnectionPool.open
+
+    async def recording_open(self, *args, **kwargs):
+        opened.append(self)
+        # Yield to the other callers while this one is still opening
+        await asyncio.sleep(0.05)
+        return await original_open(self, *args, **kwargs)
+
+    monkeypatch.setattr(AsyncConnectionPool, 'open', recording_open)
+    try:
+        pools = await asyncio.gather(*(open_async_pool() for _ in range(5)))
+        assert len(opened) == 1
+        assert all(pool is pools[0] for pool in pools)
+    finally:
+        await close_pools()
+
+
+# --- Sync pool ---
+@pytest.fixture
+def make_pool(database_url):
+    pools = []
+
+    def make(**options):
+        pools.append(SyncConnectionPool(database_url, **{'min_size': 0, 'max_size': 2, **options}))
+        return pools[-1]
+    yield make
+    for pool in pools:
+        pool.close()
+
+
+def test_exhausted_pool_blocks_then_times_out(make_pool):
+    pool = make_pool(max_size=1, timeout=0.2)
+    pool.getconn()
+    started = time.monotonic()
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+    assert time.monotonic() - started >= 0.2
+    stats = pool.get_stats()
+    assert (stats['requests_timed_out'], stats['pool_size'], stats['connections_opened']) == (1, 1, 1)
+
+
+def test_returning_a_connection_wakes_a_waiter(make_pool):
+    pool = make_pool(max_size=1, timeout=5)
+    conn = pool.getconn()
+    handed_over = []
+    waiter = threading.Thread(target=lambda: handed_over.append((pool.getconn(), time.monotonic())))
+    waiter.start()
+    time.sleep(0.1)
+    returned_at = time.monotonic()
+    pool.putconn(conn)
+    waiter.join(5)
+    assert handed_over[0][0] is conn
+    assert handed_over[0][1] - returned_at < 1
+    assert pool.get_stats()['requests_waited'] == 1
+
+
+def test_expired_connections_are_closed_on_return_and_on_checkout(make_pool):
+    pool = make_pool(max_lifetime=0.1)
+    conn = pool.getconn()
+    time.sleep(0.15)
+    pool.putconn(conn)
+    assert conn.closed and pool.get_stats()['pool_available'] == 0
+
+    conn = pool.getconn()
+    pool.putconn(conn)
+    time.sleep(0.15)
+    assert pool.getconn() is not conn
+    assert conn.closed and pool.get_stats()['connections_expired'] == 2
+
+
+def test_idle_eviction_keeps_min_size(make_pool):
+    pool = make_pool(min_size=1, max_idle=0.1)
+    older, newer = pool.getconn(), pool.getconn()
+    pool.putconn(older)
+    pool.putconn(newer)
+    time.sleep(0.15)
+    # The longest-idle connection goes; the last one stays for min_size and is handed out
+    assert pool.getconn() is newer
+    assert older.closed and pool.get_stats()['connections_idle_evicted'] == 1
+
+
+def test_a_dead_idle_connection_fails_its_health_check(make_pool):
+    pool = make_pool(check_after=0)
+    conn = pool.getconn()
+    pid = conn.get_backend_pid()
+    pool.putconn(conn)
+    admin = get_connection()
+    try:
+        with admin.cursor() as c:
+            c.execute("SELECT pg_terminate_backend(%s)", (pid,))
+        admin.commit()
+    finally:
+        admin.close()
+
+    replacement = pool.getconn()
+    assert replacement is not conn and conn.closed
+    with replacement.cursor() as c:
+        c.execute("SELECT 1")
+    assert pool.get_stats()['health_check_failures'] == 1
+
+
+def test_an_open_transaction_is_rolled_back_on_return(make_pool):
+    pool = make_pool(max_size=1)
+    conn = pool.getconn()
+    with conn.cursor() as c:
+        c.execute("CREATE TEMP TABLE uncommitted (id INT)")
+    pool.putconn(conn)
+    assert conn.info.transaction_status == extensions.TRANSACTION_STATUS_IDLE
+    again = pool.getconn()
+    assert again is conn
+    with again.cursor() as c:
+        c.execute("SELECT to_regclass('pg_temp.uncommitted')")
+        assert c.fetchone()[0] is None
+
+
+def test_db_connection_discards_a_connection_that_raised_interface_error(database_url):
+    pool = get_sync_pool()
+    closed_before = pool.get_stats()['connections_closed']
+    with pytest.raises(psycopg2.InterfaceError):
+        with db_connection() as conn:
+            raise psycopg2.InterfaceError("connection already closed")
+    assert conn.closed
+    assert pool.get_stats()['connections_closed'] == closed_before + 1
+    assert all(idle is not conn for idle, _, _ in pool._idle)
@@ -0,0 +1,76 @@
+import csv
+import os
+import pytest
+from datafarmer import FIELDNAMES, CheckpointedCSV, CrawlFrontier, state_dir_for
+
+
+def match_rows(match_id, players=10):
+    return [{**dict.fromkeys(FIELDNAMES, 1), 'match_id': match_id, 'summoner_name': f"p{i}"} for i in range(players)]
+
+
+def csv_match_ids(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        return [row['match_id'] for row in csv.DictReader(f)]
+
+
+def test_a_crash_mid_match_drops_only_that_match(tmp_path):
+    path = tmp_path / 'data.csv'
+    store = CheckpointedCSV(str(path))
+    store.record('NA1_1', match_rows('NA1_1'))
+    store.record('NA1_2', [])
+    # Rows of NA1_3 reached the CSV, half a line included, but its checkpoint never did
+    store._writer.writerows(match_rows('NA1_3', 4))
+    store._csv_file.write('NA1_3,half')
+    store.close()
+
+    store = CheckpointedCSV(str(path))
+    assert store.done == {'NA1_1', 'NA1_2'}
+    store.record('NA1_3', match_rows('NA1_3'))
+    store.close()
+    assert csv_match_ids(path) == ['NA1_1'] * 10 + ['NA1_3'] * 10
+
+
+def test_a_csv_without_a_checkpoint_is_adopted_not_wiped(tmp_path):
+    path = tmp_path / 'data.csv'
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDNAMES)
+        writer.writeheader()
+        writer.writerows(match_rows('NA1_1') + match_rows('NA1_2'))
+        f.write('NA1_3,torn')
+
+    store = CheckpointedCSV(str(path))
+    assert store.done == {'NA1_1', 'NA1_2'}
+    store.close()
+    assert csv_match_ids(path) == ['NA1_1'] * 10 + ['NA1_2'] * 10
+    # Reopening goes through the checkpoint the adoption wrote, and keeps everything
+    assert CheckpointedCSV(str(path)).done == {'NA1_1', 'NA1_2'}
+    assert len(csv_match_ids(path)) == 20
+
+
+def test_a_checkpoint_ahead_of_its_csv_refuses_to_start(tmp_path):
+    path = tmp_path / 'data.csv'
+    store = CheckpointedCSV(str(path))
+    store.record('NA1_1', match_rows('NA1_1'))
+    store.close()
+    os.truncate(path, os.path.getsize(path) // 2)
+    with pytest.raises(RuntimeError, match='ahead of'):
+        CheckpointedCSV(str(path))
+
+
+def test_state_follows_the_output_file(tmp_path, monkeypatch):
+    data_dir = tmp_path / 'data'
+    data_dir.mkdir()
+    store = CheckpointedCSV(str(data_dir / 'a.csv'))
+    store.record('NA1_1', match_rows('NA1_1'))
+    store.close()
+    frontier = CrawlFrontier(state_dir_for(str(data_dir / 'a.csv')))
+    frontier.add(['puuid-1'])
+    frontier.close()
+
+    # From another working directory, with a relative path, the same state is found
+    monkeypatch.chdir(tmp_path)
+    assert state_dir_for('data/a.csv') == str(data_dir / '.datafarmer')
+    assert CheckpointedCSV('data/a.csv').done == {'NA1_1'}
+    assert list(CrawlFrontier(state_dir_for('data/a.csv')).queue) == ['puuid-1']
+    # Another CSV in the same directory skips matches already collected into a.csv
+    assert CheckpointedCSV('data/b.csv').done == {'NA1_1'}
@@ -0,0 +1,183 @@
+import copy
+import json
+import os
+import numpy as np
+import pytest
+from datafarmer import AIDataCollector
+from lib.features import FEATURE_ORDER, extract_match_features
+from services.stock_tracker import PlayerStockTracker
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES, name)) as f:
+        return json.load(f)
+
+
+@pytest.fixture
+def match():
+    """A ranked game in match-v5 shape, trimmed to the fields the features read, and its timeline."""
+    return load_fixture('match_NA1_4900000001.json'), load_fixture('timeline_NA1_4900000001.json')
+
+
+# --- The code paths lib.features replaced, as they were before it (git 79a5403^) ---
+def old_tracker_metrics(match_data, timeline_data, puuid):
+    """PlayerStockTracker.calculate_metrics, without its debug printing."""
+    info = match_data['info']
+    participant = next((p for p in info['participants'] if p['puuid'] == puuid), None)
+    game_duration_min = info.get('gameDuration', 0) / 60.0
+    team_id = participant['teamId']
+    team_participants = [p for p in info['participants'] if p['teamId'] == team_id]
+    team_total_damage = max(1, sum(p.get('totalDamageDealtToChampions', 0) for p in team_participants))
+    team_total_gold = max(1, sum(p.get('goldEarned', 0) for p in team_participants))
+    team_total_vision = max(1, sum(p.get('visionScore', 0) for p in team_participants))
+    team_total_obj_damage = max(1, sum(p.get('damageDealtToObjectives', 0) for p in team_participants))
+    team_total_kills = max(1, sum(p.get('kills', 0) for p in team_participants))
+    team_total_damage_taken = max(1, sum(p.get('totalDamageTaken', 0) for p in team_participants))
+
+    participant_id = participant['participantId']
+    opponent = next((p for p in info['participants']
+                     if p['teamId'] != team_id and p['teamPosition'] == participant['teamPosition']), None)
+    gold_diff_15 = exp_diff_15 = 0
+    if opponent and len(timeline_data['info']['frames']) > 15:
+        frame_15 = timeline_data['info']['frames'][15]
+        player_frame = frame_15['participantFrames'][str(participant_id)]
+        opponent_frame = frame_15['participantFrames'][str(opponent['participantId'])]
+        gold_diff_15 = player_frame['totalGold'] - opponent_frame['totalGold']
+        exp_diff_15 = player_frame['xp'] - opponent_frame['xp']
+
+    gold_diff_per_min = exp_diff_per_min = 0
+    if opponent:
+        gold_diff_per_min = (participant.get('goldEarned', 0) - opponent.get('goldEarned', 0)) / game_duration_min
+        exp_diff_per_min = (participant.get('champExperience', 0) - opponent.get('champExperience', 0)) / game_duration_min
+
+    return {
+        'kda': (participant.get('kills', 0) + participant.get('assists', 0)) / max(1, participant.get('deaths', 1)),
+        'dmg_to_champions_per_min': participant.get('totalDamageDealtToChampions', 0) / game_duration_min,
+        'team_damage_share': (participant.get('totalDamageDealtToChampions', 0) / team_total_damage) * 100,
+        'team_gold_share': (participant.get('goldEarned', 0) / team_total_gold) * 100,
+        'kill_participation': ((participant.get('kills', 0) + participant.get('assists', 0)) / team_total_kills) * 100,
+        'team_objective_damage_share': (participant.get('damageDealtToObjectives', 0) / team_total_obj_damage) * 100,
+        'team_vision_score_share': (participant.get('visionScore', 0) / team_total_vision) * 100,
+        'damage_taken_share': (participant.get('totalDamageTaken', 0) / team_total_damage_taken) * 100,
+        'gold_diff_15': gold_diff_15,
+        'exp_diff_15': exp_diff_15,
+        'objective_damage_per_min': participant.get('damageDealtToObjectives', 0) / game_duration_min,
+        'vision_score_per_min': participant.get('visionScore', 0) / game_duration_min,
+        'gold_diff_per_min': gold_diff_per_min,
+        'exp_diff_per_min': exp_diff_per_min,
+        'damage_taken_per_min': participant.get('totalDamageTaken', 0) / game_duration_min,
+        # Sic: the field is totalHealsOnTeammates, so this was always shields only
+        'healing_shielding_allies_per_min': (participant.get('totalHealOnTeammates', 0)
+                                             + participant.get('totalDamageShieldedOnTeammates', 0)) / game_duration_min,
+        'win_loss': 1 if participant.get('win', False) else 0,
+    }
+
+
+def old_farmer_rows(match_data, timeline_data):
+    """AIDataCollector.process_match's rows, with its per-player helpers inlined."""
+    info = match_data['info']
+    minutes = info['gameDuration'] / 60
+    frame_15 = next((f for f in timeline_data['info']['frames'] if f['timestamp'] >= 900000), None)
+    rows = []
+    for participant in info['participants']:
+        if not participant['teamPosition']:
+            continue
+        pid = participant['participantId']
+        opponent = next((p for p in info['participants']
+                         if p['teamPosition'] == participant['teamPosition'] and p['participantId'] != pid), None)
+        gold_diff_15 = exp_diff_15 = 0
+        if opponent and frame_15:
+            player_frame = frame_15['participantFrames'][str(pid)]
+            opponent_frame = frame_15['participantFrames'][str(opponent['participantId'])]
+            gold_diff_15 = player_frame['totalGold'] - opponent_frame['totalGold']
+            exp_diff_15 = player_frame['xp'] - opponent_frame['xp']
+        gold_diff_end = participant['goldEarned'] - (opponent['goldEarned'] if opponent else 0)
+        exp_diff_end = participant['champExperience'] - (opponent['champExperience'] if opponent else 0)
+
+        team = next(t for t in info['teams'] if t['teamId'] == participant['teamId'])
+        team_kills = team['objectives']['champion']['kills']
+        kill_participation = (participant['kills'] + participant['assists']) / team_kills * 100 if team_kills else 0
+
+        mates = [p for p in info['participants'] if p['teamId'] == participant['teamId']]
+
+        def share(field):
+            total = sum(p[field] for p in mates)
+            return round((participant[field] / total) * 100, 1) if total > 0 else 0
+
+        heals = participant.get('totalHealsOnTeammates', 0) + participant.get('totalDamageShieldedOnTeammates', 0)
+        rows.append({
+            'kda': round((participant['kills'] + participant['assists']) / max(1, participant['deaths']), 2),
+            'dmg_to_champions_per_min': round(participant['totalDamageDealtToChampions'] / minutes, 1),
+            'team_damage_share': share('totalDamageDealtToChampions'),
+            'team_gold_share': share('goldEarned'),
+            'gold_diff_15': gold_diff_15,
+            'exp_diff_15': exp_diff_15,
+            'kill_participation': kill_participation,
+            'objective_damage_per_min': round(participant['damageDealtToObjectives'] / minutes, 1),
+            'team_objective_damage_share': share('damageDealtToObjectives'),
+            'vision_score_per_min': round(participant['visionScore'] / minutes, 2),
+            'team_vision_score_share': share('visionScore'),
+            'gold_diff_per_min': round(gold_diff_end / minutes, 1),
+            'exp_diff_per_min': round(exp_diff_end / minutes, 1),
+            'damage_taken_per_min': round(participant['totalDamageTaken'] / minutes, 1),
+            'damage_taken_share': share('totalDamageTaken'),
+            'healing_shielding_allies_per_min': round(heals / minutes, 1),
+            'win_loss': 1 if participant['win'] else 0,
+        })
+    return rows
+
+
+# --- Parity ---
+def test_tracker_features_match_the_old_tracker(match):
+    match_data, timeline_data = match
+    tracker = PlayerStockTracker(None)
+    minutes = match_data['info']['gameDuration'] / 60
+    for participant in match_data['info']['participants']:
+        new = tracker.calculate_metrics(match_data, timeline_data, participant['puuid'])
+        old = old_tracker_metrics(match_data, timeline_data, participant['puuid'])
+        # The one intended change: heals on teammates are now counted
+        old['healing_shielding_allies_per_min'] += participant['totalHealsOnTeammates'] / minutes
+        for name in FEATURE_ORDER:
+            assert new[name] == pytest.approx(old[name], rel=1e-12), name
+
+
+@pytest.mark.asyncio
+async def test_farmer_rows_match_the_old_farmer(match, monkeypatch):
+    match_data, timeline_data = match
+    collector = AIDataCollector()
+
+    async def fetched(data):
+        return copy.deepcopy(data)
+
+    monkeypatch.setattr(collector, 'get_match_data', lambda session, match_id: fetched(match_data))
+    monkeypatch.setattr(collector, 'get_match_timeline', lambda session, match_id: fetched(timeline_data))
+    rows, _ = await collector.process_match(None, 'NA1_4900000001')
+    old = old_farmer_rows(match_data, timeline_data)
+    assert len(rows) == len(old) == 10
+    for new_row, old_row in zip(rows, old):
+        for name in FEATURE_ORDER:
+            assert new_row[name] == pytest.approx(old_row[name], rel=1e-12), name
+
+
+def test_kill_participation_is_over_the_team_members_kills(match):
+    match_data, timeline_data = match
+    expected = extract_match_features(match_data, timeline_data)
+    # The old farmer divided by teams[].objectives.champion.kills; the extractor never reads it
+    for team in match_data['info']['teams']:
+        team['objectives']['champion']['kills'] += 5
+    assert np.array_equal(extract_match_features(match_data, timeline_data), expected)
+
+    column = FEATURE_ORDER.index('kill_participation')
+    participants = match_data['info']['participants']
+    blue_kills = sum(p['kills'] for p in participants if p['teamId'] == 100)
+    assert expected[0, column] == (participants[0]['kills'] + participants[0]['assists']) / blue_kills * 100
+
+
+def test_lane_differences_are_zero_without_a_timeline(match):
+    match_data, _ = match
+    features = extract_match_features(match_data)
+    assert not features[:, FEATURE_ORDER.index('gold_diff_15')].any()
+    assert not features[:, FEATURE_ORDER.index('exp_diff_15')].any()
+    assert features[:, FEATURE_ORDER.index('gold_diff_per_min')].any()
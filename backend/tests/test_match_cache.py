@@ -0,0 +1,55 @@
+import random
+from lib.match_cache import MatchCache
+
+
+def match_payload(match_id, filler=0):
+    # Random hex, so the files do not compress away to nothing
+    return {'metadata': {'matchId': match_id}, 'info': {'filler': random.Random(match_id).randbytes(filler // 2).hex()}}
+
+
+def test_round_trip_through_disk(tmp_path):
+    MatchCache(tmp_path).put('match', 'NA1_1', match_payload('NA1_1'))
+    # A fresh instance has an empty memory LRU, so this comes from the file
+    cache = MatchCache(tmp_path)
+    assert cache.get('match', 'NA1_1') == match_payload('NA1_1')
+    assert cache.get('timeline', 'NA1_1') is None
+    assert cache.stats['disk_hits'] == 1 and cache.stats['misses'] == 1
+
+
+def test_overwrites_are_not_counted_twice(tmp_path):
+    cache = MatchCache(tmp_path)
+    cache.put('match', 'NA1_0', match_payload('NA1_0'))
+    for filler in (5_000, 100, 20_000, 10):
+        cache.put('match', 'NA1_1', match_payload('NA1_1', filler))
+    assert cache.get_stats()['disk_bytes'] == cache._scan()[1]
+
+
+def test_memory_is_capped_by_serialized_bytes(tmp_path):
+    cache = MatchCache(tmp_path, memory_bytes=10_000)
+    for i in range(10):
+        cache.put('match', f"NA1_{i}", match_payload(f"NA1_{i}", 3_000))
+    stats = cache.get_stats()
+    assert stats['memory_bytes'] <= 10_000
+    assert stats['memory_items'] == 3
+    # The newest entries stayed in memory, the older ones are still on disk
+    assert cache.get('match', 'NA1_9') is not None and cache.stats['memory_hits'] == 1
+    assert cache.get('match', 'NA1_0') is not None and cache.stats['disk_hits'] == 1
+
+
+def test_timelines_and_oversized_payloads_stay_on_disk(tmp_path):
+    cache = MatchCache(tmp_path, memory_bytes=10_000)
+    cache.put('timeline', 'NA1_1', match_payload('NA1_1'))
+    cache.put('match', 'NA1_2', match_payload('NA1_2', 20_000))
+    assert cache.get_stats()['memory_items'] == 0
+    assert cache.get('timeline', 'NA1_1') == match_payload('NA1_1')
+    assert cache.get('match', 'NA1_2') == match_payload('NA1_2', 20_000)
+    assert cache.stats['disk_hits'] == 2
+
+
+def test_disk_is_evicted_least_recently_used_first(tmp_path):
+    cache = MatchCache(tmp_path, max_bytes=3_000, memory_bytes=0)
+    for i in range(20):
+        cache.put('match', f"NA1_{i}", match_payload(f"NA1_{i}", 200 * i))
+    assert cache.get_stats()['disk_bytes'] <= 3_000
+    assert cache.stats['evictions'] > 0
+    assert cache.get('match', 'NA1_19') is not None
@@ -0,0 +1,57 @@
+import pytest
+import lib.database
+from lib.database import get_connection
+from lib.migrations import apply, check_plans, partition
+
+
+def execute(sql, params=()):
+    conn = get_connection()
+    try:
+        with conn.cursor() as c:
+            c.execute(sql, params)
+            rows = c.fetchall() if c.description else None
+        conn.commit()
+        return rows
+    finally:
+        conn.close()
+
+
+def test_apply_is_idempotent(database_url, capsys):
+    apply()
+    assert "Nothing to apply." in capsys.readouterr().out
+
+
+def test_hot_queries_use_indexes(make_market, capsys):
+    make_market()
+    assert check_plans(), capsys.readouterr().out
+
+
+@pytest.mark.parametrize('index, query', [
+    ('processed_games_player_game_idx', 'processed games (prefetch_market_state)'),
+    ('stock_values_player_timestamp_idx', 'anchor refresh (refresh_price_anchors)'),
+    ('stock_values_player_timestamp_idx', 'market stocks (fetch_market_stocks)'),
+    ('market_player_latest_anchor_due_idx', 'all due anchors (refresh_all_price_anchors)'),
+    ('stock_values_market_tag_timestamp_idx', 'market scores (fetch_market_scores)'),
+])
+def test_a_lost_index_fails_the_check(make_market, capsys, index, query):
+    make_market()
+    definition = execute("SELECT indexdef FROM pg_indexes WHERE indexname = %s", (index,))[0][0]
+    execute(f"DROP INDEX {index}")
+    try:
+        assert not check_plans()
+    finally:
+        execute(definition)
+    assert f"FAIL  {query}: " in capsys.readouterr().out
+
+
+def test_partitioned_stock_values_still_use_indexes(tmp_path, monkeypatch, capsys):
+    # Partitioning rewrites stock_values, so it gets a server of its own
+    pgserver = pytest.importorskip('pgserver')
+    server = pgserver.get_server(str(tmp_path / 'pgdata'), cleanup_mode='stop')
+    try:
+        monkeypatch.setattr(lib.database, 'DATABASE_URL', server.get_uri())
+        apply()
+        partition()
+        assert check_plans(), capsys.readouterr().out
+    finally:
+        server.cleanup()
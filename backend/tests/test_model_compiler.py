@@ -0,0 +1,75 @@
+import json
+import os
+import pickle
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import GradientBoostingRegressor
+from lib.features import FEATURE_ORDER
+from lib.model_compiler import CompiledGradientBoosting, ROLES, compile_models, parity_sample
+
+
+def fit_model(seed=0, feature_names=True, **params):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(0, 50, size=(400, len(FEATURE_ORDER)))
+    y = X[:, 0] * 0.03 - X[:, 3] * 0.02 + np.sin(X[:, 7] / 10) + rng.normal(0, 0.5, size=400) + 5
+    params = {'n_estimators': 40, 'max_depth': 4, 'learning_rate': 0.1, 'random_state': seed, **params}
+    model = GradientBoostingRegressor(**params)
+    model.fit(pd.DataFrame(X, columns=FEATURE_ORDER) if feature_names else X, y)
+    return model
+
+
+def sklearn_predict(model, X):
+    if getattr(model, 'feature_names_in_', None) is not None:
+        return model.predict(pd.DataFrame(X, columns=model.feature_names_in_))
+    return model.predict(X)
+
+
+@pytest.mark.parametrize('params', [
+    {},
+    {'max_depth': 6, 'subsample': 0.8},
+    {'max_depth': 2, 'learning_rate': 0.3, 'n_estimators': 120},
+])
+def test_compiled_predictions_are_exactly_equal(params):
+    model = fit_model(**params)
+    compiled = CompiledGradientBoosting.from_sklearn(model)
+    X = parity_sample(compiled)
+    # Bit-for-bit, not approximately: prices fold these scores forward forever
+    assert np.array_equal(compiled.predict(X), sklearn_predict(model, X))
+
+
+def test_parity_without_feature_names():
+    model = fit_model(feature_names=False)
+    compiled = CompiledGradientBoosting.from_sklearn(model)
+    X = parity_sample(compiled)
+    assert np.array_equal(compiled.predict(X), model.predict(X))
+
+
+def test_single_row_matches_batch():
+    compiled = CompiledGradientBoosting.from_sklearn(fit_model())
+    X = parity_sample(compiled, n_rows=50)
+    batch = compiled.predict(X)
+    assert np.array_equal(np.array([compiled.predict(row)[0] for row in X]), batch)
+
+
+def test_saved_artifact_scores_the_same_memory_mapped(tmp_path):
+    model = fit_model()
+    compiled = CompiledGradientBoosting.from_sklearn(model)
+    meta = json.loads(json.dumps(compiled.save(tmp_path, 'top')))
+    loaded = CompiledGradientBoosting.load(tmp_path, 'top', meta)
+    X = parity_sample(compiled)
+    assert np.array_equal(loaded.predict(X), sklearn_predict(model, X))
+
+
+def test_compile_models_writes_a_version_only_with_parity(tmp_path):
+    pickles, models_dir = tmp_path / 'pickles', tmp_path / 'models'
+    pickles.mkdir()
+    for i, role in enumerate(ROLES):
+        with open(pickles / f'{role.lower()}_model.pkl', 'wb') as f:
+            pickle.dump(fit_model(seed=i), f)
+
+    assert compile_models(pickles, models_dir, version='v1') == 'v1'
+    with open(models_dir / 'v1' / 'manifest.json') as f:
+        manifest = json.load(f)
+    assert sorted(manifest['roles']) == sorted(ROLES)
+    assert not os.path.exists(models_dir / 'v1.tmp')
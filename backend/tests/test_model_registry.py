@@ -0,0 +1,117 @@
+import pickle
+import pytest
+import lib.model_registry
+from lib.model_compiler import ROLES, CompiledGradientBoosting, compile_models
+from lib.model_registry import ACTIVE_POINTER, PICKLE_VERSION, SHADOW_POINTER, ModelRegistry
+from tests.test_model_compiler import fit_model
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    """A registry over production pickles and two compiled versions, v1 and v2, re-reading its pointers on every call."""
+    pickles, models_dir = tmp_path / 'pickles', tmp_path / 'models'
+    pickles.mkdir()
+    for seed, version in enumerate(('v1', 'v2')):
+        for i, role in enumerate(ROLES):
+            with open(pickles / f'{role.lower()}_model.pkl', 'wb') as f:
+                pickle.dump(fit_model(seed=seed * 10 + i, n_estimators=5), f)
+        compile_models(pickles, models_dir, version=version)
+    monkeypatch.setattr(lib.model_registry, 'MODEL_VERSION', None)
+    monkeypatch.setattr(lib.model_registry, 'POINTER_CHECK_INTERVAL', 0)
+    return ModelRegistry(str(models_dir), str(pickles))
+
+
+def test_compiled_versions_wait_for_activation(registry):
+    current = registry.current()
+    assert current['version'] == PICKLE_VERSION
+    assert not isinstance(current['models']['Top'], CompiledGradientBoosting)
+
+
+def test_pointer_switches_are_picked_up_and_old_versions_dropped(registry, monkeypatch):
+    registry.set_pointer(ACTIVE_POINTER, 'v1')
+    v1 = registry.current()
+    assert v1['version'] == 'v1' and isinstance(v1['models']['Top'], CompiledGradientBoosting)
+
+    registry.set_pointer(ACTIVE_POINTER, 'v2')
+    monkeypatch.setattr(lib.model_registry, 'POINTER_CHECK_INTERVAL', 3600)
+    # Between pointer checks the served version does not move
+    assert registry.current() is v1
+    monkeypatch.setattr(lib.model_registry, 'POINTER_CHECK_INTERVAL', 0)
+    assert registry.current()['version'] == 'v2'
+    assert set(registry._loaded) == {'v2'}
+
+    with pytest.raises(ValueError, match='Unknown model version'):
+        registry.set_pointer(ACTIVE_POINTER, 'v3')
+
+
+def test_a_version_that_fails_to_load_keeps_the_last_good_one(registry, tmp_path, capsys):
+    registry.set_pointer(ACTIVE_POINTER, 'v1')
+    served = registry.current()['models']
+    (tmp_path / 'models' / 'v2' / 'manifest.json').write_text('{"format": 99}')
+    registry.set_pointer(ACTIVE_POINTER, 'v2')
+    current = registry.current()
+    assert current['version'] == 'v1' and current['models'] is served
+    assert "Could not load model version v2, still serving v1" in capsys.readouterr().out
+
+    # With nothing served yet there is nothing to fall back to
+    fresh = ModelRegistry(registry.models_dir, registry.pickle_dir)
+    with pytest.raises(ValueError, match='unsupported format'):
+        fresh.current()
+
+
+def test_shadow_version_is_loaded_alongside_and_dropped_when_broken(registry, tmp_path):
+    registry.set_pointer(ACTIVE_POINTER, 'v1')
+    registry.set_pointer(SHADOW_POINTER, 'v2')
+    current = registry.current()
+    assert (current['version'], current['shadow_version']) == ('v1', 'v2')
+    assert sorted(current['shadow_models']) == sorted(ROLES)
+
+    # Shadowing the serving version is a no-op
+    registry.set_pointer(SHADOW_POINTER, 'v1')
+    assert registry.current()['shadow_version'] is None
+
+    (tmp_path / 'models' / 'SHADOW').write_text('v9\n')
+    current = registry.current()
+    assert current['version'] == 'v1' and current['shadow_version'] is None and current['shadow_models'] is None
+
+
+def test_shadow_only_versions_are_never_served(registry, tmp_path, monkeypatch):
+    compile_models(tmp_path / 'pickles', registry.models_dir, version='v3', shadow_only='trained on a test target')
+    with pytest.raises(ValueError, match='can only be shadow-scored: trained on a test target'):
+        registry.set_pointer(ACTIVE_POINTER, 'v3')
+    with pytest.raises(ValueError, match='can only be shadow-scored'):
+        registry.get('v3')
+
+    registry.set_pointer(ACTIVE_POINTER, 'v1')
+    registry.set_pointer(SHADOW_POINTER, 'v3')
+    current = registry.current()
+    assert (current['version'], current['shadow_version']) == ('v1', 'v3')
+
+    # Not even by pinning it
+    monkeypatch.setattr(lib.model_registry, 'MODEL_VERSION', 'v3')
+    assert registry.current()['version'] == 'v1'
+
+
+def test_shadow_scores_are_stored_next_to_the_served_scores(registry, make_market):
+    from lib.database import db_connection
+    from services.stock_tracker import PlayerStockTracker
+    registry.set_pointer(ACTIVE_POINTER, 'v1')
+    registry.set_pointer(SHADOW_POINTER, 'v2')
+    current = registry.current()
+    market_id, ids = make_market()
+    features = [float(i) for i in range(len(current['models']['Top'].feature_names))]
+    games = [{'role': 'Top', 'features': features, 'market_player_id': ids['Alice#NA1'], 'game_id': 'NA1_1',
+              'model_score': 6.5, 'inference_us': 12.0}]
+
+    tracker = PlayerStockTracker(None)
+    tracker.shadow_score_games(market_id, games, 'v1', 'v2', current['shadow_models'])
+    # A failing candidate is logged, never raised into the refresh
+    tracker.shadow_score_games(market_id, [{**games[0], 'features': None}], 'v1', 'v2', current['shadow_models'])
+
+    with db_connection() as conn:
+        with conn.cursor() as c:
+            c.execute("SELECT game_id, primary_version, primary_score, shadow_version, shadow_score FROM shadow_scores "
+                      "WHERE market_id = %s", (market_id,))
+            rows = c.fetchall()
+    expected = float(current['shadow_models']['Top'].predict([features])[0])
+    assert rows == [('NA1_1', 'v1', 6.5, 'v2', pytest.approx(min(max(expected, 0), 10)))]
@@ -0,0 +1,95 @@
+import pytest
+from lib.database import close_pools, get_connection
+from lib.price_anchors import refresh_all_price_anchors, refresh_price_anchors
+from services.stock_tracker import PlayerStockTracker
+
+
+def execute(sql, params=()):
+    conn = get_connection()
+    try:
+        with conn.cursor() as c:
+            c.execute(sql, params)
+            rows = c.fetchall() if c.description else None
+        conn.commit()
+        return rows
+    finally:
+        conn.close()
+
+
+def add_price_history(market_id, mp_id, tag):
+    """Prices 10 days, 3 days and 2 hours old on top of the IPO, and a summary whose anchors are due."""
+    for price, age in ((12.0, '10 days'), (14.0, '3 days'), (16.0, '2 hours')):
+        execute("""
+            INSERT INTO stock_values (market_id, market_player_id, player_tag, stock_value, model_score, timestamp)
+            VALUES (%s, %s, %s, %s, 5.0, NOW() - %s::interval)
+        """, (market_id, mp_id, tag, price, age))
+    execute("""
+        UPDATE market_player_latest SET current_price = 16.0, last_update = NOW() - INTERVAL '2 hours',
+            next_24h_at = NOW() - INTERVAL '1 second', next_7d_at = NOW() - INTERVAL '1 second'
+        WHERE market_player_id = %s
+    """, (mp_id,))
+
+
+def summary(mp_id):
+    return execute("""
+        SELECT price_24h, price_7d, next_24h_at - NOW() + INTERVAL '2 hours',
+               NOW() - INTERVAL '3 days' + INTERVAL '7 days' - next_7d_at
+        FROM market_player_latest WHERE market_player_id = %s
+    """, (mp_id,))[0]
+
+
+def is_due(mp_id):
+    return execute("SELECT LEAST(next_24h_at, next_7d_at) <= NOW() FROM market_player_latest "
+                   "WHERE market_player_id = %s", (mp_id,))[0][0]
+
+
+def test_due_anchors_are_recomputed_once(make_market):
+    market_id, ids = make_market()
+    add_price_history(market_id, ids['Alice#NA1'], 'Alice#NA1')
+
+    conn = get_connection()
+    try:
+        with conn.cursor() as c:
+            assert refresh_price_anchors(c, market_id) == {market_id}
+            # Nothing is due any more
+            assert refresh_price_anchors(c, market_id) == set()
+        conn.commit()
+    finally:
+        conn.close()
+
+    price_24h, price_7d, next_24h_in, next_7d_error = summary(ids['Alice#NA1'])
+    assert (price_24h, price_7d) == (14.0, 12.0)
+    # The 2-hour-old price crosses the 24h line next, the 3-day-old one the 7d line
+    assert abs(next_24h_in.total_seconds() - 86400) < 60
+    assert abs(next_7d_error.total_seconds()) < 60
+
+
+@pytest.mark.asyncio
+async def test_stocks_endpoint_reads_due_anchors_without_writing(make_market):
+    from api.main import _load_market_stocks
+    market_id, ids = make_market()
+    add_price_history(market_id, ids['Alice#NA1'], 'Alice#NA1')
+    try:
+        stocks = await _load_market_stocks(market_id)
+    finally:
+        await close_pools()
+    assert stocks[0]['current_price'] == 16.0
+    # The stored anchors are stale, but the due ones are looked up for the response
+    assert (stocks[0]['price_change_24h'], stocks[0]['price_change_7d']) == (2.0, 4.0)
+    # Still due: only a writer stores anchors
+    assert is_due(ids['Alice#NA1'])
+
+
+def test_tracker_flush_and_scheduled_job_refresh_anchors(make_market):
+    flushed_market, flushed = make_market()
+    other_market, other = make_market()
+    add_price_history(flushed_market, flushed['Alice#NA1'], 'Alice#NA1')
+    add_price_history(other_market, other['Alice#NA1'], 'Alice#NA1')
+
+    PlayerStockTracker(None).flush_market_updates(flushed_market, [], watermarks={flushed['Alice#NA1']: 1})
+    assert not is_due(flushed['Alice#NA1'])
+    assert summary(flushed['Alice#NA1'])[:2] == (14.0, 12.0)
+    assert is_due(other['Alice#NA1'])
+
+    assert other_market in refresh_all_price_anchors()
+    assert summary(other['Alice#NA1'])[:2] == (14.0, 12.0)
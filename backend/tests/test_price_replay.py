@@ -0,0 +1,134 @@
+import threading
+import time
+import numpy as np
+import pytest
+from lib.database import get_connection, lock_market_prices
+from lib.features import FEATURE_ORDER
+from services.price_replay import replay_market, replay_prices
+from services.stock_tracker import PlayerStockTracker
+
+
+def test_replay_prices_matches_calculate_new_stock():
+    tracker = PlayerStockTracker(None)
+    rng = np.random.default_rng(0)
+    # Three players; low scores drive the walk into the 0.1 floor and back out
+    player_ids = np.repeat([1, 2, 3], [200, 1, 50])
+    scores = np.concatenate([rng.uniform(0, 4, 100), rng.uniform(4, 10, 100), [7.5], rng.uniform(0, 10, 50)])
+    ipo = {1: 10.0, 3: 0.5}
+    config = {'config_multipliers': {'default': 1.2}}
+
+    expected = []
+    for pid in (1, 2, 3):
+        price = ipo.get(pid, 10.0)
+        for score in scores[player_ids == pid]:
+            price = tracker.calculate_new_stock(price, score, config)
+            expected.append(price)
+    np.testing.assert_allclose(replay_prices(player_ids, scores, ipo, multiplier=1.2), expected, rtol=1e-12)
+
+
+def add_scored_games(market_id, market_player_id, tag, count, seed=0):
+    """Stored games with features, like the tracker's flush writes them."""
+    rng = np.random.default_rng(seed)
+    conn = get_connection()
+    try:
+        with conn.cursor() as c:
+            for i in range(count):
+                game_id = f"NA1_{market_player_id}_{i}"
+                c.execute("""
+                    INSERT INTO stock_values (market_id, market_player_id, player_tag, stock_value, model_score,
+                                              game_id, champion_played, timestamp)
+                    VALUES (%s, %s, %s, 10.0, 5.0, %s, 'Ahri', NOW() - INTERVAL '20 days' + %s * INTERVAL '1 hour')
+                """, (market_id, market_player_id, tag, game_id, i))
+                c.execute(f"""
+                    INSERT INTO game_features (market_player_id, game_id, role, champion, {', '.join(FEATURE_ORDER)})
+                    VALUES (%s, %s, 'Mid', 'Ahri', {', '.join(['%s'] * len(FEATURE_ORDER))})
+                """, (market_player_id, game_id, *rng.normal(0, 50, len(FEATURE_ORDER)).tolist()))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def fetch_all(sql, params):
+    conn = get_connection()
+    try:
+        with conn.cursor() as c:
+            c.execute(sql, params)
+            return c.fetchall()
+    finally:
+        conn.close()
+
+
+def test_applied_replay_rewrites_prices_summary_and_candles(make_market):
+    market_id, ids = make_market(('Alice#NA1', 'Bob#NA1'))
+    for seed, (tag, mp_id) in enumerate(ids.items()):
+        add_scored_games(market_id, mp_id, tag, 30, seed)
+
+    replay_market(market_id, apply=True)
+
+    for mp_id in ids.values():
+        rows = fetch_all("""
+            SELECT model_score, stock_value FROM stock_values
+            WHERE market_player_id = %s AND game_id IS NOT NULL ORDER BY timestamp
+        """, (mp_id,))
+        scores = np.array([r[0] for r in rows])
+        prices = np.array([r[1] for r in rows])
+        assert not np.all(scores == 5.0)
+        np.testing.assert_allclose(prices, replay_prices(np.full(len(scores), mp_id), scores, {mp_id: 10.0}))
+        latest = fetch_all("SELECT current_price FROM market_player_latest WHERE market_player_id = %s", (mp_id,))
+        assert latest[0][0] == prices[-1]
+        closes = fetch_all("""
+            SELECT close FROM stock_candles WHERE market_player_id = %s AND resolution = '1d'
+            ORDER BY bucket_start DESC LIMIT 1
+        """, (mp_id,))
+        assert closes[0][0] == prices[-1]
+
+
+def test_prefetch_reads_the_replayed_latest_prices(make_market):
+    market_id, ids = make_market(('Alice#NA1', 'Bob#NA1'))
+    for seed, (tag, mp_id) in enumerate(ids.items()):
+        add_scored_games(market_id, mp_id, tag, 10, seed)
+    replay_market(market_id, apply=True)
+
+    _, latest_prices = PlayerStockTracker(None).prefetch_market_state(market_id, list(ids.values()), set())
+    for mp_id in ids.values():
+        newest = fetch_all("SELECT stock_value FROM stock_values WHERE market_player_id = %s "
+                           "ORDER BY timestamp DESC LIMIT 1", (mp_id,))
+        assert latest_prices[mp_id] == newest[0][0] != 10.0
+
+
+def test_tracker_flush_waits_for_a_replay_and_prices_from_its_result(make_market):
+    market_id, ids = make_market()
+    mp_id = ids['Alice#NA1']
+    tracker = PlayerStockTracker(None)
+    update = {
+        'market_player_id': mp_id, 'player_tag': 'Alice#NA1', 'game_id': 'NA1_99', 'champion_played': 'Ahri',
+        'role': 'Mid', 'features': [1.0] * len(FEATURE_ORDER), 'model_score': 7.0,
+        'priced_from': 10.0, 'stock_value': tracker.calculate_new_stock(10.0, 7.0, None),
+    }
+
+    # A replay in progress: it holds the lock and has rewritten the player's price to 20
+    replay = get_connection()
+    with replay.cursor() as c:
+        lock_market_prices(c, market_id)
+        c.execute("UPDATE stock_values SET stock_value = 20.0 WHERE market_player_id = %s", (mp_id,))
+        c.execute("UPDATE market_player_latest SET current_price = 20.0 WHERE market_player_id = %s", (mp_id,))
+
+    flush = threading.Thread(target=tracker.flush_market_updates, args=(market_id, [update]))
+    flush.start()
+    time.sleep(0.5)
+    assert flush.is_alive()
+    assert fetch_all("SELECT 1 FROM stock_values WHERE game_id = 'NA1_99'", ()) == []
+
+    replay.commit()
+    replay.close()
+    flush.join(timeout=10)
+    assert not flush.is_alive()
+
+    rows = fetch_all("SELECT stock_value FROM stock_values WHERE game_id = 'NA1_99'", ())
+    assert rows == [(pytest.approx(tracker.calculate_new_stock(20.0, 7.0, None)),)]
+    latest = fetch_all("SELECT current_price FROM market_player_latest WHERE market_player_id = %s", (mp_id,))
+    assert latest[0][0] == rows[0][0]
+
+    # A second refresh that scored the same game stores nothing
+    tracker.flush_market_updates(market_id, [update])
+    assert len(fetch_all("SELECT 1 FROM stock_values WHERE game_id = 'NA1_99'", ())) == 1
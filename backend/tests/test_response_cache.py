@@ -0,0 +1,89 @@
+import json
+import pytest
+from starlette.requests import Request
+from lib.response_cache import ResponseCache, response_cache
+
+
+def test_bump_makes_every_response_of_that_market_stale():
+    cache = ResponseCache()
+    cache.put(1, 'stocks', cache.version(1), {'price': 10})
+    cache.put(1, 'history', cache.version(1), {'price': 10})
+    cache.put(2, 'stocks', cache.version(2), {'price': 20})
+    cache.bump(1)
+    assert cache.get(1, 'stocks') is None and cache.get(1, 'history') is None
+    assert cache.get(2, 'stocks') is not None
+
+
+def test_a_result_read_before_a_bump_is_not_stored():
+    cache = ResponseCache()
+    version = cache.version(1)
+    # A writer commits and bumps while the query runs
+    cache.bump(1)
+    cache.put(1, 'stocks', version, {'price': 10})
+    assert cache.get(1, 'stocks') is None
+
+
+def test_entries_expire_after_the_ttl(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr('lib.response_cache.time.monotonic', lambda: clock[0])
+    cache = ResponseCache(ttl=60)
+    cache.put(1, 'stocks', 0, {'price': 10})
+    clock[0] += 59
+    assert cache.get(1, 'stocks') is not None
+    clock[0] += 2
+    assert cache.get(1, 'stocks') is None
+    assert cache.get_stats()['bytes'] == 0
+
+
+def test_matching_etag_gets_an_empty_answer():
+    cache = ResponseCache()
+    etag, body = cache.put(1, 'stocks', 0, {'price': 10})
+    assert cache.get(1, 'stocks', if_none_match=f'"other", {etag}') == (etag, None)
+    assert cache.get(1, 'stocks', if_none_match='"other"') == (etag, body)
+
+
+def test_memory_is_capped_by_body_bytes():
+    cache = ResponseCache(max_bytes=1_000)
+    for i in range(10):
+        cache.put(1, f"candles{i}", 0, {'candles': 'x' * 300})
+    stats = cache.get_stats()
+    assert stats['bytes'] <= 1_000 and stats['entries'] == 3 and stats['evictions'] == 7
+    # Least recently used first: the newest entries stayed
+    assert cache.get(1, 'candles9') is not None and cache.get(1, 'candles0') is None
+
+    # Overwrites are counted once, and a body over the cap is served but not kept
+    cache.put(1, 'candles9', 0, {'candles': 'y' * 300})
+    assert cache.get_stats()['bytes'] == sum(len(entry[3]) for entry in cache._entries.values())
+    etag, body = cache.put(1, 'huge', 0, {'candles': 'z' * 2_000})
+    assert json.loads(body) == {'candles': 'z' * 2_000} and cache.get(1, 'huge') is None
+
+
+# --- Endpoints ---
+def get_request(path, etag=None):
+    headers = [(b'if-none-match', etag.encode())] if etag else []
+    return Request({'type': 'http', 'method': 'GET', 'scheme': 'http', 'server': ('test', 80), 'path': path,
+                    'query_string': b'', 'headers': headers})
+
+
+@pytest.mark.asyncio
+async def test_stocks_endpoint_revalidates_and_sees_writes(make_market):
+    from api.main import get_market_stocks, remove_player_from_market
+    from lib.database import close_pools
+    market_id, ids = make_market()
+    path = f"/api/markets/{market_id}/stocks"
+    try:
+        first = await get_market_stocks(market_id, get_request(path))
+        etag = first.headers['etag']
+        assert first.status_code == 200 and json.loads(first.body)[0]['champions'] == ['Ahri']
+
+        not_modified = await get_market_stocks(market_id, get_request(path, etag))
+        assert not_modified.status_code == 304 and not_modified.body == b''
+
+        # A write through the API bumps the market, so the old ETag no longer matches
+        await remove_player_from_market(ids['Alice#NA1'])
+        after = await get_market_stocks(market_id, get_request(path, etag))
+        assert after.status_code == 200 and after.headers['etag'] != etag
+        assert json.loads(after.body) == []
+    finally:
+        await close_pools()
+        response_cache.bump(market_id)
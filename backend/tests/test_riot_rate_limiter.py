@@ -0,0 +1,141 @@
+import asyncio
+import math
+import time
+import aiohttp
+import pytest
+import pytest_asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+import lib.riot_api as riot_api
+from lib.riot_api import RiotRateLimiter, fetch_json, parse_rate_limits
+
+APP_LIMITS = '10:1,25:3'
+METHOD_LIMITS = {'match': '6:1', 'timeline': '4:1'}
+
+
+class FakeRiot:
+    """
+    Enforces Riot-style limits: every window starts with the first request it sees
+    and resets `seconds` later. Answers with the X-*-Rate-Limit(-Count) headers and,
+    over a limit, a 429 with Retry-After.
+    """
+
+    def __init__(self, app_limits=APP_LIMITS, method_limits=METHOD_LIMITS):
+        self.app_limits = app_limits
+        self.method_limits = method_limits
+        self.windows = {}  # (scope, seconds) -> [started_at, count]
+        self.served = 0
+        self.rejected = 0
+        self.block_next = None  # Retry-After seconds to answer the next request with
+
+    def _count(self, scope, limits, now):
+        """Counts a request in every window of scope; returns (counts header, seconds until a full window resets)."""
+        counts, retry_after = [], 0.0
+        for limit, seconds in parse_rate_limits(limits):
+            window = self.windows.get((scope, seconds))
+            if window is None or now >= window[0] + seconds:
+                window = self.windows[(scope, seconds)] = [now, 0]
+            window[1] += 1
+            counts.append(f"{window[1]}:{seconds:g}")
+            if window[1] > limit:
+                retry_after = max(retry_after, window[0] + seconds - now)
+        return ','.join(counts), retry_after
+
+    async def handle(self, request):
+        method = 'timeline' if request.path.endswith('/timeline') else 'match'
+        now = time.monotonic()
+        app_counts, app_wait = self._count('app', self.app_limits, now)
+        method_counts, method_wait = self._count(method, self.method_limits[method], now)
+        headers = {
+            'X-App-Rate-Limit': self.app_limits, 'X-App-Rate-Limit-Count': app_counts,
+            'X-Method-Rate-Limit': self.method_limits[method], 'X-Method-Rate-Limit-Count': method_counts,
+        }
+        if self.block_next is not None:
+            app_wait, self.block_next = self.block_next, None
+        if app_wait or method_wait:
+            self.rejected += 1
+            headers['Retry-After'] = str(math.ceil(max(app_wait, method_wait)))
+            return web.json_response({'status': {'status_code': 429}}, status=429, headers=headers)
+        self.served += 1
+        return web.json_response({'metadata': {'matchId': request.match_info['match_id']}}, headers=headers)
+
+
+@pytest_asyncio.fixture
+async def fake_riot():
+    riot = FakeRiot()
+    app = web.Application()
+    app.router.add_get('/lol/match/v5/matches/{match_id}', riot.handle)
+    app.router.add_get('/lol/match/v5/matches/{match_id}/timeline', riot.handle)
+    server = TestServer(app)
+    await server.start_server()
+    riot.url = lambda path: str(server.make_url(path))
+    yield riot
+    await server.close()
+
+
+def use_limiter(monkeypatch, limiter):
+    monkeypatch.setattr(riot_api, 'riot_limiter', limiter)
+    return limiter
+
+
+async def fetch_many(riot, count):
+    """Fires `count` match and timeline requests at once, like a market refresh's gather."""
+    async with aiohttp.ClientSession() as session:
+        urls = [riot.url(f"/lol/match/v5/matches/NA1_{i // 2}" + ('/timeline' if i % 2 else ''))
+                for i in range(count)]
+        return await asyncio.gather(*(fetch_json(session, url, headers={}) for url in urls))
+
+
+@pytest.mark.asyncio
+async def test_sustained_burst_gets_no_429s(fake_riot, monkeypatch):
+    # A cold limiter: the method limits are only learnt from the first responses
+    limiter = use_limiter(monkeypatch, RiotRateLimiter(APP_LIMITS))
+
+    started = time.monotonic()
+    results = await fetch_many(fake_riot, 40)
+    elapsed = time.monotonic() - started
+
+    assert len(results) == 40
+    assert fake_riot.rejected == 0
+    assert limiter.stats['rate_limited_429'] == 0
+    # The 20 timelines at 4 per second bound the burst at just over 4s; the limiter should not be much slower
+    assert 4.0 <= elapsed < 6.0
+    assert limiter.stats['throttled'] > 0
+
+
+@pytest.mark.asyncio
+async def test_windows_are_tuned_from_the_headers(fake_riot, monkeypatch):
+    # Start from the development-key defaults, which are looser than the fake server's
+    limiter = use_limiter(monkeypatch, RiotRateLimiter('20:1,100:120'))
+    await fetch_many(fake_riot, 30)
+
+    assert [(w.limit, w.seconds) for w in limiter._app_windows] == [(10, 1.0), (25, 3.0)]
+    assert [(w.limit, w.seconds) for w in limiter._method_windows['match-v5.match']] == [(6, 1.0)]
+    assert [(w.limit, w.seconds) for w in limiter._method_windows['match-v5.timeline']] == [(4, 1.0)]
+    assert fake_riot.rejected == 0
+
+
+@pytest.mark.asyncio
+async def test_count_headers_account_for_requests_made_elsewhere(fake_riot, monkeypatch):
+    limiter = use_limiter(monkeypatch, RiotRateLimiter(APP_LIMITS))
+    # Another process already spent most of this second's application budget
+    fake_riot.windows[('app', 1.0)] = [time.monotonic(), 8]
+    await fetch_many(fake_riot, 1)
+
+    assert len(limiter._app_windows[0].sent) == 9
+    await fetch_many(fake_riot, 12)
+    assert fake_riot.rejected == 0
+
+
+@pytest.mark.asyncio
+async def test_retry_after_is_honoured(fake_riot, monkeypatch):
+    limiter = use_limiter(monkeypatch, RiotRateLimiter(APP_LIMITS))
+    fake_riot.block_next = 1
+
+    started = time.monotonic()
+    results = await fetch_many(fake_riot, 3)
+
+    assert len(results) == 3
+    assert fake_riot.rejected == 1
+    assert limiter.stats['rate_limited_429'] == 1
+    assert time.monotonic() - started >= 1.0
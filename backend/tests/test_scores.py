@@ -0,0 +1,81 @@
+import json
+import pytest
+from starlette.requests import Request
+from lib.database import async_db_connection, close_pools, get_connection
+from lib.market_queries import fetch_market_scores, fetch_player_scores
+
+# fetch_player_scores before the LEAD rewrite: a correlated subquery per returned row
+BASELINE_SCORES_SQL = """
+    SELECT sv1.model_score, sv1.timestamp, sv1.game_id, sv1.stock_value, sv1.champion_played,
+           (SELECT sv2.stock_value FROM stock_values sv2
+            WHERE sv2.market_id = sv1.market_id AND sv2.player_tag = sv1.player_tag
+            AND sv2.timestamp < sv1.timestamp
+            ORDER BY sv2.timestamp DESC LIMIT 1) as previous_stock_value
+    FROM stock_values sv1
+    WHERE sv1.market_id = %s AND sv1.player_tag = %s AND sv1.model_score IS NOT NULL
+    ORDER BY sv1.timestamp DESC
+    LIMIT %s
+"""
+PLAYERS = ('Alice#NA1', 'Bob#EUW')
+
+
+@pytest.fixture
+def scored_market(make_market):
+    """Two players with interleaved scored games and an unscored price between them, on top of their IPOs."""
+    market_id, ids = make_market(PLAYERS)
+    conn = get_connection()
+    try:
+        with conn.cursor() as c:
+            for i in range(12):
+                tag = PLAYERS[i % 2]
+                # Every 5th price carries no score (a manual price), so LEAD must still see it
+                score = None if i % 5 == 4 else 3.0 + i / 2
+                c.execute("""
+                    INSERT INTO stock_values (market_id, market_player_id, player_tag, stock_value, model_score,
+                                              game_id, champion_played, timestamp)
+                    VALUES (%s, %s, %s, %s, %s, %s, 'Ahri', NOW() - INTERVAL '1 day' + %s * INTERVAL '1 hour')
+                """, (market_id, ids[tag], tag, 10.0 + i * 0.7, score, f"NA1_{i}", i))
+        conn.commit()
+    finally:
+        conn.close()
+    return market_id
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('limit', [1, 3, 50])
+async def test_lead_rewrite_matches_the_correlated_subquery(scored_market, limit):
+    try:
+        async with async_db_connection() as conn:
+            for tag in PLAYERS:
+                cur = await conn.execute(BASELINE_SCORES_SQL, (scored_market, tag, limit))
+                baseline = await cur.fetchall()
+                assert baseline and await fetch_player_scores(conn, scored_market, tag, limit) == baseline
+                # Every game but the IPO price has a previous price to compare with
+                assert all(row['previous_stock_value'] is not None for row in baseline[:-1])
+    finally:
+        await close_pools()
+
+
+def get_request(path, query=b''):
+    return Request({'type': 'http', 'method': 'GET', 'scheme': 'http', 'server': ('test', 80), 'path': path,
+                    'query_string': query, 'headers': []})
+
+
+@pytest.mark.asyncio
+async def test_batched_scores_endpoint_matches_the_per_player_endpoint(scored_market):
+    from api.main import get_market_scores, get_player_scores
+    try:
+        async with async_db_connection() as conn:
+            assert await fetch_market_scores(conn, scored_market, 3) == {
+                tag: await fetch_player_scores(conn, scored_market, tag, 3) for tag in PLAYERS}
+
+        # StockGraph reads the batched response as {player_tag: [score, ...]}
+        batched = await get_market_scores(scored_market, get_request(f"/api/markets/{scored_market}/scores"), limit=5)
+        by_tag = json.loads(batched.body)
+        assert sorted(by_tag) == sorted(PLAYERS)
+        for tag in PLAYERS:
+            single = await get_player_scores(scored_market, tag, get_request(
+                f"/api/markets/{scored_market}/stocks/{tag}/scores"), limit=5)
+            assert by_tag[tag] == json.loads(single.body)
+    finally:
+        await close_pools()
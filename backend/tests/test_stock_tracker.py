@@ -0,0 +1,245 @@
+import copy
+import json
+import os
+import aiohttp
+import numpy as np
+import pytest
+import pytest_asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+import lib.riot_api as riot_api
+import services.stock_tracker as stock_tracker
+from lib.database import close_pools, get_connection
+from lib.match_cache import MatchCache
+from lib.riot_api import RiotRateLimiter, cached_puuid, forget_puuid, remember_puuid, resolve_puuid
+from services.stock_tracker import MATCH_IDS_PAGE_SIZE, PlayerStockTracker
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+PUUID = 'fixture-puuid-3'  # plays Ahri mid in the fixture match
+GAME_START = 1_700_000_000
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES, name)) as f:
+        return json.load(f)
+
+
+class FakeRiot:
+    """
+    Account-v1 and match-v5 for the fixture player, who has played `games` games an hour apart
+    (NA1_0 is the oldest). Records every request as (kind, id, query params).
+    """
+
+    def __init__(self, games=3):
+        self.match = load_fixture('match_NA1_4900000001.json')
+        self.timeline = load_fixture('timeline_NA1_4900000001.json')
+        self.games = [f"NA1_{i}" for i in range(games)]
+        self.overrides = {}  # match_id -> {participant field or 'queueId': value}
+        self.rejected_puuids = set()
+        self.requests = []
+
+    def end_time(self, match_id):
+        return GAME_START + int(match_id.split('_')[1]) * 3600
+
+    def requested(self, kind):
+        return [(key, params) for k, key, params in self.requests if k == kind]
+
+    async def account(self, request):
+        self.requests.append(('account', request.match_info['name'], dict(request.query)))
+        return web.json_response({'puuid': PUUID})
+
+    async def match_ids(self, request):
+        puuid, query = request.match_info['puuid'], request.query
+        self.requests.append(('ids', puuid, dict(query)))
+        if puuid in self.rejected_puuids:
+            return web.json_response({'status': {'status_code': 400}}, status=400)
+        start_time = int(query.get('startTime', 0))
+        newest_first = [m for m in reversed(self.games) if self.end_time(m) >= start_time]
+        start, count = int(query.get('start', 0)), int(query.get('count', 20))
+        return web.json_response(newest_first[start:start + count])
+
+    async def details(self, request):
+        match_id = request.match_info['match_id']
+        self.requests.append(('match', match_id, {}))
+        match = copy.deepcopy(self.match)
+        match['metadata']['matchId'] = match_id
+        match['info']['gameEndTimestamp'] = self.end_time(match_id) * 1000
+        participant = next(p for p in match['info']['participants'] if p['puuid'] == PUUID)
+        for field, value in self.overrides.get(match_id, {}).items():
+            (match['info'] if field == 'queueId' else participant)[field] = value
+        return web.json_response(match)
+
+    async def timelines(self, request):
+        self.requests.append(('timeline', request.match_info['match_id'], {}))
+        return web.json_response(self.timeline)
+
+
+@pytest_asyncio.fixture
+async def riot(monkeypatch, tmp_path):
+    """A FakeRiot behind lib.riot_api, with a fresh limiter, match cache and PUUID cache."""
+    fake = FakeRiot()
+    app = web.Application()
+    app.router.add_get('/riot/account/v1/accounts/by-riot-id/{name}/{tag}', fake.account)
+    app.router.add_get('/lol/match/v5/matches/by-puuid/{puuid}/ids', fake.match_ids)
+    app.router.add_get('/lol/match/v5/matches/{match_id}', fake.details)
+    app.router.add_get('/lol/match/v5/matches/{match_id}/timeline', fake.timelines)
+    server = TestServer(app)
+    await server.start_server()
+    fake.base_url = str(server.make_url('')).rstrip('/')
+    monkeypatch.setattr(riot_api, 'RIOT_BASE_URL', fake.base_url)
+    monkeypatch.setattr(riot_api, 'riot_limiter', RiotRateLimiter('1000:1'))
+    monkeypatch.setattr(riot_api, 'match_cache', MatchCache(tmp_path / 'matches'))
+    monkeypatch.setattr(riot_api, '_puuid_cache', {})
+    yield fake
+    await server.close()
+
+
+class ConstantModel:
+    """Gives every game the same score, so the new price is known in advance."""
+
+    def __init__(self, score):
+        self.score = score
+
+    def predict(self, frame):
+        return np.full(len(frame), self.score)
+
+
+def make_tracker(riot, monkeypatch=None, score=7.0):
+    tracker = PlayerStockTracker('test-key')
+    tracker.base_url = riot.base_url
+    models = {role: ConstantModel(score) for role in tracker.role_name_mapping.values()}
+    tracker.models = models
+    if monkeypatch:
+        monkeypatch.setattr(stock_tracker.model_registry, 'current', lambda: {
+            'version': 'test', 'models': models, 'shadow_version': None, 'shadow_models': None})
+    return tracker
+
+
+def player_row(market_player_id):
+    conn = get_connection()
+    try:
+        with conn.cursor() as c:
+            c.execute("SELECT puuid, match_watermark FROM market_players WHERE id = %s", (market_player_id,))
+            puuid, watermark = c.fetchone()
+            c.execute("SELECT game_id, stock_value FROM stock_values WHERE market_player_id = %s AND game_id IS NOT NULL "
+                      "ORDER BY timestamp", (market_player_id,))
+            return puuid, watermark, c.fetchall()
+    finally:
+        conn.close()
+
+
+# --- Match ids ---
+@pytest.mark.asyncio
+async def test_match_ids_since_the_watermark_are_paged(riot):
+    riot.games = [f"NA1_{i}" for i in range(253)]
+    tracker = make_tracker(riot)
+    watermark = riot.end_time('NA1_3')
+    async with aiohttp.ClientSession() as session:
+        match_ids = await tracker.get_match_ids(session, PUUID, start_time=watermark)
+        recent = await tracker.get_match_ids(session, PUUID)
+
+    assert match_ids == [f"NA1_{i}" for i in range(252, 2, -1)]
+    pages = riot.requested('ids')
+    assert [params for _, params in pages[:3]] == [
+        {'startTime': str(watermark), 'start': str(start), 'count': str(MATCH_IDS_PAGE_SIZE)} for start in (0, 100, 200)]
+    # Without a watermark only the few most recent games are asked for
+    assert pages[3][1] == {'count': '5'} and recent == ['NA1_252', 'NA1_251', 'NA1_250', 'NA1_249', 'NA1_248']
+
+
+# --- Fetch and extract ---
+@pytest.mark.asyncio
+async def test_only_the_scored_game_has_its_timeline_downloaded(riot):
+    riot.games = [f"NA1_{i}" for i in range(4)]
+    riot.overrides = {'NA1_3': {'queueId': 450}, 'NA1_2': {'championName': 'Zed'}}
+    tracker = make_tracker(riot)
+    refresh = {'processed_games': set(), 'latest_prices': {}, 'watermarks': {},
+               'stats': {'timelines_fetched': 0, 'timelines_avoided': 0}}
+    async with aiohttp.ClientSession() as session:
+        game = await tracker.extract_player_game(session, 1, 'Alice#NA1', {'id': 7, 'champions': ['Ahri']}, PUUID,
+                                                 ['NA1_3', 'NA1_2', 'NA1_1', 'NA1_0'], refresh)
+
+    assert game['game_id'] == 'NA1_1' and game['role'] == 'Mid'
+    # The ARAM and the off-pool game are rejected on their details; the older game is never looked at
+    assert [key for key, _ in riot.requested('match')] == ['NA1_3', 'NA1_2', 'NA1_1']
+    assert [key for key, _ in riot.requested('timeline')] == ['NA1_1']
+    assert refresh['stats'] == {'timelines_fetched': 1, 'timelines_avoided': 2}
+    assert refresh['watermarks'] == {7: riot.end_time('NA1_3')}
+
+
+# --- Watermarks and PUUIDs across a refresh ---
+@pytest.mark.asyncio
+async def test_watermark_only_advances_with_a_successful_flush(riot, make_market, monkeypatch):
+    market_id, ids = make_market()
+    tracker = make_tracker(riot, monkeypatch)
+    execute_values = stock_tracker.execute_values
+
+    def failing_execute_values(cursor, sql, *args, **kwargs):
+        # The last statements of the flush, after the watermark and PUUID updates
+        if 'INSERT INTO processed_games' in sql:
+            raise RuntimeError("flush failed")
+        return execute_values(cursor, sql, *args, **kwargs)
+
+    try:
+        monkeypatch.setattr(stock_tracker, 'execute_values', failing_execute_values)
+        with pytest.raises(RuntimeError):
+            await tracker.update_market_stocks(market_id)
+        assert player_row(ids['Alice#NA1']) == (None, None, [])
+
+        monkeypatch.setattr(stock_tracker, 'execute_values', execute_values)
+        await tracker.update_market_stocks(market_id)
+        puuid, watermark, games = player_row(ids['Alice#NA1'])
+        assert puuid == PUUID and watermark == riot.end_time('NA1_2')
+        assert games == [('NA1_2', pytest.approx(11.6))]
+
+        # The next refresh only asks for games since the watermark, and a new one gets scored
+        riot.games.append('NA1_3')
+        await tracker.update_market_stocks(market_id)
+        assert riot.requested('ids')[-1][1]['startTime'] == str(riot.end_time('NA1_2'))
+        assert player_row(ids['Alice#NA1'])[1:] == (riot.end_time('NA1_3'), [
+            ('NA1_2', pytest.approx(11.6)), ('NA1_3', pytest.approx(13.2))])
+    finally:
+        await close_pools()
+
+
+@pytest.mark.asyncio
+async def test_a_rejected_stored_puuid_is_resolved_again(riot, make_market, monkeypatch):
+    market_id, ids = make_market()
+    conn = get_connection()
+    try:
+        with conn.cursor() as c:
+            c.execute("UPDATE market_players SET puuid = 'stale-puuid' WHERE id = %s", (ids['Alice#NA1'],))
+        conn.commit()
+    finally:
+        conn.close()
+    remember_puuid('Alice#NA1', 'stale-puuid')
+    riot.rejected_puuids = {'stale-puuid'}
+    tracker = make_tracker(riot, monkeypatch)
+    try:
+        await tracker.update_market_stocks(market_id)
+    finally:
+        await close_pools()
+
+    # The cached resolution was dropped too, otherwise account-v1 would not have been asked
+    assert len(riot.requested('account')) == 1 and cached_puuid('alice#na1') == PUUID
+    assert [puuid for puuid, _ in riot.requested('ids')] == ['stale-puuid', PUUID]
+    puuid, watermark, games = player_row(ids['Alice#NA1'])
+    assert puuid == PUUID and [game_id for game_id, _ in games] == ['NA1_2']
+
+
+@pytest.mark.asyncio
+async def test_puuid_resolutions_are_cached_until_their_ttl(riot, monkeypatch):
+    async with aiohttp.ClientSession() as session:
+        assert await resolve_puuid(session, 'Alice#NA1', {}) == PUUID
+        # Riot IDs are case-insensitive
+        assert await resolve_puuid(session, 'alice#na1', {}) == PUUID
+        assert len(riot.requested('account')) == 1
+
+        forget_puuid('ALICE#NA1')
+        await resolve_puuid(session, 'Alice#NA1', {})
+        assert len(riot.requested('account')) == 2
+
+        monkeypatch.setattr(riot_api, 'PUUID_CACHE_TTL', -1)
+        forget_puuid('Alice#NA1')
+        await resolve_puuid(session, 'Alice#NA1', {})
+        await resolve_puuid(session, 'Alice#NA1', {})
+        assert len(riot.requested('account')) == 4
@@ -0,0 +1,99 @@
+import pickle
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import GradientBoostingRegressor
+from lib.features import FEATURE_ORDER
+from services import train_models
+from services.training_data import ROLE_NAMES, build_dataset
+
+
+def feature_frame(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(rng.normal(0, 10, size=(rows, len(FEATURE_ORDER))), columns=FEATURE_ORDER)
+
+
+def test_target_centres_the_median_game_on_5_and_ignores_damage_taken():
+    X = feature_frame(501)
+    y = train_models.build_target(X)
+    assert np.median(y) == pytest.approx(train_models.TARGET_CENTER)
+    X['damage_taken_per_min'] = X['damage_taken_per_min'] * 100 + 7
+    np.testing.assert_allclose(train_models.build_target(X), y)
+
+
+def test_cross_validation_fits_the_target_on_training_rows_only(monkeypatch):
+    fitted = []
+
+    class RecordingModel(GradientBoostingRegressor):
+        def fit(self, X, y):
+            fitted.append(np.array(y))
+            return super().fit(X, y)
+
+    monkeypatch.setattr(train_models, 'GradientBoostingRegressor', RecordingModel)
+    X = feature_frame(100)
+    train, test = np.arange(80), np.arange(80, 100)
+    params = {'n_estimators': 5}
+    train_models.score_fold(params, X, train, test)
+    # Wild held-out rows change nothing the model is trained on
+    X.iloc[test] = 1e6
+    train_models.score_fold(params, X, train, test)
+    assert np.array_equal(fitted[0], fitted[1])
+    assert np.array_equal(fitted[0], train_models.build_target(X.iloc[train]))
+
+
+@pytest.fixture
+def training_setup(tmp_path, monkeypatch):
+    """A small consolidated dataset and a production model directory, both in tmp_path."""
+    rows = []
+    for role_id in ROLE_NAMES:
+        frame = feature_frame(60, seed=role_id).assign(
+            role=role_id, match_id=[f"NA1_{role_id}_{i}" for i in range(60)], champion='Ahri', game_length_mins=30.0)
+        frame['win_loss'] = np.arange(60) % 2
+        rows.append(frame)
+    csv_dir = tmp_path / 'csv'
+    csv_dir.mkdir()
+    pd.concat(rows).to_csv(csv_dir / 'lol_ai_batch_1.csv', index=False)
+    build_dataset(csv_dir, tmp_path / 'dataset')
+
+    model_dir = tmp_path / 'production'
+    model_dir.mkdir()
+    monkeypatch.setattr(train_models, 'MODEL_DIR', str(model_dir))
+    monkeypatch.setattr(train_models, 'TRAINING_RUNS_DIR', str(tmp_path / 'runs'))
+    compiled = []
+    monkeypatch.setattr('lib.model_compiler.compile_models',
+                        lambda out_dir, version, shadow_only=None: compiled.append((version, shadow_only)))
+    return tmp_path / 'dataset', model_dir, compiled
+
+
+def save_production_models(model_dir, target):
+    for role_id, role in ROLE_NAMES.items():
+        X = feature_frame(60, seed=role_id)
+        X['win_loss'] = np.arange(60) % 2
+        model = GradientBoostingRegressor(n_estimators=200, max_depth=3, random_state=0).fit(X, target(X))
+        with open(model_dir / f'{role.lower()}_model.pkl', 'wb') as f:
+            pickle.dump(model, f)
+
+
+def test_compiles_when_production_learned_the_same_target(training_setup):
+    dataset, model_dir, compiled = training_setup
+    save_production_models(model_dir, train_models.build_target)
+    report = train_models.train_all('run', dataset, workers=1, compile_version='v1')
+    assert all(train_models.agrees_with_production(m['production_agreement']) for m in report['roles'].values())
+    # A candidate for shadow scoring only; the registry refuses to serve it
+    assert compiled == [('v1', train_models.SHADOW_ONLY_REASON)]
+
+
+def test_refuses_to_compile_when_production_disagrees(training_setup):
+    dataset, model_dir, compiled = training_setup
+    save_production_models(model_dir, lambda X: 10 - train_models.build_target(X))
+    report = train_models.train_all('run', dataset, workers=1, compile_version='v1')
+    assert not any(train_models.agrees_with_production(m['production_agreement']) for m in report['roles'].values())
+    assert compiled == []
+
+
+def test_refuses_to_compile_without_production_models_to_check_against(training_setup, monkeypatch):
+    dataset, model_dir, compiled = training_setup
+    monkeypatch.setattr(train_models, 'DEFAULT_PARAMS', {'n_estimators': 5})
+    report = train_models.train_all('run', dataset, workers=1, compile_version='v1')
+    assert all(m['production_agreement'] is None for m in report['roles'].values())
+    assert compiled == []
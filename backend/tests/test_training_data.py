@@ -0,0 +1,65 @@
+import json
+import os
+import pandas as pd
+import pyarrow as pa
+import pytest
+from lib.features import FEATURE_ORDER
+from services.training_data import SCHEMA, SCHEMA_VERSION, build_dataset, load_training_data, load_training_table
+
+
+def batch_rows(match_id, roles=(1, 2, 3, 4, 5), kda=2.0):
+    """Data farmer rows (the per-minute export) for one match, one participant per role."""
+    return [dict({name: 1.5 for name in FEATURE_ORDER}, match_id=match_id, summoner_name='', role=role,
+                 champion=f"Champ{role}", game_length_mins=30.0, kda=kda + role, win_loss=role % 2)
+            for role in roles]
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    """Two overlapping batches and an early totals-only export, consolidated into tmp_path/dataset."""
+    csv_dir = tmp_path / 'csv'
+    csv_dir.mkdir()
+    pd.DataFrame(batch_rows('NA1_1') + batch_rows('NA1_2')).to_csv(csv_dir / 'lol_ai_batch_1.csv', index=False)
+    # The second batch saw two of the first batch's participants again, and one row has no known role
+    pd.DataFrame(batch_rows('NA1_2', roles=(1, 3)) + batch_rows('NA1_3') + batch_rows('NA1_4', roles=(9,))).to_csv(
+        csv_dir / 'lol_ai_batch_2.csv', index=False)
+    legacy = {'kda': 4, 'dmg_to_champions': 16807, 'gold_diff_15': -122, 'exp_diff_15': 1124, 'kill_participation': 34.8,
+              'objective_damage': 2803, 'vision_score': 11, 'gold_diff_end': 729, 'exp_diff_end': 2365, 'role': 2,
+              'win_loss': 1}
+    # Without a match id, identical legacy rows cannot be told apart from two different games
+    pd.DataFrame([legacy, legacy]).to_csv(csv_dir / 'lol_data.csv', index=False)
+    return build_dataset(str(csv_dir), str(tmp_path / 'dataset'))
+
+
+def test_build_drops_repeated_participants_and_unknown_roles(dataset):
+    with open(os.path.join(dataset, 'manifest.json')) as f:
+        manifest = json.load(f)
+    assert manifest['schema_version'] == SCHEMA_VERSION
+    assert [source['rows'] for source in manifest['sources']] == [10, 8, 2]
+    assert manifest['duplicates_dropped'] == 2 and manifest['unknown_role_rows_dropped'] == 1
+    assert manifest['roles'] == {'Top': 3, 'Jungle': 5, 'Mid': 3, 'ADC': 3, 'Support': 3}
+
+
+def test_each_role_is_its_own_typed_file(dataset, tmp_path):
+    tables = load_training_table(dataset_dir=str(tmp_path / 'dataset'))
+    assert list(tables) == ['Top', 'Jungle', 'Mid', 'ADC', 'Support']
+    for role, table in tables.items():
+        assert table.schema.equals(SCHEMA)
+        assert set(table.column('champion').to_pylist()) <= {f"Champ{i}" for i in range(1, 6)} | {None}
+    assert tables['Top'].schema.field('kda').type == pa.float32()
+    assert tables['Top'].schema.field('win_loss').type == pa.int8()
+    assert sorted(tables['Top'].column('match_id').to_pylist()) == ['NA1_1', 'NA1_2', 'NA1_3']
+
+
+def test_loaders_only_materialise_the_requested_columns(dataset, tmp_path):
+    dataset_dir = str(tmp_path / 'dataset')
+    table = load_training_table(['Mid'], columns=['kda', 'win_loss'], dataset_dir=dataset_dir)['Mid']
+    assert table.column_names == ['kda', 'win_loss'] and table.num_rows == 3
+
+    frame = load_training_data(['Jungle'], columns=['source', 'kda', 'dmg_to_champions_per_min'], dataset_dir=dataset_dir)
+    assert list(frame.columns) == ['source', 'kda', 'dmg_to_champions_per_min', 'role']
+    # The legacy rows keep their totals-era values and have no per-minute features
+    legacy = frame[frame['source'] == 'lol_data.csv']
+    assert len(legacy) == 2 and legacy['kda'].tolist() == [4.0, 4.0]
+    assert legacy['dmg_to_champions_per_min'].isna().all()
+    assert (frame['role'] == 'Jungle').all()
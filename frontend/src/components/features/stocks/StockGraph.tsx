@@ -19,7 +19,8 @@ interface PlayerData {
   champions: string[];
 }
 
-interface StockDataPoint { stock_value: number; timestamp: string; champion_played?: string; }
+interface StockDataPoint { stock_value: number; timestamp: string; open?: number; champion_played?: string; }
+interface Candle { bucket_start: string; open: number; high: number; low: number; close: number; samples: number; }
 interface ModelScore { model_score: number; timestamp: string; stock_value: number; previous_stock_value: number | null; price_change: number; formatted_time: string; champion_played?: string; }
 
 // Global singleton variables to prevent re-initialization during navigation
@@ -68,8 +69,10 @@ const StockGraph = ({ playerTag }: StockGraphProps) => {
         const encodedPlayerTag = encodeURIComponent(playerTag); // Ensure tag is URL-safe
 
         // --- UPDATED API ENDPOINTS FOR PLAYER-BASED STOCKS ---
-        const historyUrl = `${API_URL}/api/markets/${currentMarket.id}/stocks/${encodedPlayerTag}/history?period=${period}`;
-        const scoresUrl = `${API_URL}/api/markets/${currentMarket.id}/stocks/${encodedPlayerTag}/scores`;
+        // Downsampled OHLC buckets: the payload stays the same size however long the history is
+        const historyUrl = `${API_URL}/api/markets/${currentMarket.id}/stocks/${encodedPlayerTag}/candles?period=${period}`;
+        // Every player's recent scores in one cached response, shared by all the market's player pages
+        const scoresUrl = `${API_URL}/api/markets/${currentMarket.id}/scores`;
         const stocksUrl = `${API_URL}/api/markets/${currentMarket.id}/stocks`; // To get champions data
         
         console.log("Fetching history from:", historyUrl); // Debug log
@@ -86,8 +89,14 @@ const StockGraph = ({ playerTag }: StockGraphProps) => {
         if (!scoresResponse.ok) throw new Error(`Failed to fetch recent scores (${scoresResponse.status})`);
         if (!stocksResponse.ok) throw new Error(`Failed to fetch stocks data (${stocksResponse.status})`);
 
-        const historyData = await historyResponse.json();
-        const scoresData = await scoresResponse.json();
+        const candleData = await historyResponse.json();
+        const historyData: StockDataPoint[] = (candleData?.candles || []).map((c: Candle) => ({
+          stock_value: c.close,
+          timestamp: c.bucket_start,
+          open: c.open,
+        }));
+        const marketScores: Record<string, ModelScore[]> = await scoresResponse.json();
+        const scoresData = marketScores?.[playerTag];
         const stocksData = await stocksResponse.json();
 
         // Find the current player's data from the stocks response
@@ -134,7 +143,7 @@ const StockGraph = ({ playerTag }: StockGraphProps) => {
   }
 
   const currentPrice = history.length > 0 ? history[history.length - 1].stock_value : 0;
-  const startPrice = history.length > 0 ? history[0].stock_value : 0;
+  const startPrice = history.length > 0 ? (history[0].open ?? history[0].stock_value) : 0;
   const priceChange = currentPrice - startPrice;
   const priceChangePercent = startPrice && startPrice > 0 ? (priceChange / startPrice) * 100 : 0;
 